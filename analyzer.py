@@ -1,7 +1,119 @@
 import re
-import pandas as pd
-from datetime import datetime
-import streamlit as st
+import os
+import functools
+import itertools
+from collections import deque
+from date_normalizer import DateNormalizer, DATE_PATTERN, TEXT_DATE_PATTERN
+from keyword_automaton import KeywordAutomaton
+from invoice_store import amount_bucket, high_value_threshold, sketch_quantiles
+import perf
+
+# Batches smaller than this are analyzed in-process; below it the cost of
+# starting worker processes outweighs the parallel speedup
+SERIAL_BATCH_THRESHOLD = 200
+DEFAULT_BATCH_CHUNKSIZE = 64
+
+# Line-level patterns shared by every analyzer instance
+_LEADING_DIGIT_RE = re.compile(r'^\d')
+_LINE_AMOUNT_RE = re.compile(r'\$?([0-9,]+\.?\d{0,2})')
+_DOLLAR_AMOUNT_RE = re.compile(r'\$([0-9,]+\.?\d{0,2})')
+_WHITESPACE_RE = re.compile(r'\s+')
+_QUANTITY_RE = re.compile(r'(\d+)\s*x\s*')
+_NUMBER_RE = re.compile(r'\d+')
+_REQUIRED_LITERAL_RE = re.compile(r'[a-z#]+')
+# Characters after the leading keyword that make (part of) it optional
+_OPTIONAL_FOLLOWERS = {'?', '*', '{', '|', ')'}
+
+# Field patterns are searched against the lowercased text unless listed here
+_FIELD_SEARCH_FLAGS = {
+    'invoice_number': re.IGNORECASE,
+    'total_amount': re.IGNORECASE,
+    'date': re.IGNORECASE,
+    'tax': re.IGNORECASE,
+    'vendor': re.IGNORECASE | re.MULTILINE,
+}
+_FIELDS_ON_ORIGINAL_TEXT = ('date', 'vendor')
+
+# Substring tests from the extractors, folded into single scans
+_VENDOR_WORD_RE = re.compile('inc|llc|corp|ltd|company|co')
+_LINE_ITEM_HEADER_RE = re.compile('invoice|bill to|ship to|date|total')
+_CONFIDENCE_ELEMENTS = ['invoice', 'total', 'date', 'amount']
+# Year and month of a date the analyzer could parse (YYYY-MM-DD)
+_MONTH_RE = re.compile(r'\d{4}-\d{2}(?=-)')
+
+
+@functools.lru_cache(maxsize=32)
+def _compile_field_patterns(patterns_spec):
+    """
+    Compile the raw field patterns once per process for each distinct set,
+    given as a tuple of (field, tuple of patterns) pairs.
+
+    Each entry is a (required_literal, compiled_pattern) pair. The literal is the
+    leading keyword of the pattern (e.g. 'total' or '#'); when it does not occur
+    in the lowercased text the pattern cannot match and the search is skipped.
+    The shortcut is only taken for ASCII text, where lowercasing and
+    case-insensitive matching agree exactly.
+    """
+    compiled = {}
+    for field, field_patterns in patterns_spec:
+        flags = _FIELD_SEARCH_FLAGS.get(field, re.IGNORECASE)
+        entries = []
+        for pattern in field_patterns:
+            entries.append((_required_literal(pattern), re.compile(pattern, flags)))
+        compiled[field] = entries
+    return compiled
+
+
+def _required_literal(pattern):
+    """
+    The leading keyword every match of the pattern contains, or None when
+    there is none or it may be skipped: a quantifier or the end of a group
+    right after it ('totals?') or an alternative at the top level
+    ('amount|total').
+    """
+    literal = _REQUIRED_LITERAL_RE.match(pattern)
+    if literal is None or pattern[literal.end():literal.end() + 1] in _OPTIONAL_FOLLOWERS:
+        return None
+    depth = 0
+    in_class = False
+    escaped = False
+    for char in pattern:
+        if escaped:
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        elif in_class:
+            in_class = char != ']'
+        elif char == '[':
+            in_class = True
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == '|' and depth == 0:
+            return None
+    return literal.group(0)
+
+
+@functools.lru_cache(maxsize=32)
+def _keyword_automaton(keywords_spec):
+    """Automaton for a KeywordAutomaton.make_spec keyword set, built once per process"""
+    return KeywordAutomaton(dict(keywords_spec))
+
+
+def _chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _largest_first(totals):
+    return dict(sorted(totals.items(), key=lambda item: (-item[1], item[0])))
+
+
 
 class InvoiceAnalyzer:
     def __init__(self):
@@ -11,7 +123,7 @@ class InvoiceAnalyzer:
             'Utilities': ['electricity', 'gas', 'water', 'internet', 'phone', 'utility', 'power', 'energy', 'telecom'],
             'Travel': ['hotel', 'flight', 'taxi', 'uber', 'lyft', 'airline', 'travel', 'accommodation', 'transport'],
             'Meals & Entertainment': ['restaurant', 'cafe', 'food', 'meal', 'lunch', 'dinner', 'catering', 'entertainment'],
-            'Technology': ['computer', 'laptop', 'software', 'hardware', 'tech', 'IT', 'system', 'device'],
+            'Technology': ['computer', 'laptop', 'software', 'hardware', 'tech', 'technology', 'IT', 'system', 'device'],
             'Professional Services': ['consulting', 'legal', 'accounting', 'professional', 'service', 'advisory'],
             'Marketing': ['advertising', 'marketing', 'promotion', 'social media', 'campaign', 'branding'],
             'Maintenance': ['repair', 'maintenance', 'cleaning', 'janitorial', 'fix', 'service'],
@@ -34,10 +146,11 @@ class InvoiceAnalyzer:
                 r'balance\s*due\s*:?\s*\$?([0-9,]+\.?\d{0,2})'
             ],
             'date': [
-                r'date\s*:?\s*(\d{1,2}[\/\-]\d{1,2}[\/\-]\d{2,4})',
-                r'invoice\s*date\s*:?\s*(\d{1,2}[\/\-]\d{1,2}[\/\-]\d{2,4})',
-                r'(\d{1,2}[\/\-]\d{1,2}[\/\-]\d{2,4})',
-                r'(\d{4}[\/\-]\d{1,2}[\/\-]\d{1,2})'
+                rf'date\s*:?\s*({DATE_PATTERN})(?!\d)',
+                rf'invoice\s*date\s*:?\s*({DATE_PATTERN})(?!\d)',
+                r'(?<!\d)(\d{4}[\/\-]\d{1,2}[\/\-]\d{1,2})(?!\d)',
+                r'(?<!\d)(\d{1,2}[\/\-]\d{1,2}[\/\-](?:\d{4}|\d{2}))(?!\d)',
+                rf'\b({TEXT_DATE_PATTERN})(?!\d)'
             ],
             'tax': [
                 r'tax\s*:?\s*\$?([0-9,]+\.?\d{0,2})',
@@ -51,110 +164,218 @@ class InvoiceAnalyzer:
             ]
         }
 
-    def analyze_invoice_text(self, text):
+        # Compiled patterns and the keyword automaton are shared by every
+        # analyzer with the same rules, so only the first one in a process
+        # pays for building them; call refresh_patterns() or
+        # refresh_categories() after editing the rules
+        self.refresh_patterns()
+        self.refresh_categories()
+
+        # Learns each vendor's day/month order from the dates it has seen
+        self.date_normalizer = DateNormalizer()
+
+    def refresh_patterns(self):
+        """Recompile self.patterns after they have been modified"""
+        self._compiled_patterns = _compile_field_patterns(
+            tuple((field, tuple(patterns)) for field, patterns in self.patterns.items())
+        )
+
+    def refresh_categories(self):
+        """
+        Rebuild the keyword automaton after self.category_keywords has been
+        modified. Nothing is rebuilt if the keyword set was seen before.
+        """
+        self._keyword_automaton = _keyword_automaton(KeywordAutomaton.make_spec(self.category_keywords))
+
+    def add_category_keyword(self, category, keyword, weight=1):
+        """Add a (weighted) keyword to a category, creating it if needed"""
+        entry = keyword if weight == 1 else (keyword, weight)
+        self.category_keywords.setdefault(category, []).append(entry)
+        self.refresh_categories()
+
+    def _search_field(self, field, text, text_lower):
+        """Yield the matches of the field's patterns, in priority order"""
+        target = text if field in _FIELDS_ON_ORIGINAL_TEXT else text_lower
+        prefilter = text.isascii()
+        for literal, pattern in self._compiled_patterns[field]:
+            if prefilter and literal is not None and literal not in text_lower:
+                continue
+            match = pattern.search(target)
+            if match:
+                yield match
+
+    def analyze_invoice_text(self, text, learn=True):
         """
         Analyze extracted text and return structured invoice data
+
+        The text is lowercased and split into lines once and the shared views
+        are handed to every extractor, so each document is only scanned a small
+        fixed number of times. With learn=False the text is not used as
+        evidence of its vendor's date order, for provisional reads of a
+        document that will be analyzed again.
+
+        The analyzer learns from every text it analyzes, so an ambiguous
+        numeric date (03/04/2024) may be read differently depending on what
+        this analyzer has seen of the vendor before; see date_normalizer.
+        Every other field only depends on the text.
         """
         if not text:
             return self._empty_invoice_data()
         
+        text_lower = text.lower()
+        lines = text.split('\n')
+        
+        # The vendor decides how an ambiguous date is read
+        vendor = self._extract_vendor(text, text_lower, lines)
         invoice_data = {
-            'invoice_number': self._extract_invoice_number(text),
-            'date': self._extract_date(text),
-            'vendor': self._extract_vendor(text),
-            'total_amount': self._extract_total_amount(text),
-            'tax_amount': self._extract_tax_amount(text),
-            'items': self._extract_line_items(text),
-            'category': self._categorize_invoice(text),
-            'confidence': self._calculate_extraction_confidence(text)
+            'invoice_number': self._extract_invoice_number(text, text_lower),
+            'date': self._extract_date(text, text_lower, vendor, learn),
+            'vendor': vendor,
+            'total_amount': self._extract_total_amount(text, text_lower),
+            'tax_amount': self._extract_tax_amount(text, text_lower),
+            'items': self._extract_line_items(text, lines),
+            'category': self._categorize_invoice(text, text_lower),
+            'confidence': self._calculate_extraction_confidence(text, text_lower)
         }
         
         return invoice_data
 
-    def _extract_invoice_number(self, text):
+    def analyze_many(self, texts, workers=None, chunksize=None, ordered=True):
+        """
+        Analyze a batch of extracted texts, streaming the results back.
+
+        With ordered=True the invoice dicts are yielded in input order;
+        otherwise (index, invoice_data) pairs are yielded as they complete.
+        texts may be any iterable, including a lazy generator: only a bounded
+        number of chunks is in flight at once.
+
+        Large batches are spread over a process pool of `workers` processes
+        (default: one per CPU). Each worker receives this analyzer, with its
+        compiled patterns and keyword automaton, once at startup. Batches
+        smaller than SERIAL_BATCH_THRESHOLD, or workers=1, run in-process.
+        Workers learn vendor date orders on their own copies of the
+        analyzer, so ambiguous dates may read differently than in a
+        sequential run, and this analyzer learns nothing from the batch.
+        """
+        # Imported here: multiprocessing and the worker functions (which
+        # import this module) are not needed by the in-process path
+        from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+        from jobs import analyze_texts, init_worker
+
+        workers = workers or os.cpu_count() or 1
+        texts = iter(texts)
+        head = list(itertools.islice(texts, SERIAL_BATCH_THRESHOLD))
+        indexed_texts = enumerate(itertools.chain(head, texts))
+        
+        if workers == 1 or len(head) < SERIAL_BATCH_THRESHOLD:
+            for index, text in indexed_texts:
+                invoice_data = self.analyze_invoice_text(text)
+                yield invoice_data if ordered else (index, invoice_data)
+            return
+        
+        chunks = _chunked(indexed_texts, chunksize or DEFAULT_BATCH_CHUNKSIZE)
+        max_in_flight = workers * 2
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(self,))
+        # Input indices of each submitted chunk; only the texts are sent
+        indices = {}
+        
+        def submit(chunk):
+            future = pool.submit(analyze_texts, [text for _, text in chunk])
+            indices[future] = [index for index, _ in chunk]
+            return future
+        
+        try:
+            if ordered:
+                # Futures are consumed in submission order, so results come
+                # back in input order while later chunks keep the pool busy
+                pending = deque(submit(chunk) for chunk in itertools.islice(chunks, max_in_flight))
+                while pending:
+                    future = pending.popleft()
+                    results = future.result()
+                    del indices[future]
+                    for chunk in itertools.islice(chunks, 1):
+                        pending.append(submit(chunk))
+                    yield from results
+            else:
+                pending = {submit(chunk) for chunk in itertools.islice(chunks, max_in_flight)}
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for chunk in itertools.islice(chunks, len(done)):
+                        pending.add(submit(chunk))
+                    for future in done:
+                        yield from zip(indices.pop(future), future.result())
+        finally:
+            pool.shutdown(cancel_futures=True)
+
+    @perf.timed('analyze.invoice_number')
+    def _extract_invoice_number(self, text, text_lower=None):
         """Extract invoice number from text"""
-        text_lower = text.lower()
+        if text_lower is None:
+            text_lower = text.lower()
         
-        for pattern in self.patterns['invoice_number']:
-            match = re.search(pattern, text_lower, re.IGNORECASE)
-            if match:
-                return match.group(1).upper()
-        
-        return "Not found"
-
-    def _extract_date(self, text):
-        """Extract date from text"""
-        for pattern in self.patterns['date']:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                date_str = match.group(1)
-                try:
-                    # Try to parse and format the date
-                    parsed_date = self._parse_date(date_str)
-                    return parsed_date.strftime("%Y-%m-%d") if parsed_date else date_str
-                except:
-                    return date_str
+        for match in self._search_field('invoice_number', text, text_lower):
+            return match.group(1).upper()
         
         return "Not found"
 
-    def _parse_date(self, date_str):
-        """Parse date string into datetime object"""
-        date_formats = [
-            "%m/%d/%Y", "%m-%d-%Y", "%d/%m/%Y", "%d-%m-%Y",
-            "%m/%d/%y", "%m-%d-%y", "%d/%m/%y", "%d-%m-%y",
-            "%Y/%m/%d", "%Y-%m-%d"
-        ]
+    @perf.timed('analyze.date')
+    def _extract_date(self, text, text_lower=None, vendor=None, learn=True):
+        """
+        Extract date from text as YYYY-MM-DD; ambiguous numeric dates are
+        read in the vendor's usual day/month order
+        """
+        if text_lower is None:
+            text_lower = text.lower()
         
-        for fmt in date_formats:
-            try:
-                return datetime.strptime(date_str, fmt)
-            except ValueError:
-                continue
+        for match in self._search_field('date', text, text_lower):
+            date_str = match.group(1)
+            # Dates that are not valid are returned as found
+            return self.date_normalizer.normalize(date_str, vendor, learn) or date_str
         
-        return None
+        return "Not found"
 
-    def _extract_vendor(self, text):
+    @perf.timed('analyze.vendor')
+    def _extract_vendor(self, text, text_lower=None, lines=None):
         """Extract vendor/company name from text"""
-        lines = text.split('\n')
+        if text_lower is None:
+            text_lower = text.lower()
+        if lines is None:
+            lines = text.split('\n')
         
         # Look for vendor in first few lines
         for i, line in enumerate(lines[:5]):
             line = line.strip()
-            if len(line) > 3 and not re.match(r'^\d', line):
+            if len(line) > 3 and not _LEADING_DIGIT_RE.match(line):
                 # Check if it looks like a company name
-                if any(word in line.lower() for word in ['inc', 'llc', 'corp', 'ltd', 'company', 'co']):
+                if _VENDOR_WORD_RE.search(line.lower()):
                     return line
                 # If it's the first non-empty line with reasonable length
                 elif i == 0 and len(line.split()) >= 2:
                     return line
         
         # Fallback: look for patterns
-        for pattern in self.patterns['vendor']:
-            match = re.search(pattern, text, re.IGNORECASE | re.MULTILINE)
-            if match:
-                return match.group(1).strip()
+        for match in self._search_field('vendor', text, text_lower):
+            return match.group(1).strip()
         
         return "Not found"
 
-    def _extract_total_amount(self, text):
+    @perf.timed('analyze.total_amount')
+    def _extract_total_amount(self, text, text_lower=None):
         """Extract total amount from text"""
-        text_lower = text.lower()
+        if text_lower is None:
+            text_lower = text.lower()
         
-        for pattern in self.patterns['total_amount']:
-            match = re.search(pattern, text_lower, re.IGNORECASE)
-            if match:
-                amount_str = match.group(1).replace(',', '')
-                try:
-                    return float(amount_str)
-                except ValueError:
-                    continue
+        for match in self._search_field('total_amount', text, text_lower):
+            amount_str = match.group(1).replace(',', '')
+            try:
+                return float(amount_str)
+            except ValueError:
+                continue
         
         # Fallback: look for any dollar amount
-        dollar_pattern = r'\$([0-9,]+\.?\d{0,2})'
-        matches = re.findall(dollar_pattern, text)
-        if matches:
+        if '$' in text:
             amounts = []
-            for match in matches:
+            for match in _DOLLAR_AMOUNT_RE.findall(text):
                 try:
                     amounts.append(float(match.replace(',', '')))
                 except ValueError:
@@ -166,24 +387,26 @@ class InvoiceAnalyzer:
         
         return 0.0
 
-    def _extract_tax_amount(self, text):
+    @perf.timed('analyze.tax_amount')
+    def _extract_tax_amount(self, text, text_lower=None):
         """Extract tax amount from text"""
-        text_lower = text.lower()
+        if text_lower is None:
+            text_lower = text.lower()
         
-        for pattern in self.patterns['tax']:
-            match = re.search(pattern, text_lower, re.IGNORECASE)
-            if match:
-                try:
-                    return float(match.group(1).replace(',', ''))
-                except ValueError:
-                    continue
+        for match in self._search_field('tax', text, text_lower):
+            try:
+                return float(match.group(1).replace(',', ''))
+            except ValueError:
+                continue
         
         return 0.0
 
-    def _extract_line_items(self, text):
+    @perf.timed('analyze.line_items')
+    def _extract_line_items(self, text, lines=None):
         """Extract line items from invoice text"""
         items = []
-        lines = text.split('\n')
+        if lines is None:
+            lines = text.split('\n')
         
         # Look for lines that contain item descriptions and amounts
         for line in lines:
@@ -192,22 +415,22 @@ class InvoiceAnalyzer:
                 continue
             
             # Skip header-like lines
-            if any(header in line.lower() for header in ['invoice', 'bill to', 'ship to', 'date', 'total']):
+            if _LINE_ITEM_HEADER_RE.search(line.lower()):
                 continue
             
             # Look for lines with dollar amounts
-            dollar_match = re.search(r'\$?([0-9,]+\.?\d{0,2})', line)
+            dollar_match = _LINE_AMOUNT_RE.search(line)
             if dollar_match:
                 try:
                     amount = float(dollar_match.group(1).replace(',', ''))
                     
                     # Extract description (text before the amount)
-                    description = re.sub(r'\$?[0-9,]+\.?\d{0,2}', '', line).strip()
-                    description = re.sub(r'\s+', ' ', description)  # Clean whitespace
+                    description = _LINE_AMOUNT_RE.sub('', line).strip()
+                    description = _WHITESPACE_RE.sub(' ', description)  # Clean whitespace
                     
                     if description and len(description) > 2:
                         # Try to extract quantity
-                        qty_match = re.search(r'(\d+)\s*x\s*', description.lower())
+                        qty_match = _QUANTITY_RE.search(description.lower())
                         quantity = int(qty_match.group(1)) if qty_match else 1
                         
                         items.append({
@@ -221,16 +444,11 @@ class InvoiceAnalyzer:
         
         return items
 
-    def _categorize_invoice(self, text):
+    @perf.timed('analyze.category')
+    def _categorize_invoice(self, text, text_lower=None):
         """Automatically categorize invoice based on content"""
-        text_lower = text.lower()
-        
-        # Count keyword matches for each category
-        category_scores = {}
-        for category, keywords in self.category_keywords.items():
-            score = sum(1 for keyword in keywords if keyword in text_lower)
-            if score > 0:
-                category_scores[category] = score
+        # Score every category in a single scan of the text
+        category_scores = self._keyword_automaton.score(text, text_lower)
         
         # Return category with highest score
         if category_scores:
@@ -238,10 +456,13 @@ class InvoiceAnalyzer:
         
         return "Uncategorized"
 
-    def _calculate_extraction_confidence(self, text):
+    @perf.timed('analyze.confidence')
+    def _calculate_extraction_confidence(self, text, text_lower=None):
         """Calculate confidence score for data extraction"""
         if not text:
             return 0.0
+        if text_lower is None:
+            text_lower = text.lower()
         
         confidence_factors = []
         
@@ -250,12 +471,11 @@ class InvoiceAnalyzer:
         confidence_factors.append(text_length_score)
         
         # Factor 2: Presence of key invoice elements
-        key_elements = ['invoice', 'total', 'date', 'amount']
-        element_score = sum(1 for element in key_elements if element in text.lower()) / len(key_elements) * 100
+        element_score = sum(1 for element in _CONFIDENCE_ELEMENTS if element in text_lower) / len(_CONFIDENCE_ELEMENTS) * 100
         confidence_factors.append(element_score)
         
         # Factor 3: Number format detection (invoices should have numbers)
-        number_matches = len(re.findall(r'\d+', text))
+        number_matches = len(_NUMBER_RE.findall(text))
         number_score = min(number_matches / 10, 1.0) * 100
         confidence_factors.append(number_score)
         
@@ -278,54 +498,89 @@ class InvoiceAnalyzer:
         }
 
     def get_spending_insights(self, invoices_data):
-        """Generate spending insights from invoice data"""
+        """
+        Generate spending insights from a list of invoice dicts, every one of
+        which is counted. Stored invoices should use
+        InvoiceStore.spending_insights, which reads the maintained aggregates
+        and leaves duplicates out.
+        """
         if not invoices_data:
             return {}
         
-        df = pd.DataFrame(invoices_data)
-        
-        insights = {
-            'total_spending': df['total_amount'].sum(),
-            'average_invoice': df['total_amount'].mean(),
-            'top_category': df.groupby('category')['total_amount'].sum().idxmax(),
-            'top_vendor': df.groupby('vendor')['total_amount'].sum().idxmax(),
-            'highest_invoice': df['total_amount'].max(),
-            'monthly_average': df['total_amount'].sum() / max(1, len(df.groupby('date').size())),
-            'category_distribution': df.groupby('category')['total_amount'].sum().to_dict(),
-            'vendor_distribution': df.groupby('vendor')['total_amount'].sum().to_dict()
+        totals = self._aggregate(invoices_data)
+        amounts, categories, vendors = totals['amounts'], totals['categories'], totals['vendors']
+        total = sum(amounts)
+        return {
+            'total_spending': total,
+            'average_invoice': total / len(amounts),
+            'top_category': next(iter(categories)),
+            'top_vendor': next(iter(vendors)),
+            'highest_invoice': amounts[-1],
+            'monthly_average': total / max(1, len(totals['months'])),
+            'category_distribution': categories,
+            'vendor_distribution': vendors,
+            'amount_quantiles': sketch_quantiles(totals['histogram'], (0.5, 0.9, 0.99))
         }
-        
-        return insights
 
     def suggest_cost_savings(self, invoices_data):
         """Suggest potential cost-saving opportunities"""
         if not invoices_data:
             return []
         
-        df = pd.DataFrame(invoices_data)
+        totals = self._aggregate(invoices_data)
         suggestions = []
         
         # High-spending categories
-        category_spending = df.groupby('category')['total_amount'].sum()
-        if len(category_spending) > 0:
-            # Convert to series and sort
-            spending_series = pd.Series(category_spending.values, index=category_spending.index)
-            category_spending_sorted = spending_series.sort_values(ascending=False)
-            top_category = category_spending_sorted.index[0]
-            top_amount = category_spending_sorted.iloc[0]
-            suggestions.append(f"Consider reviewing {top_category} expenses (${top_amount:,.2f} total)")
-        
-        # Duplicate vendors
-        vendor_counts = df['vendor'].value_counts()
-        frequent_vendors = vendor_counts[vendor_counts > 1]
-        if len(frequent_vendors) > 0:
-            # Get first vendor from the filtered Series
-            vendor_name = frequent_vendors.index.tolist()[0]
-            suggestions.append(f"Consolidate purchases with {vendor_name} for potential bulk discounts")
-        
-        # High individual invoices
-        high_invoices = df[df['total_amount'] > df['total_amount'].quantile(0.9)]
-        if len(high_invoices) > 0:
-            suggestions.append(f"Review high-value invoices (${high_invoices['total_amount'].min():.2f}+ range)")
+        top_category, top_amount = next(iter(totals['categories'].items()))
+        suggestions.append(f"Consider reviewing {top_category} expenses (${top_amount:,.2f} total)")
+        
+        # Repeat vendors
+        repeat_vendors = sorted((-count, vendor) for vendor, count in totals['vendor_counts'].items() if count > 1)
+        if repeat_vendors:
+            suggestions.append(f"Consolidate purchases with {repeat_vendors[0][1]} for potential bulk discounts")
+        
+        # High individual invoices, by the same sketch as stored invoices
+        threshold = high_value_threshold(totals['histogram'])
+        high_invoices = [amount for amount in totals['amounts'] if amount > threshold]
+        if high_invoices:
+            suggestions.append(f"Review high-value invoices (${high_invoices[0]:.2f}+ range)")
         
         return suggestions
+
+    @staticmethod
+    def _aggregate(invoices_data):
+        """
+        Sorted amounts and their histogram sketch, category and vendor totals
+        (largest first), vendor invoice counts and the months seen, grouped
+        the same way as the invoice store's aggregates
+        """
+        amounts = []
+        categories = {}
+        vendors = {}
+        vendor_counts = {}
+        months = set()
+        for invoice in invoices_data:
+            amount = float(invoice.get('total_amount') or 0)
+            category = invoice.get('category') or ''
+            vendor = invoice.get('canonical_vendor') or invoice.get('vendor') or ''
+            amounts.append(amount)
+            categories[category] = categories.get(category, 0.0) + amount
+            vendors[vendor] = vendors.get(vendor, 0.0) + amount
+            vendor_counts[vendor] = vendor_counts.get(vendor, 0) + 1
+            month = _MONTH_RE.match(str(invoice.get('date') or ''))
+            if month:
+                months.add(month.group(0))
+        amounts.sort()
+        histogram = {}
+        for amount in amounts:
+            bucket = amount_bucket(amount)
+            histogram[bucket] = histogram.get(bucket, 0) + 1
+        return {
+            'amounts': amounts,
+            'histogram': sorted(histogram.items()),
+            'categories': _largest_first(categories),
+            'vendors': _largest_first(vendors),
+            'vendor_counts': vendor_counts,
+            'months': months,
+        }
+
@@ -1,13 +1,20 @@
 import streamlit as st
-import pandas as pd
-import numpy as np
-from PIL import Image
-import io
-import base64
+import os
+import tempfile
 from datetime import datetime
-from ocr_utils import process_image, extract_text_from_pdf
+from ocr_utils import extract_text_from_file_bytes
 from analyzer import InvoiceAnalyzer
+from ocr_cache import get_ocr_cache
+from invoice_store import INVOICE_COLUMNS, get_invoice_store
+from exporters import EXPORT_FORMATS, available_formats, write_export
 from sample_data import get_sample_data
+from jobs import QUEUED, RUNNING, DONE, FAILED, get_job_queue
+from lazy_imports import lazy_import
+import perf
+
+# Not needed to render the first page; loaded when a page uses them
+pd = lazy_import('pandas')
+Image = lazy_import('PIL.Image')
 
 # Page configuration
 st.set_page_config(
@@ -18,11 +25,12 @@ st.set_page_config(
 )
 
 # Initialize session state
-if 'processed_invoices' not in st.session_state:
-    st.session_state.processed_invoices = []
 if 'analyzer' not in st.session_state:
     st.session_state.analyzer = InvoiceAnalyzer()
 
+# Seconds between job status refreshes while this session has jobs in progress
+JOB_POLL_SECONDS = 1.0
+
 def main():
     st.title("📄 Automated Invoice & Document Data Extraction")
     st.markdown("Upload invoices and documents to automatically extract and analyze key information using OCR technology.")
@@ -30,17 +38,22 @@ def main():
     # Sidebar
     with st.sidebar:
         st.header("Navigation")
-        page = st.selectbox("Select Page", ["Upload & Extract", "Analytics Dashboard", "Data Export", "Sample Data"])
+        page = st.selectbox("Select Page", ["Upload & Extract", "Analytics Dashboard", "Data Export", "Sample Data", "Performance"])
         
         st.markdown("---")
         st.header("Quick Stats")
-        if st.session_state.processed_invoices:
-            total_invoices = len(st.session_state.processed_invoices)
-            total_amount = sum([inv.get('total_amount', 0) for inv in st.session_state.processed_invoices])
-            st.metric("Total Invoices", total_invoices)
-            st.metric("Total Amount", f"${total_amount:,.2f}")
+        summary = get_invoice_store().summary()
+        if summary['count']:
+            st.metric("Total Invoices", summary['count'])
+            st.metric("Total Amount", f"${summary['total_amount']:,.2f}")
         else:
             st.info("No invoices processed yet")
+        
+        cache_stats = get_ocr_cache().stats()
+        st.caption(
+            f"OCR cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses "
+            f"({cache_stats['hit_rate']:.0%} hit rate, {cache_stats['size_bytes'] / (1024 * 1024):.1f} MB)"
+        )
     
     if page == "Upload & Extract":
         upload_and_extract_page()
@@ -50,6 +63,8 @@ def main():
         data_export_page()
     elif page == "Sample Data":
         sample_data_page()
+    elif page == "Performance":
+        performance_page()
 
 def upload_and_extract_page():
     st.header("Upload & Extract Invoice Data")
@@ -62,7 +77,16 @@ def upload_and_extract_page():
         help="Upload PDF or image files (PNG, JPG, JPEG)"
     )
     
+    header_only = st.checkbox(
+        "⚡ Header & totals only",
+        help="OCR the top and bottom of each image first and skip the body when invoice number, "
+             "vendor, date and total are already found. Line items may be missing."
+    )
+    
     if uploaded_files:
+        if st.button(f"🚀 Extract all ({len(uploaded_files)} files)", key="extract_all"):
+            submit_extraction_jobs(uploaded_files, header_only)
+        
         for uploaded_file in uploaded_files:
             with st.container():
                 col1, col2 = st.columns([1, 2])
@@ -80,179 +104,255 @@ def upload_and_extract_page():
                 
                 with col2:
                     if st.button(f"Extract Data from {uploaded_file.name}", key=f"extract_{uploaded_file.name}"):
-                        with st.spinner("Processing document..."):
-                            try:
-                                # Process the file based on type
-                                if uploaded_file.type == "application/pdf":
-                                    extracted_text = extract_text_from_pdf(uploaded_file)
-                                else:
-                                    # Process as image
-                                    image = Image.open(uploaded_file)
-                                    extracted_text = process_image(image)
-                                
-                                if extracted_text:
-                                    # Analyze the extracted text
-                                    invoice_data = st.session_state.analyzer.analyze_invoice_text(extracted_text)
-                                    invoice_data['filename'] = uploaded_file.name
-                                    invoice_data['extracted_text'] = extracted_text
-                                    invoice_data['processed_date'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                                    
-                                    # Add to session state
-                                    st.session_state.processed_invoices.append(invoice_data)
-                                    
-                                    st.success("✅ Document processed successfully!")
-                                    
-                                    # Display extracted data
-                                    st.subheader("Extracted Information")
-                                    
-                                    # Key fields
-                                    col_a, col_b = st.columns(2)
-                                    with col_a:
-                                        st.write("**Invoice Number:**", invoice_data.get('invoice_number', 'Not found'))
-                                        st.write("**Date:**", invoice_data.get('date', 'Not found'))
-                                        st.write("**Vendor:**", invoice_data.get('vendor', 'Not found'))
-                                    
-                                    with col_b:
-                                        st.write("**Total Amount:**", f"${invoice_data.get('total_amount', 0):.2f}")
-                                        st.write("**Tax Amount:**", f"${invoice_data.get('tax_amount', 0):.2f}")
-                                        st.write("**Category:**", invoice_data.get('category', 'Uncategorized'))
-                                    
-                                    # Items table
-                                    if invoice_data.get('items'):
-                                        st.subheader("Line Items")
-                                        items_df = pd.DataFrame(invoice_data['items'])
-                                        st.dataframe(items_df, use_container_width=True)
-                                    
-                                    # Raw extracted text
-                                    with st.expander("View Raw Extracted Text"):
-                                        st.text_area("Extracted Text", extracted_text, height=200)
-                                
-                                else:
-                                    st.error("❌ Failed to extract text from document")
-                            
-                            except Exception as e:
-                                st.error(f"❌ Error processing document: {str(e)}")
+                        submit_extraction_jobs([uploaded_file], header_only)
                 
                 st.markdown("---")
+    
+    # Jobs run in the background; the panel polls only while some are unfinished
+    job_ids = st.session_state.get('job_ids')
+    if job_ids:
+        active = any(job['status'] in (QUEUED, RUNNING) for job in get_job_queue().jobs(job_ids))
+        st.fragment(job_status_panel, run_every=JOB_POLL_SECONDS if active else None)(active)
+
+def submit_extraction_jobs(uploaded_files, header_only):
+    """Queue files for background extraction and track the jobs in this session"""
+    queue = get_job_queue()
+    job_ids = st.session_state.setdefault('job_ids', [])
+    for uploaded_file in uploaded_files:
+        job_ids.append(queue.submit(uploaded_file.getvalue(), uploaded_file.name, uploaded_file.type, header_only))
+    st.toast(f"Queued {len(uploaded_files)} file(s) for extraction")
+
+def job_status_panel(was_active):
+    """
+    Status of this session's extraction jobs. Results are stored by the job
+    queue whether or not this panel is showing.
+    """
+    queue = get_job_queue()
+    jobs = queue.jobs(st.session_state.get('job_ids', []))
+    
+    st.subheader("Extraction Jobs")
+    for job in jobs:
+        col1, col2 = st.columns([4, 1])
+        
+        with col1:
+            if job['status'] == DONE:
+                result = job['result']
+                st.success(f"✅ {job['filename']}: {result['vendor']} - ${result['total_amount']:.2f}")
+                if result.get('duplicate_of') is not None:
+                    st.caption(f"Duplicate of invoice #{result['duplicate_of']}; not counted in totals")
+            elif job['status'] == FAILED:
+                st.error(f"❌ {job['filename']}: {job['error']}")
+            elif job['status'] == RUNNING:
+                st.info(f"⚙️ {job['filename']}: processing")
+            elif job['status'] == QUEUED:
+                st.info(f"⏳ {job['filename']}: queued")
+            else:
+                st.warning(f"🚫 {job['filename']}: cancelled")
+        
+        with col2:
+            if job['status'] in (QUEUED, RUNNING) and st.button("Cancel", key=f"cancel_job_{job['id']}"):
+                queue.cancel(job['id'])
+                st.rerun(scope="fragment")
+        
+        if job['status'] == DONE:
+            with st.expander(f"Extracted Information: {job['filename']}"):
+                result = job['result']
+                col_a, col_b = st.columns(2)
+                with col_a:
+                    st.write("**Invoice Number:**", result['invoice_number'])
+                    st.write("**Date:**", result['date'])
+                    st.write("**Vendor:**", result['vendor'])
+                
+                with col_b:
+                    st.write("**Total Amount:**", f"${result['total_amount']:.2f}")
+                    st.write("**Tax Amount:**", f"${result['tax_amount']:.2f}")
+                    st.write("**Category:**", result['category'])
+                
+                items = get_invoice_store().get_line_items(job['invoice_id'])
+                if items:
+                    st.write("**Line Items**")
+                    st.dataframe(pd.DataFrame(items), use_container_width=True)
+                
+                # The raw text is only read from the store when asked for
+                if st.toggle("View Raw Extracted Text", key=f"raw_text_{job['id']}"):
+                    st.text_area("Extracted Text", get_invoice_store().get_extracted_text(job['invoice_id']),
+                                 height=200, key=f"raw_text_area_{job['id']}")
+    
+    if st.button("Clear finished jobs"):
+        st.session_state.job_ids = [job['id'] for job in jobs if job['status'] in (QUEUED, RUNNING)]
+        st.rerun()
+    
+    # Rerun the whole page once everything has finished, so the sidebar
+    # totals update and polling stops
+    if was_active and not any(job['status'] in (QUEUED, RUNNING) for job in jobs):
+        st.rerun()
+
+def build_invoice_record(extracted_text, filename):
+    """Analyze extracted text and attach the file metadata"""
+    invoice_data = st.session_state.analyzer.analyze_invoice_text(extracted_text)
+    invoice_data['filename'] = filename
+    invoice_data['extracted_text'] = extracted_text
+    invoice_data['processed_date'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    return invoice_data
+
+# Rows per page of the invoice table
+TABLE_PAGE_SIZE = 100
+
+def invoice_column_config():
+    """Display formats for the typed invoice table; the browser formats the values"""
+    return {
+        'total_amount': st.column_config.NumberColumn("total_amount", format="$%.2f"),
+        'tax_amount': st.column_config.NumberColumn("tax_amount", format="$%.2f"),
+        'confidence': st.column_config.NumberColumn("confidence", format="%.1f%%"),
+        'date': st.column_config.DateColumn("date", format="YYYY-MM-DD"),
+        'processed_date': st.column_config.DatetimeColumn("processed_date", format="YYYY-MM-DD HH:mm:ss"),
+        'duplicate_of': st.column_config.NumberColumn("duplicate_of", format="%d", help="Id of the original invoice"),
+    }
 
 def analytics_dashboard_page():
     st.header("📊 Analytics Dashboard")
     
-    if not st.session_state.processed_invoices:
+    store = get_invoice_store()
+    summary = store.summary()
+    if not summary['count']:
         st.warning("No invoice data available. Please upload and process some invoices first.")
         return
     
-    # Convert to DataFrame for analysis
-    df = pd.DataFrame(st.session_state.processed_invoices)
-    
     # Key metrics
     col1, col2, col3, col4 = st.columns(4)
     
     with col1:
-        total_invoices = len(df)
-        st.metric("Total Invoices", total_invoices)
+        st.metric("Total Invoices", summary['count'])
     
     with col2:
-        total_amount = df['total_amount'].sum()
-        st.metric("Total Amount", f"${total_amount:,.2f}")
+        st.metric("Total Amount", f"${summary['total_amount']:,.2f}")
     
     with col3:
-        avg_amount = df['total_amount'].mean()
-        st.metric("Average Invoice", f"${avg_amount:,.2f}")
+        st.metric("Average Invoice", f"${summary['average_amount']:,.2f}")
     
     with col4:
-        total_tax = df['tax_amount'].sum()
-        st.metric("Total Tax", f"${total_tax:,.2f}")
+        st.metric("Total Tax", f"${summary['total_tax']:,.2f}")
     
     st.markdown("---")
     
     
-    # Detailed data table
+    # Detailed data table, one page at a time
     st.subheader("All Processed Invoices")
     
-    # Select columns to display
-    display_cols = ['filename', 'invoice_number', 'date', 'vendor', 'category', 'total_amount', 'tax_amount', 'processed_date']
-    display_df = df[display_cols].copy()
-    # Format monetary values for display
-    for idx in display_df.index:
-        display_df.at[idx, 'total_amount'] = f"${display_df.at[idx, 'total_amount']:.2f}"
-        display_df.at[idx, 'tax_amount'] = f"${display_df.at[idx, 'tax_amount']:.2f}"
+    duplicates = store.duplicate_count()
+    page_count = (summary['count'] + duplicates - 1) // TABLE_PAGE_SIZE + 1
+    page_number = st.number_input("Page", min_value=1, max_value=page_count, value=1, step=1) if page_count > 1 else 1
     
-    st.dataframe(display_df, use_container_width=True)
+    # Select columns to display
+    display_cols = ['filename', 'invoice_number', 'date', 'vendor', 'canonical_vendor', 'category', 'total_amount',
+                    'tax_amount', 'processed_date', 'duplicate_of']
+    with perf.stage('page.dashboard_table'):
+        display_df = store.query_invoices(display_cols, limit=TABLE_PAGE_SIZE, offset=(page_number - 1) * TABLE_PAGE_SIZE)
+    st.dataframe(display_df, use_container_width=True, column_config=invoice_column_config())
+    st.caption(f"Page {page_number} of {page_count}"
+               + (f" · {duplicates} duplicates, linked to their originals, are left out of the totals" if duplicates else ""))
     
     # Insights
     st.subheader("💡 Insights & Recommendations")
     
-    # Calculate insights without visualizations
-    category_summary = df.groupby('category')['total_amount'].sum().reset_index()
+    # Insights come from the store's maintained aggregates
+    insights = store.spending_insights()
     
     # Top spending category
-    if not category_summary.empty:
-        top_category_idx = category_summary['total_amount'].idxmax()
-        top_category = category_summary.loc[top_category_idx, 'category']
-        top_category_amount = category_summary.loc[top_category_idx, 'total_amount']
-        
-        st.info(f"**Highest spending category:** {top_category} (${top_category_amount:,.2f})")
+    top_category = insights['top_category']
+    st.info(f"**Highest spending category:** {top_category} (${insights['category_distribution'][top_category]:,.2f})")
     
     # Most frequent vendor
-    top_vendor = df['vendor'].mode().iloc[0] if not df['vendor'].mode().empty else "N/A"
+    top_vendor = store.most_frequent_vendor() or "N/A"
     st.info(f"**Most frequent vendor:** {top_vendor}")
     
+    # Typical invoice size
+    quantiles = insights['amount_quantiles']
+    st.info(f"**Typical invoice:** ${quantiles[0.5]:,.2f} median, ${quantiles[0.9]:,.2f} at the 90th percentile")
+    
     # Cost-saving opportunities
-    if len(category_summary) > 1:
-        sorted_categories = category_summary.sort_values('total_amount', ascending=False)
-        second_highest = sorted_categories.iloc[1]['category']
+    if len(insights['category_distribution']) > 1:
+        second_highest = list(insights['category_distribution'])[1]
         st.info(f"**Cost-saving opportunity:** Consider consolidating purchases in {second_highest} category")
 
 def data_export_page():
     st.header("📤 Data Export")
     
-    if not st.session_state.processed_invoices:
+    store = get_invoice_store()
+    total_records = store.count() + store.duplicate_count()
+    if not total_records:
         st.warning("No invoice data available to export.")
         return
     
-    df = pd.DataFrame(st.session_state.processed_invoices)
-    
     st.subheader("Export Options")
+    st.write("Exports contain an invoices table and a line-items table linked by invoice id.")
+    
+    formats = available_formats()
+    export_format = st.radio(
+        "Format", formats, horizontal=True, format_func=lambda name: EXPORT_FORMATS[name]['label']
+    )
+    if 'xlsx' not in formats:
+        st.caption("Install openpyxl to enable Excel export.")
+    include_text = st.checkbox("Include raw extracted text", help="Adds the full OCR text of every invoice")
     
     col1, col2 = st.columns(2)
     
     with col1:
-        # CSV Export
-        csv = df.to_csv(index=False)
-        st.download_button(
-            label="📄 Download as CSV",
-            data=csv,
-            file_name=f"invoice_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-            mime="text/csv"
-        )
+        if st.button("📦 Prepare export"):
+            with st.spinner("Writing export..."):
+                prepare_export(store, export_format, include_text)
     
+    prepared = st.session_state.get('export_file')
     with col2:
-        # Excel Export (using CSV format as openpyxl might not be available)
-        st.download_button(
-            label="📊 Download as Excel (CSV)",
-            data=csv,
-            file_name=f"invoice_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
-            mime="application/vnd.ms-excel"
-        )
+        if prepared:
+            # The file is read once, by the download button; it was written in chunks
+            with open(prepared['path'], 'rb') as export_file:
+                st.download_button(
+                    label=f"⬇️ Download {EXPORT_FORMATS[prepared['format']]['label']}",
+                    data=export_file,
+                    file_name=prepared['file_name'],
+                    mime=EXPORT_FORMATS[prepared['format']]['mime'],
+                    on_click="ignore"
+                )
     
     # Preview data
     st.subheader("Data Preview")
-    st.dataframe(df, use_container_width=True)
+    with perf.stage('page.export_preview'):
+        preview_df = store.query_invoices(limit=TABLE_PAGE_SIZE)
+    st.dataframe(preview_df, use_container_width=True, column_config=invoice_column_config())
     
     # Export summary
     st.subheader("Export Summary")
     col1, col2, col3 = st.columns(3)
     
     with col1:
-        st.metric("Total Records", len(df))
+        st.metric("Total Records", total_records)
     
     with col2:
-        st.metric("Total Columns", len(df.columns))
+        st.metric("Total Columns", len(INVOICE_COLUMNS) + 1 + include_text)
     
     with col3:
-        file_size_mb = len(csv.encode('utf-8')) / (1024 * 1024)
-        st.metric("File Size", f"{file_size_mb:.2f} MB")
+        if prepared:
+            st.metric("File Size", f"{prepared['size'] / (1024 * 1024):.2f} MB")
+        else:
+            st.metric("File Size", "Not prepared")
+
+def prepare_export(store, export_format, include_text=False):
+    """Write an export to a temporary file in chunks and keep it for download"""
+    previous = st.session_state.pop('export_file', None)
+    if previous and os.path.exists(previous['path']):
+        os.remove(previous['path'])
+    
+    extension = EXPORT_FORMATS[export_format]['extension']
+    with tempfile.NamedTemporaryFile(prefix="invoice_export_", suffix=f".{extension}", delete=False) as export_file:
+        size = write_export(store, export_format, export_file, include_text=include_text)
+    
+    st.session_state.export_file = {
+        'path': export_file.name,
+        'format': export_format,
+        'file_name': f"invoice_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}",
+        'size': size
+    }
 
 def sample_data_page():
     st.header("📋 Sample Data & Testing")
@@ -261,17 +361,33 @@ def sample_data_page():
     
     if st.button("Load Sample Data"):
         sample_invoices = get_sample_data()
-        st.session_state.processed_invoices.extend(sample_invoices)
+        get_invoice_store().add_invoices(sample_invoices)
         st.success(f"✅ Loaded {len(sample_invoices)} sample invoices!")
         st.rerun()
     
+    # The store is shared by every session, so clearing it asks first
     if st.button("Clear All Data"):
-        st.session_state.processed_invoices = []
-        st.success("✅ All data cleared!")
+        st.session_state.confirm_clear = True
+    if st.session_state.get('confirm_clear'):
+        st.warning(f"This deletes all {get_invoice_store().count()} stored invoices, "
+                   "including those added from other sessions.")
+        confirm_col, cancel_col = st.columns(2)
+        if confirm_col.button("Delete all invoices", type="primary"):
+            get_invoice_store().clear()
+            st.session_state.confirm_clear = False
+            st.success("✅ All data cleared!")
+            st.rerun()
+        if cancel_col.button("Cancel"):
+            st.session_state.confirm_clear = False
+            st.rerun()
+    
+    if st.button("Clear OCR Cache"):
+        get_ocr_cache().clear()
+        st.success("✅ OCR cache cleared!")
         st.rerun()
     
     # Show current data count
-    st.metric("Current Invoice Count", len(st.session_state.processed_invoices))
+    st.metric("Current Invoice Count", get_invoice_store().count())
     
     # OCR Testing section
     st.subheader("🔧 OCR Testing")
@@ -292,7 +408,7 @@ def sample_data_page():
             if st.button("Extract Text", key="test_extract"):
                 with st.spinner("Processing..."):
                     try:
-                        extracted_text = process_image(image)
+                        extracted_text = extract_text_from_file_bytes(test_file.getvalue(), test_file.type)
                         st.text_area("OCR Result", extracted_text, height=300)
                         
                         # Show confidence/accuracy info
@@ -301,5 +417,73 @@ def sample_data_page():
                     except Exception as e:
                         st.error(f"OCR failed: {str(e)}")
 
+def performance_page():
+    st.header("⏱️ Performance")
+    
+    st.write("Per-stage timings of OCR, cleaning, analysis and table building. Extraction jobs run in "
+             "worker processes and report their timings back when they finish.")
+    
+    enabled = st.toggle("Record timings", value=perf.is_enabled(),
+                        help="Applies to every session of this server. Off, the hooks cost a flag check.")
+    if enabled and not perf.is_enabled():
+        perf.enable()
+    elif not enabled and perf.is_enabled():
+        perf.disable()
+    
+    if st.button("Reset timings"):
+        perf.reset()
+    
+    # Rolling per-stage percentiles
+    st.subheader("Stages")
+    summary = perf.stage_summary()
+    if summary:
+        stages_df = pd.DataFrame.from_dict(summary, orient='index')
+        stages_df.index.name = 'stage'
+        st.dataframe(stages_df, use_container_width=True, column_config={
+            'total_s': st.column_config.NumberColumn("total s", format="%.3f"),
+            'mean_ms': st.column_config.NumberColumn("mean ms", format="%.2f"),
+            'p50_ms': st.column_config.NumberColumn("p50 ms", format="%.2f"),
+            'p95_ms': st.column_config.NumberColumn("p95 ms", format="%.2f"),
+            'p99_ms': st.column_config.NumberColumn("p99 ms", format="%.2f"),
+        })
+        st.caption(f"Percentiles over the last {perf.HISTOGRAM_WINDOW} runs of each stage.")
+    else:
+        st.info("No timings recorded yet. Turn recording on and process some documents.")
+    
+    # Per-document breakdowns, one row per document and one column per stage in ms
+    documents = perf.recent_documents()
+    if documents:
+        st.subheader("Recent Documents")
+        documents_df = pd.DataFrame([
+            {'document': entry['document'], 'started': entry['started'], 'total': entry['total'] * 1000,
+             **{name: seconds * 1000 for name, seconds in entry['stages'].items()}}
+            for entry in documents
+        ])
+        st.dataframe(documents_df, use_container_width=True)
+        st.caption("Times in milliseconds.")
+    
+    # cProfile of a single document
+    st.subheader("Profile a Document")
+    profile_file = st.file_uploader("Document to profile", type=['png', 'jpg', 'jpeg', 'pdf'], key="profile_file")
+    if profile_file and st.button("Profile extraction"):
+        with st.spinner("Profiling..."):
+            def extract_and_analyze():
+                extracted_text = extract_text_from_file_bytes(profile_file.getvalue(), profile_file.type)
+                return build_invoice_record(extracted_text, profile_file.name) if extracted_text else None
+            _, dump, report = perf.profile(extract_and_analyze)
+        st.session_state.profile_result = {'name': profile_file.name, 'dump': dump, 'report': report}
+    
+    profiled = st.session_state.get('profile_result')
+    if profiled:
+        st.caption("A document already in the OCR cache is profiled as a cache hit.")
+        st.text(profiled['report'])
+        st.download_button(
+            label="⬇️ Download pstats dump",
+            data=profiled['dump'],
+            file_name=f"{os.path.splitext(profiled['name'])[0]}.pstats",
+            mime="application/octet-stream",
+            on_click="ignore"
+        )
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,752 @@
+"""
+Micro-benchmarks for the invoice extraction pipeline.
+
+Run a single benchmark with e.g. ``python benchmarks.py extraction``.
+"""
+import argparse
+import http.client
+import inspect
+import io
+import json
+import os
+import platform
+import random
+import re
+import resource
+import string
+import subprocess
+import sys
+import time
+import timeit
+import tracemalloc
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+import cv2
+import numpy as np
+import pandas as pd
+
+from analyzer import InvoiceAnalyzer, _FIELD_SEARCH_FLAGS, _FIELDS_ON_ORIGINAL_TEXT
+from date_normalizer import DateNormalizer, readings
+from invoice_store import InvoiceStore
+from keyword_automaton import KeywordAutomaton
+from ocr_backends import available_backends, create_backend, get_ocr_backend
+from ocr_utils import (OCR_CONFIG, clean_extracted_text, decode_grayscale, document_from_ocr_data,
+                       estimate_skew_angle, preprocess_image, read_pdf_text)
+from vendor_registry import VendorRegistry
+from sample_data import generate_random_invoice, get_sample_data, render_invoice_pages, render_invoice_pdf
+from service import create_server
+
+
+def _best_of(func, number, repeat):
+    """Return the best per-call time in microseconds"""
+    timings = timeit.repeat(func, number=number, repeat=repeat)
+    return min(timings) / number * 1e6
+
+
+def bench_extraction(number=200, repeat=5):
+    """
+    Compare the compiled field search with walking the raw pattern strings,
+    re-lowercasing the text for every field the way the extractors used to.
+    """
+    analyzer = InvoiceAnalyzer()
+    texts = [invoice['extracted_text'] for invoice in get_sample_data()]
+
+    def raw_cascade():
+        for text in texts:
+            for field, patterns in analyzer.patterns.items():
+                target = text if field in _FIELDS_ON_ORIGINAL_TEXT else text.lower()
+                for pattern in patterns:
+                    if re.search(pattern, target, _FIELD_SEARCH_FLAGS[field]):
+                        break
+
+    def compiled_engine():
+        for text in texts:
+            text_lower = text.lower()
+            for field in analyzer.patterns:
+                next(analyzer._search_field(field, text, text_lower), None)
+
+    def analyze():
+        for text in texts:
+            analyzer.analyze_invoice_text(text)
+
+    raw_us = _best_of(raw_cascade, number, repeat) / len(texts)
+    compiled_us = _best_of(compiled_engine, number, repeat) / len(texts)
+    analyze_us = _best_of(analyze, number, repeat) / len(texts)
+
+    print(f"Sample documents:        {len(texts)}")
+    print(f"Raw pattern cascade:     {raw_us:8.1f} us/doc")
+    print(f"Compiled field search:   {compiled_us:8.1f} us/doc")
+    print(f"Field search speedup:    {raw_us / compiled_us:8.2f}x")
+    print(f"analyze_invoice_text:    {analyze_us:8.1f} us/doc")
+
+
+def _synthetic_keywords(base_keywords, per_category, seed=0):
+    """Pad every category with random lowercase words up to per_category"""
+    rng = random.Random(seed)
+    padded = {}
+    for category, keywords in base_keywords.items():
+        keywords = list(keywords)
+        while len(keywords) < per_category:
+            length = rng.randint(4, 10)
+            keywords.append(''.join(rng.choice(string.ascii_lowercase) for _ in range(length)))
+        padded[category] = keywords
+    return padded
+
+
+def bench_categorize(sizes=(10, 50, 200, 1000), number=20, repeat=5):
+    """
+    Compare the keyword automaton with the per-keyword substring loop as the
+    number of keywords per category grows.
+    """
+    base_keywords = InvoiceAnalyzer().category_keywords
+    texts = [invoice['extracted_text'].lower() for invoice in get_sample_data()]
+
+    print(f"{'kw/category':>12} {'loop us/doc':>12} {'automaton us/doc':>17} {'speedup':>8} {'build ms':>9}")
+    for per_category in sizes:
+        keywords = _synthetic_keywords(base_keywords, per_category)
+
+        def loop():
+            for text_lower in texts:
+                for category, category_keywords in keywords.items():
+                    sum(1 for keyword in category_keywords if keyword in text_lower)
+
+        build_ms = _best_of(lambda: KeywordAutomaton(keywords), 1, repeat) / 1000
+        automaton = KeywordAutomaton(keywords)
+
+        def scan():
+            for text_lower in texts:
+                automaton.score(text_lower, text_lower)
+
+        loop_us = _best_of(loop, number, repeat) / len(texts)
+        scan_us = _best_of(scan, number, repeat) / len(texts)
+        print(f"{per_category:>12} {loop_us:>12.1f} {scan_us:>17.1f} {loop_us / scan_us:>7.2f}x {build_ms:>9.1f}")
+
+
+def _synthetic_scan(height, width, angle, seed=0):
+    """A white page of dark word-sized blocks on text lines, rotated by angle"""
+    rng = np.random.default_rng(seed)
+    page = np.full((height, width), 255, np.uint8)
+    line_height = max(8, height // 60)
+    for top in range(height // 15, height - height // 15, line_height * 2):
+        left = width // 12
+        while left < width - width // 6:
+            word_width = int(rng.integers(line_height * 2, line_height * 8))
+            cv2.rectangle(page, (left, top), (left + word_width, top + line_height), 0, -1)
+            left += word_width + line_height
+    matrix = cv2.getRotationMatrix2D((width // 2, height // 2), angle, 1.0)
+    return cv2.warpAffine(page, matrix, (width, height), borderValue=255)
+
+
+def _legacy_skew_angle(binary):
+    """The previous full-resolution minAreaRect estimate, for comparison"""
+    coords = np.column_stack(np.where(binary > 0))
+    angle = cv2.minAreaRect(coords)[-1]
+    return -(90 + angle) if angle < -45 else -angle
+
+
+def _measure(func, *args):
+    """Return (result, seconds, peak traced MB) for one call"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak / (1024 * 1024)
+
+
+def bench_skew(angle=3.0):
+    """
+    Time and peak memory of skew estimation on large synthetic scans, for the
+    previous full-resolution minAreaRect method and the thumbnail projection
+    profile. Memory is what tracemalloc sees, which covers numpy arrays
+    (including OpenCV outputs) but not OpenCV's internal buffers.
+    """
+    sizes = {
+        'A4 @ 300 dpi': (3508, 2480),
+        'A4 @ 600 dpi': (7016, 4960),
+        '12 MP photo': (4000, 3000),
+    }
+    print(f"True skew: {-angle:+.1f} degrees")
+    print(f"{'page':<14} {'method':<16} {'angle':>7} {'ms':>8} {'peak MB':>9}")
+    for name, (height, width) in sizes.items():
+        page = _synthetic_scan(height, width, angle)
+        for method, func in (('minAreaRect', _legacy_skew_angle), ('profile/thumb', estimate_skew_angle)):
+            found, elapsed, peak = _measure(func, page)
+            print(f"{name:<14} {method:<16} {found:>+7.2f} {elapsed * 1000:>8.1f} {peak:>9.1f}")
+
+
+def _synthetic_receipt(lines=25, seed=0):
+    """A receipt-sized page of random words rendered with OpenCV's font"""
+    rng = random.Random(seed)
+    page = np.full((60 + lines * 40, 900), 255, np.uint8)
+    for line in range(lines):
+        words = [''.join(rng.choice(string.ascii_uppercase) for _ in range(rng.randint(3, 9)))
+                 for _ in range(rng.randint(2, 5))]
+        text = ' '.join(words) + f" ${rng.uniform(1, 999):.2f}"
+        cv2.putText(page, text, (30, 60 + line * 40), cv2.FONT_HERSHEY_SIMPLEX, 0.9, 0, 2)
+    return page
+
+
+def bench_ocr_backends(pages=20):
+    """
+    Per-page latency and sequential throughput of each available OCR
+    backend on preprocessed synthetic receipts. The first call of each
+    backend (engine start-up) is reported separately.
+    """
+    images = [preprocess_image(_synthetic_receipt(seed=seed)) for seed in range(pages)]
+    print(f"{'backend':<12} {'first ms':>9} {'p50 ms':>8} {'p95 ms':>8} {'pages/s':>8}")
+    for name in ('tesserocr', 'pytesseract'):
+        if name not in available_backends():
+            print(f"{name:<12} not installed")
+            continue
+        backend = create_backend(name)
+        try:
+            _, first, _ = _measure(backend.image_to_data, images[0], OCR_CONFIG)
+        except Exception as e:
+            print(f"{name:<12} unavailable: {e}")
+            continue
+        latencies = []
+        start = time.perf_counter()
+        for image in images:
+            call_start = time.perf_counter()
+            backend.image_to_data(image, OCR_CONFIG)
+            latencies.append(time.perf_counter() - call_start)
+        elapsed = time.perf_counter() - start
+        p50, p95 = np.percentile(latencies, [50, 95]) * 1000
+        print(f"{name:<12} {first * 1000:>9.1f} {p50:>8.1f} {p95:>8.1f} {pages / elapsed:>8.2f}")
+
+
+def bench_invoice_table(sizes=(10_000, 100_000), page_size=100):
+    """
+    Memory and render cost of the dashboard table: the previous DataFrame
+    of invoice dicts with money formatted by an .at loop, against the typed
+    invoice table read from the store with formatting left to the browser.
+    Render time covers formatting plus Streamlit's Arrow serialization, for
+    the whole table and for one dashboard page.
+    """
+    from streamlit.dataframe_util import convert_pandas_df_to_arrow_bytes
+
+    display_cols = ['filename', 'invoice_number', 'date', 'vendor', 'category',
+                    'total_amount', 'tax_amount', 'processed_date']
+    random.seed(0)
+
+    def legacy_render(df):
+        display_df = df[display_cols].astype({'total_amount': object, 'tax_amount': object})
+        for idx in display_df.index:
+            display_df.at[idx, 'total_amount'] = f"${display_df.at[idx, 'total_amount']:.2f}"
+            display_df.at[idx, 'tax_amount'] = f"${display_df.at[idx, 'tax_amount']:.2f}"
+        return convert_pandas_df_to_arrow_bytes(display_df)
+
+    print(f"{'rows':>8} {'table':<8} {'MB':>8} {'render all ms':>14} {'render page ms':>15}")
+    for rows in sizes:
+        invoices = [generate_random_invoice() for _ in range(rows)]
+
+        legacy = pd.DataFrame(invoices)
+        legacy_mb = legacy.memory_usage(deep=True).sum() / (1024 * 1024)
+        _, legacy_all, _ = _measure(legacy_render, legacy)
+        _, legacy_page, _ = _measure(legacy_render, legacy.head(page_size))
+        print(f"{rows:>8} {'dicts':<8} {legacy_mb:>8.1f} {legacy_all * 1000:>14.1f} {legacy_page * 1000:>15.1f}")
+
+        store = InvoiceStore(':memory:')
+        store.add_invoices(invoices)
+        typed = store.query_invoices()
+        typed_mb = (typed.memory_usage(deep=True).sum()
+                    + store.query_line_items().memory_usage(deep=True).sum()) / (1024 * 1024)
+        _, typed_all, _ = _measure(lambda: convert_pandas_df_to_arrow_bytes(typed[display_cols]))
+        _, typed_page, _ = _measure(
+            lambda: convert_pandas_df_to_arrow_bytes(store.query_invoices(display_cols, limit=page_size))
+        )
+        print(f"{rows:>8} {'typed':<8} {typed_mb:>8.1f} {typed_all * 1000:>14.1f} {typed_page * 1000:>15.1f}")
+
+
+def _ocr_length_text(invoice, lines):
+    """The generator's short text padded with item lines, to a scanned invoice's length"""
+    words = ['Consulting', 'Hours', 'Licence', 'Support', 'Freight', 'Paper', 'Toner', 'Cable', 'Desk', 'Monitor']
+    body = [f"{random.randint(1, 20)} x {' '.join(random.sample(words, 3))} {random.choice(string.ascii_uppercase)}"
+            f"{random.randint(100, 999)} ${random.uniform(5, 500):,.2f}" for _ in range(lines)]
+    return '\n'.join([invoice['extracted_text']] + body + ["Thank you for your business. Payment due within 30 days."])
+
+
+def bench_text_storage(invoices=10_000, lines=40):
+    """
+    Memory per `invoices` invoices with the raw OCR text inline in every
+    record (as the store used to return them) against records that only
+    reference the compressed text, plus the text's size on disk both ways.
+    """
+    random.seed(0)
+    records = []
+    for _ in range(invoices):
+        invoice = generate_random_invoice()
+        invoice['extracted_text'] = _ocr_length_text(invoice, lines)
+        records.append(invoice)
+    store = InvoiceStore(':memory:')
+    store.add_invoices(records)
+
+    inline = pd.concat(list(store.iter_invoices(include_text=True)), ignore_index=True)
+    referenced = store.query_invoices()
+    inline_mb = inline.memory_usage(deep=True).sum() / (1024 * 1024)
+    referenced_mb = referenced.memory_usage(deep=True).sum() / (1024 * 1024)
+    raw_mb, stored_mb = (value / (1024 * 1024) for value in store._execute(
+        "SELECT SUM(size), SUM(length(data)) FROM raw_texts")[0])
+    _, load_s, _ = _measure(lambda: [store.get_extracted_text(i) for i in range(1, 1001)])
+    load_us = load_s * 1e6 / 1000
+
+    print(f"{invoices} invoices, {raw_mb * 1024 * 1024 / invoices:.0f} characters of text each")
+    print(f"{'':<22} {'inline text':>12} {'by reference':>13}")
+    print(f"{'invoice table MB':<22} {inline_mb:>12.1f} {referenced_mb:>13.1f}")
+    print(f"{'text on disk MB':<22} {raw_mb:>12.1f} {stored_mb:>13.1f}")
+    print(f"on-demand text load: {load_us:.0f} us per invoice")
+
+
+def _ocr_noise(text, rate):
+    """Misread about `rate` of the characters, as a rescan of the same page might"""
+    misreads = {'0': 'O', 'O': '0', '1': 'l', 'l': '1', '5': 'S', 'S': '5', 'e': 'c', 'm': 'rn', '.': ','}
+    return ''.join(misreads.get(char, random.choice(string.ascii_letters)) if random.random() < rate else char
+                   for char in text)
+
+
+def bench_duplicates(sizes=(1_000, 10_000, 50_000), probes=200, noise=0.02, lines=30):
+    """
+    Cost of the duplicate check at ingest as the store grows: adding new
+    invoices, exact resubmissions and rescans with OCR noise (a different
+    text, and an invoice number misread), and how many of each were flagged.
+    """
+    random.seed(0)
+
+    def invoices(count):
+        batch = []
+        for _ in range(count):
+            invoice = generate_random_invoice()
+            invoice['extracted_text'] = _ocr_length_text(invoice, lines)
+            batch.append(invoice)
+        return batch
+
+    print(f"{'stored':>8} {'kind':<10} {'us/add':>8} {'flagged':>8}")
+    for size in sizes:
+        store = InvoiceStore(':memory:')
+        stored = invoices(size)
+        for start in range(0, size, 5000):
+            store.add_invoices(stored[start:start + 5000])
+        rescans = []
+        for invoice in random.sample(stored, probes):
+            rescan = dict(invoice, extracted_text=_ocr_noise(invoice['extracted_text'], noise))
+            rescan['invoice_number'] = _ocr_noise(invoice['invoice_number'], 0.5)
+            rescans.append(rescan)
+        kinds = [('new', invoices(probes)), ('exact', random.sample(stored, probes)), ('rescan', rescans)]
+        for kind, batch in kinds:
+            start = time.perf_counter()
+            ids = [store.add_invoice(invoice) for invoice in batch]
+            elapsed = time.perf_counter() - start
+            flagged = sum(store.get_duplicate_of(invoice_id) is not None for invoice_id in ids)
+            print(f"{size:>8} {kind:<10} {elapsed / probes * 1e6:>8.0f} {flagged:>5}/{probes}")
+
+
+def bench_vendors(sizes=(1_000, 10_000, 50_000), lookups=2000, noise=0.05):
+    """
+    Vendor registry lookups as it grows: OCR-noised spellings of known
+    vendors (uncached, then cached) and unseen vendors, with how many noised
+    spellings found their own vendor and how many were merged into another.
+    """
+    random.seed(0)
+    words = [''.join(random.choices(string.ascii_lowercase, k=random.randint(4, 10))) for _ in range(5000)]
+    suffixes = ['Inc.', 'LLC', 'Co.', 'Corp', 'Ltd', 'Services', 'Solutions', 'Supply', '']
+
+    def vendor_name():
+        return f"{' '.join(random.sample(words, 2)).title()} {random.choice(suffixes)}".strip()
+
+    print(f"{'vendors':>8} {'noised us':>10} {'cached us':>10} {'unseen us':>10} {'found':>7} {'merged':>7}")
+    for size in sizes:
+        registry = VendorRegistry()
+        names = [registry.add(vendor_name()) for _ in range(size)]
+        known = random.choices(names, k=lookups)
+        noised = [_ocr_noise(name.upper() if random.random() < 0.5 else name, noise) for name in known]
+        unseen = [vendor_name() for _ in range(lookups)]
+        timings = []
+        for batch in (noised, noised, unseen):
+            start = time.perf_counter()
+            results = [registry.match(name) for name in batch]
+            timings.append(time.perf_counter() - start)
+            if batch is noised:
+                matches = results
+        noised_s, cached_s, unseen_s = timings
+        found = sum(match == name for match, name in zip(matches, known))
+        merged = sum(match is not None and match != name for match, name in zip(matches, known))
+        print(f"{size:>8} {noised_s / lookups * 1e6:>10.1f} {cached_s / lookups * 1e6:>10.2f} "
+              f"{unseen_s / lookups * 1e6:>10.1f} {found:>7} {merged:>7}")
+
+
+# Formats the analyzer used to try in turn, for comparison
+_LEGACY_DATE_FORMATS = ["%m/%d/%Y", "%m-%d-%Y", "%d/%m/%Y", "%d-%m-%Y", "%m/%d/%y", "%m-%d-%y", "%d/%m/%y", "%d-%m-%y",
+                        "%Y/%m/%d", "%Y-%m-%d"]
+
+
+def _legacy_parse_date(date_str):
+    for fmt in _LEGACY_DATE_FORMATS:
+        try:
+            return datetime.strptime(date_str, fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    return None
+
+
+def bench_dates(dates=20_000, vendors=200, distinct=2000):
+    """
+    Date normalization against the old strptime loop, on dates written by
+    vendors that each use one of month-first, day-first or year-first order:
+    time per date (with an empty and a warm cache) and how many ambiguous dates
+    came out as the vendor meant them.
+    """
+    random.seed(0)
+    formats = {'mdy': '%m/%d/%Y', 'dmy': '%d/%m/%Y', 'ymd': '%Y-%m-%d'}
+    vendor_orders = {f"Vendor {index} Ltd": random.choice(list(formats)) for index in range(vendors)}
+    days = [date(2023, 1, 1) + timedelta(days=random.randrange(730)) for _ in range(distinct)]
+    samples = []
+    for _ in range(dates):
+        vendor = random.choice(list(vendor_orders))
+        day = random.choice(days)
+        samples.append((vendor, day.strftime(formats[vendor_orders[vendor]]), day.isoformat()))
+
+    def legacy():
+        return [_legacy_parse_date(date_str) for _, date_str, _ in samples]
+
+    def normalized():
+        normalizer = DateNormalizer()
+        return [normalizer.normalize(date_str, vendor) for vendor, date_str, _ in samples]
+
+    ambiguous = [len(readings(date_str)) == 2 for _, date_str, _ in samples]
+    print(f"{'parser':>12} {'us/date':>8} {'correct':>8} {'ambiguous ok':>13}")
+    for name, func in (('strptime', legacy), ('cold cache', normalized), ('warm cache', normalized)):
+        if name == 'cold cache':
+            readings.cache_clear()
+        start = time.perf_counter()
+        results = func()
+        elapsed = time.perf_counter() - start
+        correct = [result == expected for result, (_, _, expected) in zip(results, samples)]
+        print(f"{name:>12} {elapsed / dates * 1e6:>8.2f} {sum(correct):>8} "
+              f"{sum(ok for ok, flag in zip(correct, ambiguous) if flag):>6}/{sum(ambiguous)}")
+
+
+# Fields scored against the generator's ground truth
+ACCURACY_FIELDS = ('invoice_number', 'date', 'vendor', 'total_amount', 'tax_amount', 'category')
+
+# Analyzer of each pipeline worker process, built on first use
+_pipeline_analyzer = None
+
+
+def _synthetic_documents(count, dpi, pages, skew, noise, blur, pdf_fraction, seed):
+    """Rendered random invoices: (kind, payload, ground truth) triples"""
+    random.seed(seed)
+    documents = []
+    for index in range(count):
+        invoice = generate_random_invoice()
+        truth = {field: invoice[field] for field in ACCURACY_FIELDS}
+        if index < round(count * pdf_fraction):
+            documents.append(('pdf', render_invoice_pdf(invoice, pages=pages), truth))
+        else:
+            angle = random.uniform(-skew, skew)
+            images = render_invoice_pages(invoice, dpi=dpi, pages=pages, skew=angle, noise=noise,
+                                          blur=blur, seed=seed + index)
+            documents.append(('image', [cv2.imencode('.png', image)[1].tobytes() for image in images], truth))
+    return documents
+
+
+def _run_pipeline_document(document):
+    """
+    Run one document through the uncached pipeline stage by stage and
+    return (timings in seconds per stage, extracted fields, error)
+    """
+    global _pipeline_analyzer
+    if _pipeline_analyzer is None:
+        _pipeline_analyzer = InvoiceAnalyzer()
+    kind, payload, _ = document
+    timings = {}
+
+    def timed(stage, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+        return result
+
+    try:
+        if kind == 'pdf':
+            raw_text = timed('pdf_text', read_pdf_text, io.BytesIO(payload))
+        else:
+            backend = get_ocr_backend()
+            page_texts = []
+            for page_bytes in payload:
+                gray = timed('decode', decode_grayscale, page_bytes)
+                processed = timed('preprocess', preprocess_image, gray)
+                data = timed('ocr', backend.image_to_data, processed, OCR_CONFIG)
+                page_texts.append(document_from_ocr_data(data)['text'])
+            raw_text = "\n".join(page_texts)
+        text = timed('clean', clean_extracted_text, raw_text)
+        fields = timed('analyze', _pipeline_analyzer.analyze_invoice_text, text)
+    except Exception as e:
+        return timings, None, f"{type(e).__name__}: {e}"
+    return timings, {field: fields.get(field) for field in ACCURACY_FIELDS}, None
+
+
+def _field_matches(field, expected, found):
+    if found is None:
+        return False
+    if field in ('total_amount', 'tax_amount'):
+        return abs(float(found) - float(expected)) < 0.005
+    return str(found).strip().lower() == str(expected).strip().lower()
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_pipeline(docs=20, workers=(1, 2, 4), output='pipeline_benchmark.json', dpi=150, pages=1,
+                   skew=2.0, noise=6.0, blur=0.6, pdf_fraction=0.25, seed=0):
+    """
+    End-to-end benchmark on rendered synthetic invoices (see
+    sample_data.render_invoice_pages / render_invoice_pdf), bypassing the
+    OCR cache. Reports per-stage latency, throughput per worker count, peak
+    RSS and field accuracy against the generator's ground truth, and writes
+    them all to a JSON file for comparison between versions.
+    """
+    documents = _synthetic_documents(docs, dpi, pages, skew, noise, blur, pdf_fraction, seed)
+    worker_counts = list(workers)
+
+    throughput = []
+    results = None
+    for count in worker_counts:
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=count) as pool:
+            run_results = list(pool.map(_run_pipeline_document, documents))
+        elapsed = time.perf_counter() - start
+        results = results or run_results
+        throughput.append({'workers': count, 'seconds': elapsed, 'docs_per_s': len(documents) / elapsed,
+                           'pages_per_s': len(documents) * pages / elapsed})
+
+    stage_samples = {}
+    for timings, _, _ in results:
+        for stage, seconds in timings.items():
+            stage_samples.setdefault(stage, []).append(seconds * 1000)
+    stages = {stage: {'count': len(samples), 'mean_ms': float(np.mean(samples)),
+                      'p50_ms': float(np.percentile(samples, 50)), 'p95_ms': float(np.percentile(samples, 95))}
+              for stage, samples in stage_samples.items()}
+
+    accuracy = {}
+    for field in ACCURACY_FIELDS:
+        matches = [_field_matches(field, document[2][field], fields.get(field))
+                   for document, (_, fields, _) in zip(documents, results) if fields is not None]
+        accuracy[field] = sum(matches) / len(documents)
+    errors = sorted({error for _, _, error in results if error})
+
+    report = {
+        'benchmark': 'pipeline',
+        'revision': _git_revision(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'ocr_backend': get_ocr_backend().name,
+        'config': {'docs': len(documents), 'dpi': dpi, 'pages': pages, 'skew': skew, 'noise': noise,
+                   'blur': blur, 'pdf_fraction': pdf_fraction, 'seed': seed},
+        'stages': stages,
+        'throughput': throughput,
+        # ru_maxrss is in KiB on Linux; children covers the pool workers
+        'peak_rss_mb': {'main': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                        'workers': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024},
+        'accuracy': accuracy,
+        'failed_documents': sum(1 for _, _, error in results if error),
+        'errors': errors,
+    }
+    with open(output, 'w', encoding='utf-8') as output_file:
+        json.dump(report, output_file, indent=2)
+
+    print(f"{'stage':<11} {'n':>5} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9}")
+    for stage, summary in stages.items():
+        print(f"{stage:<11} {summary['count']:>5} {summary['mean_ms']:>9.1f} {summary['p50_ms']:>9.1f} "
+              f"{summary['p95_ms']:>9.1f}")
+    for entry in throughput:
+        print(f"workers={entry['workers']:<3} {entry['docs_per_s']:>7.2f} docs/s {entry['pages_per_s']:>7.2f} pages/s")
+    print("accuracy: " + ", ".join(f"{field} {value:.0%}" for field, value in accuracy.items()))
+    print(f"peak RSS: main {report['peak_rss_mb']['main']:.0f} MB, workers {report['peak_rss_mb']['workers']:.0f} MB")
+    for error in errors:
+        print(f"error: {error}")
+    print(f"Wrote {output}")
+
+
+def _post(connection, path, body, content_type):
+    start = time.perf_counter()
+    connection.request('POST', path, body=body, headers={'Content-Type': content_type})
+    response = connection.getresponse()
+    response.read()
+    return response.status, time.perf_counter() - start
+
+
+def bench_service(requests=2000, concurrency=16, workers=2, pdfs=20):
+    """
+    Load-test the HTTP service in-process on a free local port: concurrent
+    /analyze requests (micro-batched by the service) and synchronous PDF
+    /extract requests, each client thread on its own keep-alive connection.
+    """
+    server = create_server(port=0, workers=workers, queue_size=concurrency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    local = threading.local()
+
+    def post(args):
+        if not hasattr(local, 'connection'):
+            local.connection = http.client.HTTPConnection(host, port, timeout=60)
+        return _post(local.connection, *args)
+
+    texts = [invoice['extracted_text'] for invoice in get_sample_data()]
+    analyze_bodies = [('/analyze', json.dumps({'text': texts[i % len(texts)]}).encode('utf-8'),
+                       'application/json')
+                      for i in range(requests)]
+    extract_bodies = [('/extract?filename=bench.pdf', render_invoice_pdf(generate_random_invoice()), 'application/pdf')
+                      for _ in range(pdfs)]
+    try:
+        for name, bodies in (('analyze', analyze_bodies), ('extract', extract_bodies)):
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as clients:
+                results = list(clients.map(post, bodies))
+            elapsed = time.perf_counter() - start
+            latencies = [seconds * 1000 for status, seconds in results if status == 200]
+            errors = len(results) - len(latencies)
+            percentiles = np.percentile(latencies, [50, 95, 99]) if latencies else [float('nan')] * 3
+            print(f"{name:<8} {len(bodies) / elapsed:>8.1f} req/s  p50 {percentiles[0]:.1f} ms  "
+                  f"p95 {percentiles[1]:.1f} ms  p99 {percentiles[2]:.1f} ms  non-200: {errors}")
+        connection = http.client.HTTPConnection(host, port, timeout=60)
+        connection.request('GET', '/metrics')
+        metrics = json.loads(connection.getresponse().read())
+        print(f"mean analyze batch: {metrics['batching']['mean_batch_size']:.1f} texts over "
+              f"{metrics['batching']['batches']} batches, rejected: {metrics['rejected']}")
+    finally:
+        server.shutdown()
+        server.server_close()
+        server.service.close()
+
+
+# Import-time budgets (ms, cumulative as reported by -X importtime) for the
+# modules that processes start from; `startup` fails when one is exceeded
+STARTUP_BUDGETS_MS = {
+    'analyzer': 60,
+    'invoice_store': 60,
+    'ocr_utils': 100,
+    'jobs': 150,
+    'cli': 150,
+    'service': 150,
+}
+# Budget for the first InvoiceAnalyzer() in a fresh process, in ms
+ANALYZER_INIT_BUDGET_MS = 50
+# Dependencies none of those modules may load at import time
+HEAVY_MODULES = ('cv2', 'numpy', 'pandas', 'PyPDF2', 'pytesseract', 'tesserocr', 'PIL', 'pyarrow', 'openpyxl',
+                 'streamlit')
+
+_STARTUP_PROBE = """
+import json, sys, time
+import {module}
+start = time.perf_counter()
+{init}
+init_ms = (time.perf_counter() - start) * 1000
+print(json.dumps({{'init_ms': init_ms, 'heavy': [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+
+def _import_time_ms(module, init=''):
+    """One fresh interpreter importing `module`: (import ms, probe result)"""
+    probe = _STARTUP_PROBE.format(module=module, init=init or 'pass', heavy=HEAVY_MODULES)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', probe], capture_output=True, text=True,
+                            check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    cumulative_us = None
+    for line in result.stderr.splitlines():
+        fields = line.split('|')
+        if len(fields) == 3 and fields[2].strip() == module:
+            cumulative_us = int(fields[1])
+    return cumulative_us / 1000, json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def bench_startup(runs=5):
+    """
+    Cold-start cost of each entry-point module, from `python -X importtime`
+    in fresh interpreters (best of `runs`), plus the first InvoiceAnalyzer()
+    construction. Exits with status 1 when a module goes over its entry in
+    STARTUP_BUDGETS_MS, the analyzer over ANALYZER_INIT_BUDGET_MS, or any of
+    them imports one of HEAVY_MODULES, so CI can run it as a check.
+    """
+    failures = []
+    print(f"{'module':<15} {'import ms':>10} {'budget':>8}  heavy modules loaded")
+    for module, budget in STARTUP_BUDGETS_MS.items():
+        samples = [_import_time_ms(module) for _ in range(runs)]
+        best = min(import_ms for import_ms, _ in samples)
+        heavy = samples[0][1]['heavy']
+        print(f"{module:<15} {best:>10.1f} {budget:>8}  {', '.join(heavy) or '-'}")
+        if best > budget:
+            failures.append(f"{module} imports in {best:.1f} ms, budget {budget} ms")
+        if heavy:
+            failures.append(f"{module} imports {', '.join(heavy)}")
+
+    init_ms = min(_import_time_ms('analyzer', 'analyzer.InvoiceAnalyzer()')[1]['init_ms'] for _ in range(runs))
+    print(f"first InvoiceAnalyzer(): {init_ms:.2f} ms (budget {ANALYZER_INIT_BUDGET_MS} ms)")
+    if init_ms > ANALYZER_INIT_BUDGET_MS:
+        failures.append(f"InvoiceAnalyzer() takes {init_ms:.2f} ms, budget {ANALYZER_INIT_BUDGET_MS} ms")
+
+    for failure in failures:
+        print(f"over budget: {failure}")
+    return 1 if failures else 0
+
+
+BENCHMARKS = {
+    'extraction': bench_extraction,
+    'categorize': bench_categorize,
+    'skew': bench_skew,
+    'ocr-backends': bench_ocr_backends,
+    'invoice-table': bench_invoice_table,
+    'text-storage': bench_text_storage,
+    'duplicates': bench_duplicates,
+    'vendors': bench_vendors,
+    'dates': bench_dates,
+    'pipeline': bench_pipeline,
+    'service': bench_service,
+    'startup': bench_startup,
+}
+
+
+def _parse_override(value, default):
+    """
+    Convert a --set value to the type of the parameter's default: ints,
+    floats and booleans, or tuples of those given as comma-separated lists
+    """
+    if isinstance(default, (tuple, list)):
+        return tuple(_parse_override(item, default[0] if default else '') for item in value.split(','))
+    if isinstance(default, bool):
+        if value.lower() not in ('1', '0', 'true', 'false', 'yes', 'no'):
+            raise ValueError(f"expected a boolean, got {value!r}")
+        return value.lower() in ('1', 'true', 'yes')
+    if isinstance(default, (int, float)):
+        return type(default)(value)
+    return value
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Invoice extraction micro-benchmarks")
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS), help="Benchmark to run")
+    parser.add_argument('--set', action='append', default=[], metavar='NAME=VALUE',
+                        help="Override a benchmark parameter, e.g. --set docs=50 --set workers=1,4")
+    args = parser.parse_args()
+    benchmark = BENCHMARKS[args.benchmark]
+    overrides = dict(option.split('=', 1) for option in args.set)
+    parameters = inspect.signature(benchmark).parameters
+    unknown = set(overrides) - set(parameters)
+    if unknown:
+        parser.error(f"{args.benchmark} has no parameter(s) {', '.join(sorted(unknown))}")
+    try:
+        overrides = {name: _parse_override(value, parameters[name].default) for name, value in overrides.items()}
+    except ValueError as e:
+        parser.error(f"invalid --set value: {e}")
+    return benchmark(**overrides)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,250 @@
+"""
+Headless batch processing of invoice files.
+
+    python cli.py run invoices/ scans/*.jpg --workers 4 --out invoices.db
+
+Every file is OCR'd (or its PDF text extracted) and analyzed in a pool of
+worker processes, and the results are added to the invoice store. A
+manifest of completed file hashes is kept next to the store, so running
+the same command again after an interruption skips the files that are
+already done.
+"""
+import argparse
+import glob
+import io
+import json
+import logging
+import os
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from datetime import datetime
+
+from invoice_store import DEFAULT_STORE_PATH, InvoiceStore
+from jobs import extract_file, init_worker
+from lazy_imports import lazy_import
+from ocr_cache import content_digest
+from ocr_utils import FILE_TYPES
+
+PyPDF2 = lazy_import('PyPDF2')
+
+
+def find_files(inputs):
+    """Expand directories (recursively) and glob patterns into supported files, in order"""
+    paths = []
+    for entry in inputs:
+        if os.path.isdir(entry):
+            for root, dirs, files in os.walk(entry):
+                dirs.sort()
+                paths.extend(os.path.join(root, name) for name in sorted(files))
+        elif os.path.exists(entry):
+            paths.append(entry)
+        else:
+            paths.extend(sorted(glob.glob(entry, recursive=True)))
+    seen = set()
+    found = []
+    for path in paths:
+        if os.path.splitext(path)[1].lower() in FILE_TYPES and path not in seen:
+            seen.add(path)
+            found.append(path)
+    return found
+
+
+class Manifest:
+    """
+    Append-only JSON Lines record of processed files, keyed by content
+    hash. Only successful files count as completed; failed ones are
+    retried on the next run.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.completed = set()
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as manifest_file:
+                for line in manifest_file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A run killed mid-write can leave a partial last line
+                        continue
+                    if entry.get('status') == 'ok':
+                        self.completed.add(entry['digest'])
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def record(self, digest, path, status, **details):
+        entry = {'digest': digest, 'path': path, 'status': status,
+                 'time': datetime.now().strftime("%Y-%m-%d %H:%M:%S"), **details}
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        if status == 'ok':
+            self.completed.add(digest)
+
+    def close(self):
+        self._file.close()
+
+
+def _count_pages(file_bytes, file_type):
+    if file_type != 'application/pdf':
+        return 1
+    try:
+        return len(PyPDF2.PdfReader(io.BytesIO(file_bytes)).pages)
+    except Exception:
+        return 1
+
+
+class RunStats:
+    """Counters and per-stage timings for the end-of-run report"""
+
+    def __init__(self):
+        self.ok = 0
+        self.skipped = 0
+        self.duplicates = 0
+        self.pages = 0
+        self.failures = []
+        self.stage_seconds = defaultdict(float)
+        self.stage_counts = defaultdict(int)
+        self.start = time.perf_counter()
+
+    def add_timings(self, timings):
+        for stage, seconds in timings.items():
+            self.stage_seconds[stage] += seconds
+            self.stage_counts[stage] += 1
+
+    def report(self, out=None):
+        # Looked up per call, so a replaced sys.stdout is honoured
+        out = out or sys.stdout
+        elapsed = time.perf_counter() - self.start
+        processed = self.ok + len(self.failures)
+        print(f"Processed {processed} files ({self.ok} ok, {len(self.failures)} failed, "
+              f"{self.skipped} already done) in {elapsed:.1f} s", file=out)
+        if self.duplicates:
+            print(f"{self.duplicates} were duplicates of stored invoices and are left out of totals", file=out)
+        if processed:
+            print(f"Throughput: {processed / elapsed:.2f} files/s, {self.pages / elapsed:.2f} pages/s", file=out)
+        if self.stage_counts:
+            print(f"{'stage':<10} {'total s':>9} {'mean ms':>9}", file=out)
+            for stage in ('read', 'extract', 'analyze', 'store'):
+                if self.stage_counts[stage]:
+                    total = self.stage_seconds[stage]
+                    mean_ms = total / self.stage_counts[stage] * 1000
+                    print(f"{stage:<10} {total:>9.2f} {mean_ms:>9.1f}", file=out)
+        if self.failures:
+            print("Failures:", file=out)
+            for path, reason in self.failures:
+                print(f"  {path}: {reason}", file=out)
+
+
+def run(args):
+    paths = find_files(args.inputs)
+    if not paths:
+        print("No PDF or image files found", file=sys.stderr)
+        return 2
+
+    store = InvoiceStore(args.out)
+    manifest = Manifest(args.manifest or f"{args.out}.manifest.jsonl")
+    stats = RunStats()
+    workers = args.workers or os.cpu_count() or 1
+
+    def pending_files():
+        """(path, digest, bytes, type) for each file not completed yet"""
+        for path in paths:
+            start = time.perf_counter()
+            try:
+                with open(path, 'rb') as input_file:
+                    file_bytes = input_file.read()
+            except OSError as e:
+                stats.failures.append((path, str(e)))
+                continue
+            digest = content_digest(file_bytes)
+            stats.add_timings({'read': time.perf_counter() - start})
+            if digest in manifest.completed:
+                stats.skipped += 1
+                continue
+            yield path, digest, file_bytes, FILE_TYPES[os.path.splitext(path)[1].lower()]
+
+    def fail(path, digest, error):
+        stats.failures.append((path, error))
+        manifest.record(digest, path, 'failed', error=error)
+
+    def finish(path, digest, pages, future):
+        try:
+            invoice_data, breakdown = future.result()
+        except Exception as e:
+            fail(path, digest, str(e))
+            return
+        stats.add_timings({stage: seconds for stage, seconds in breakdown['stages'].items()
+                           if stage in ('extract', 'analyze')})
+        if invoice_data is None:
+            fail(path, digest, "no text extracted")
+            return
+        stats.pages += pages
+        start = time.perf_counter()
+        invoice_data['filename'] = os.path.basename(path)
+        invoice_data['processed_date'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        try:
+            invoice_id = store.add_invoice(invoice_data)
+            duplicate_of = store.get_duplicate_of(invoice_id)
+        except Exception as e:
+            # One record the store rejects must not end the whole run
+            fail(path, digest, f"could not save invoice ({e})")
+            return
+        stats.add_timings({'store': time.perf_counter() - start})
+        # Recorded only after the invoice is committed, so an interrupted
+        # run can at worst redo the file it was storing
+        manifest.record(digest, path, 'ok', invoice_id=invoice_id, duplicate_of=duplicate_of)
+        stats.ok += 1
+        stats.duplicates += duplicate_of is not None
+        if args.verbose:
+            duplicate = f" (duplicate of invoice {duplicate_of})" if duplicate_of is not None else ""
+            print(f"{path}: {invoice_data['vendor']} ${invoice_data['total_amount']:.2f}{duplicate}")
+
+    # Keep a bounded number of files in flight so file contents are not all
+    # held in memory at once
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=init_worker)
+    in_flight = {}
+    try:
+        for path, digest, file_bytes, file_type in pending_files():
+            if len(in_flight) >= workers * 2:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    finish(*in_flight.pop(future), future)
+            # Timed, for the per-stage report
+            future = pool.submit(extract_file, file_bytes, file_type, os.path.basename(path), args.header_only, True)
+            # Pages are counted here, while the file's contents are at hand
+            in_flight[future] = (path, digest, _count_pages(file_bytes, file_type))
+        for future in as_completed(list(in_flight)):
+            finish(*in_flight.pop(future), future)
+    except KeyboardInterrupt:
+        print("Interrupted; run the same command again to resume", file=sys.stderr)
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+        manifest.close()
+        stats.report()
+    return 1 if stats.failures else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='invoice-extract', description="Batch invoice extraction")
+    subcommands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subcommands.add_parser('run', help="Extract and store every invoice under the given paths")
+    run_parser.add_argument('inputs', nargs='+', help="Files, directories or glob patterns")
+    run_parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+    run_parser.add_argument('--out', default=DEFAULT_STORE_PATH, help="Invoice store to add results to")
+    run_parser.add_argument('--manifest', default=None,
+                            help="Manifest of completed files (default: <out>.manifest.jsonl)")
+    run_parser.add_argument('--header-only', action='store_true',
+                            help="OCR only header and totals where possible; line items may be missing")
+    run_parser.add_argument('--verbose', '-v', action='store_true', help="Print each stored invoice")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s %(name)s: %(message)s")
+    if args.command == 'run':
+        return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
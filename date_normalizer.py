@@ -0,0 +1,154 @@
+"""
+Normalization of extracted invoice dates to YYYY-MM-DD.
+
+A date string is classified by one compiled pattern whose named
+alternatives (year first, numeric, month name first, day first with a
+month name) select the parser to use, instead of trying a list of
+strptime formats and catching the failures. The possible readings of each
+distinct string are memoized.
+
+Numeric dates such as 03/04/2024 read both ways. DateNormalizer resolves
+them by the order each vendor's unambiguous dates (like 25/03/2024) have
+used so far, falling back to DEFAULT_ORDER, so one vendor's ambiguous
+dates are read consistently.
+
+That makes a DateNormalizer stateful: how an ambiguous date is read
+depends on what the same normalizer saw before it, so the same document
+can come out differently early and late in a run, or in different worker
+processes. Dates that read only one way (25/03/2024, 2024-03-25,
+March 25, 2024) never depend on that history.
+"""
+import functools
+import re
+from collections import Counter
+from datetime import date
+
+from vendor_registry import vendor_key
+
+# Distinct date strings whose readings are remembered
+DATE_CACHE_SIZE = 65536
+# Order of ambiguous numeric dates for vendors without enough evidence;
+# month first, as the analyzer has always read them
+DEFAULT_ORDER = 'mdy'
+# Unambiguous numeric dates a vendor needs before its dominant order is used
+MIN_VENDOR_EVIDENCE = 2
+# Two-digit years up to this one are 20xx, later ones 19xx (as strptime's %y)
+TWO_DIGIT_YEAR_PIVOT = 68
+
+MONTHS = {
+    'jan': 1, 'january': 1, 'feb': 2, 'february': 2, 'mar': 3, 'march': 3, 'apr': 4, 'april': 4,
+    'may': 5, 'jun': 6, 'june': 6, 'jul': 7, 'july': 7, 'aug': 8, 'august': 8,
+    'sep': 9, 'sept': 9, 'september': 9, 'oct': 10, 'october': 10, 'nov': 11, 'november': 11,
+    'dec': 12, 'december': 12,
+}
+# Month names as a regex alternative, longest first so 'sept' wins over 'sep'
+MONTH_PATTERN = '|'.join(sorted(MONTHS, key=len, reverse=True))
+
+_ORDINAL = r'(?:st|nd|rd|th)?'
+# One alternative per way of writing a date; the group names select the reader
+_DATE_SOURCE = (
+    r'(?P<ymd>(?P<ymd_year>\d{4})[/\-.](?P<ymd_month>\d{1,2})[/\-.](?P<ymd_day>\d{1,2}))'
+    r'|(?P<numeric>(?P<first>\d{1,2})[/\-.](?P<second>\d{1,2})[/\-.](?P<year>\d{4}|\d{2}))'
+    rf'|(?P<month_name>(?P<mn_month>{MONTH_PATTERN})\.?\s+(?P<mn_day>\d{{1,2}}){_ORDINAL},?\s+(?P<mn_year>\d{{4}}))'
+    rf'|(?P<day_month_name>(?P<dm_day>\d{{1,2}}){_ORDINAL}\s+(?:of\s+)?(?P<dm_month>{MONTH_PATTERN})\.?,?\s+'
+    r'(?P<dm_year>\d{4}))'
+)
+_DATE_RE = re.compile(_DATE_SOURCE, re.IGNORECASE)
+# Any supported date, without groups, for embedding in extraction patterns
+DATE_PATTERN = re.sub(r'\?P<\w+>', '?:', _DATE_SOURCE)
+# Dates written with a month name, likewise
+TEXT_DATE_PATTERN = re.sub(r'\?P<\w+>', '?:', _DATE_SOURCE[_DATE_SOURCE.index('|(?P<month_name>') + 1:])
+
+
+def _iso(year, month, day):
+    try:
+        return date(year, month, day).isoformat()
+    except ValueError:
+        return None
+
+
+def _year(digits):
+    year = int(digits)
+    if len(digits) == 2:
+        year += 2000 if year <= TWO_DIGIT_YEAR_PIVOT else 1900
+    return year
+
+
+def _read_ymd(match):
+    return (('ymd', _iso(int(match['ymd_year']), int(match['ymd_month']), int(match['ymd_day']))),)
+
+
+def _read_numeric(match):
+    first, second, year = int(match['first']), int(match['second']), _year(match['year'])
+    return (('mdy', _iso(year, first, second)), ('dmy', _iso(year, second, first)))
+
+
+def _read_month_name(match):
+    return ((None, _iso(int(match['mn_year']), MONTHS[match['mn_month'].lower()], int(match['mn_day']))),)
+
+
+def _read_day_month_name(match):
+    return ((None, _iso(int(match['dm_year']), MONTHS[match['dm_month'].lower()], int(match['dm_day']))),)
+
+
+# Parser for each alternative of _DATE_RE
+_READERS = {
+    'ymd': _read_ymd,
+    'numeric': _read_numeric,
+    'month_name': _read_month_name,
+    'day_month_name': _read_day_month_name,
+}
+
+
+@functools.lru_cache(maxsize=DATE_CACHE_SIZE)
+def readings(date_str):
+    """
+    Valid (order, YYYY-MM-DD) readings of a date string: none if it is not
+    a date, two for an ambiguous numeric date, otherwise one. The order is
+    'ymd', 'mdy' or 'dmy', or None when the date does not show one (month
+    names, or equal day and month).
+    """
+    match = _DATE_RE.fullmatch(date_str.strip())
+    if match is None:
+        return ()
+    found = tuple((order, iso) for order, iso in _READERS[match.lastgroup](match) if iso is not None)
+    if len(found) == 2 and found[0][1] == found[1][1]:
+        # Same day and month (03/03/2024): not ambiguous, but says nothing about order
+        return ((None, found[0][1]),)
+    return found
+
+
+class DateNormalizer:
+    """
+    Normalizes extracted dates, learning each vendor's day/month order from
+    its unambiguous numeric dates. Vendors are told apart by vendor_key, so
+    OCR variants of a name share what was learned.
+    """
+
+    def __init__(self):
+        self._vendor_orders = {}
+
+    def normalize(self, date_str, vendor=None, learn=True):
+        """
+        date_str as YYYY-MM-DD, or None if it is not a valid date. With
+        learn=False an unambiguous date is not recorded for the vendor.
+        """
+        found = readings(date_str)
+        if len(found) == 2:
+            chosen = self.vendor_order(vendor)
+            return next(iso for order, iso in found if order == chosen)
+        if not found:
+            return None
+        order, iso = found[0]
+        key = vendor_key(vendor)
+        if learn and order in ('mdy', 'dmy') and key:
+            # Only one order gives a valid date, e.g. 25/03/2024
+            self._vendor_orders.setdefault(key, Counter())[order] += 1
+        return iso
+
+    def vendor_order(self, vendor):
+        """'mdy' or 'dmy': the order a vendor's ambiguous dates are read in"""
+        counts = self._vendor_orders.get(vendor_key(vendor))
+        if not counts or sum(counts.values()) < MIN_VENDOR_EVIDENCE:
+            return DEFAULT_ORDER
+        return 'dmy' if counts['dmy'] > counts['mdy'] else 'mdy'
@@ -0,0 +1,137 @@
+"""
+Duplicate invoice detection.
+
+An invoice is an exact duplicate of an earlier one when their normalized
+(vendor, invoice number, total, date) tuples hash to the same key. It is a
+near duplicate (the same paper rescanned, with different OCR noise) when
+the character shingles of their extracted texts overlap by at least
+NEAR_DUPLICATE_SIMILARITY and the two still agree on the total or the
+invoice number; the second condition keeps templated invoices, such as a
+monthly bill that differs only in its figures, apart.
+
+Near duplicates are found with MinHash and locality-sensitive hashing: a
+text's MinHash signature is cut into LSH_BANDS bands and each band is
+hashed to a key. Texts sharing any band key are candidates, which the
+store finds through an index on the keys and then compares exactly, so a
+lookup costs a few index probes however many invoices are stored.
+"""
+import functools
+import hashlib
+import random
+import re
+import zlib
+
+from lazy_imports import lazy_import
+from ocr_cache import content_digest
+
+# Only needed to compute signatures; loaded on first use
+np = lazy_import('numpy')
+
+# Characters per shingle; short enough that one misread character only
+# changes a handful of shingles
+SHINGLE_SIZE = 4
+# Shingle-set Jaccard similarity at or above which a later invoice may be
+# a near duplicate of an earlier one. Simulated rescans with 2% misread
+# characters stay above it; different invoices from one vendor stay well
+# below it once texts are a few hundred characters long
+NEAR_DUPLICATE_SIMILARITY = 0.7
+# Signature length is LSH_BANDS * LSH_ROWS. Texts that are 70% similar
+# share at least one band with probability 1 - (1 - 0.7^4)^16, about 99%;
+# texts that are 30% similar about 12% of the time
+LSH_BANDS = 16
+LSH_ROWS = 4
+# Texts with fewer shingles are too short to compare meaningfully
+MIN_SHINGLES = 20
+# Candidates compared per lookup, those sharing the most bands first
+MAX_CANDIDATES = 20
+# Shingles hashed at once when computing a signature, which bounds the
+# temporary arrays to LSH_BANDS * LSH_ROWS * MINHASH_CHUNK * 8 bytes (2 MB)
+MINHASH_CHUNK = 4096
+
+# Values the analyzer uses for fields it could not find, as _normalized
+# leaves them
+_MISSING = {'', 'notfound', 'unknown'}
+_NON_ALNUM = re.compile(r'[^0-9a-z]+')
+_WHITESPACE = re.compile(r'\s+')
+# Characters OCR commonly confuses are folded together before shingling
+_OCR_CONFUSABLES = str.maketrans({'0': 'o', '1': 'l', '5': 's', '8': 'b', ',': '.'})
+
+
+def _normalized(value):
+    return _NON_ALNUM.sub('', str(value or '').lower())
+
+
+def exact_key(invoice_data):
+    """
+    Hash of the normalized (vendor, invoice number, total, date) tuple, or
+    None when the invoice number is missing and the tuple identifies nothing.
+    The canonical vendor is used when the invoice has one.
+    """
+    invoice_number = _normalized(invoice_data.get('invoice_number'))
+    if invoice_number in _MISSING:
+        return None
+    parts = (
+        _normalized(invoice_data.get('canonical_vendor') or invoice_data.get('vendor')),
+        invoice_number,
+        f"{float(invoice_data.get('total_amount') or 0):.2f}",
+        str(invoice_data.get('date') or '').strip(),
+    )
+    return content_digest('\0'.join(parts).encode('utf-8'))
+
+
+def shingles(text):
+    """
+    Set of SHINGLE_SIZE-character substrings of the text, with case, runs
+    of whitespace and commonly misread characters folded
+    """
+    text = _WHITESPACE.sub(' ', text.lower()).strip().translate(_OCR_CONFUSABLES).replace('rn', 'm')
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def fields_agree(invoice_data, other):
+    """Whether two invoices have the same total or the same invoice number"""
+    if f"{float(invoice_data.get('total_amount') or 0):.2f}" == f"{float(other.get('total_amount') or 0):.2f}":
+        return True
+    invoice_number = _normalized(invoice_data.get('invoice_number'))
+    return invoice_number not in _MISSING and invoice_number == _normalized(other.get('invoice_number'))
+
+
+def similarity(shingles_a, shingles_b):
+    """Jaccard similarity of two shingle sets"""
+    if not shingles_a or not shingles_b:
+        return 0.0
+    return len(shingles_a & shingles_b) / len(shingles_a | shingles_b)
+
+
+@functools.lru_cache(maxsize=None)
+def _hash_family():
+    # Multiply-shift hashes ((a * x + b) mod 2^64) >> 32 with odd a, one per
+    # signature row; seeded so signatures are comparable across processes
+    generator = random.Random(0x5EED)
+    count = LSH_BANDS * LSH_ROWS
+    a = np.array([generator.getrandbits(64) | 1 for _ in range(count)], dtype=np.uint64)
+    b = np.array([generator.getrandbits(64) for _ in range(count)], dtype=np.uint64)
+    return a[:, None], b[:, None]
+
+
+def minhash(shingle_set):
+    """MinHash signature of a shingle set, as a uint64 array"""
+    a, b = _hash_family()
+    hashes = np.fromiter((zlib.crc32(shingle.encode('utf-8')) for shingle in shingle_set),
+                         dtype=np.uint64, count=len(shingle_set))
+    signature = np.full(a.shape[0], np.iinfo(np.uint64).max, dtype=np.uint64)
+    for start in range(0, len(hashes), MINHASH_CHUNK):
+        chunk = hashes[start:start + MINHASH_CHUNK]
+        # uint64 arithmetic wraps, which is the mod 2^64
+        np.minimum(signature, ((a * chunk + b) >> np.uint64(32)).min(axis=1), out=signature)
+    return signature
+
+
+def lsh_keys(signature):
+    """One signed 64-bit key per band of a signature, distinct across bands"""
+    keys = []
+    for band in range(LSH_BANDS):
+        rows = signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]
+        digest = hashlib.blake2b(bytes([band]) + rows.tobytes(), digest_size=8).digest()
+        keys.append(int.from_bytes(digest, 'little', signed=True))
+    return keys
@@ -0,0 +1,164 @@
+"""
+Streaming exports of the invoice store.
+
+Every export contains two normalized tables: one row per invoice, and one
+row per line item keyed by invoice_id. Both are read from the store in
+chunks and written straight to a binary file object, so neither the
+tables nor the encoded file are ever held in memory as a whole.
+
+- csv: a zip archive holding invoices.csv and line_items.csv
+- xlsx: an Excel workbook with an Invoices and a Line Items sheet (needs
+  the optional openpyxl package)
+- parquet: a zip archive holding invoices.parquet and line_items.parquet
+
+Raw OCR text is left out unless asked for; it is by far the largest
+column and is read from the store's compressed text table chunk by chunk.
+"""
+import io
+import zipfile
+
+from invoice_store import INVOICE_COLUMNS, TEXT_COLUMN, invoice_frame, line_item_frame
+from lazy_imports import lazy_import
+
+# Loaded when an export is written; the optional ones are None when missing
+pd = lazy_import('pandas')
+openpyxl = lazy_import('openpyxl', optional=True)
+_openpyxl_cell = lazy_import('openpyxl.cell.cell', optional=True)
+pa = lazy_import('pyarrow', optional=True)
+pq = lazy_import('pyarrow.parquet', optional=True)
+
+EXPORT_CHUNKSIZE = 5000
+
+EXPORT_FORMATS = {
+    'csv': {'label': "CSV (zip)", 'extension': 'zip', 'mime': 'application/zip'},
+    'xlsx': {'label': "Excel", 'extension': 'xlsx',
+             'mime': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'},
+    'parquet': {'label': "Parquet (zip)", 'extension': 'zip', 'mime': 'application/zip'},
+}
+
+# Excel's per-sheet row limit (including the header) and per-cell text limit
+_XLSX_MAX_ROWS = 1048576
+_XLSX_MAX_CELL_CHARS = 32767
+
+
+def available_formats():
+    """Names of the export formats that can be written in this environment"""
+    names = ['csv']
+    if openpyxl is not None:
+        names.append('xlsx')
+    if pa is not None:
+        names.append('parquet')
+    return names
+
+
+def _tables(store, columns, chunksize, include_text):
+    """
+    (name, sheet title, chunks) for each exported table. Chunks always
+    include at least one, possibly empty, table so every writer emits the
+    header even when the store is empty.
+    """
+    columns = columns or ['id'] + INVOICE_COLUMNS
+    empty = invoice_frame([], columns + [TEXT_COLUMN] if include_text else columns)
+    return [
+        ('invoices', 'Invoices', _at_least_one(store.iter_invoices(columns, chunksize, include_text), empty)),
+        ('line_items', 'Line Items', _at_least_one(store.iter_line_items(chunksize * 4), line_item_frame([]))),
+    ]
+
+
+def _at_least_one(chunks, empty):
+    first = next(chunks, None)
+    yield empty if first is None else first
+    yield from chunks
+
+
+def _write_csv(tables, fileobj):
+    with zipfile.ZipFile(fileobj, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, _, chunks in tables:
+            with archive.open(f"{name}.csv", 'w') as raw:
+                text = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+                for index, chunk in enumerate(chunks):
+                    chunk.to_csv(text, header=index == 0, index=False)
+                text.flush()
+                text.detach()
+
+
+def _xlsx_cell(value):
+    if value is None or value is pd.NaT or value is pd.NA or (isinstance(value, float) and value != value):
+        return None
+    if isinstance(value, str):
+        # OCR text can contain control characters that are invalid in XML
+        return _openpyxl_cell.ILLEGAL_CHARACTERS_RE.sub('', value)[:_XLSX_MAX_CELL_CHARS]
+    return value
+
+
+def _write_xlsx(tables, fileobj):
+    # Write-only workbooks stream rows to disk instead of keeping cell objects
+    workbook = openpyxl.Workbook(write_only=True)
+    for _, title, chunks in tables:
+        sheets = []
+        sheet_rows = 0
+        for chunk in chunks:
+            if not sheets:
+                sheets.append(workbook.create_sheet(title))
+                sheets[-1].append(list(chunk.columns))
+                sheet_rows = 1
+            for row in chunk.itertuples(index=False):
+                if sheet_rows == _XLSX_MAX_ROWS:
+                    # Continue on a new sheet once Excel's row limit is reached
+                    sheets.append(workbook.create_sheet(f"{title} ({len(sheets) + 1})"))
+                    sheets[-1].append(list(chunk.columns))
+                    sheet_rows = 1
+                sheets[-1].append([_xlsx_cell(value) for value in row])
+                sheet_rows += 1
+    workbook.save(fileobj)
+
+
+def _parquet_schema(chunk):
+    """
+    Fixed Arrow schema for a table, so every chunk is written with the same
+    types whatever its contents (categorical index widths vary by chunk)
+    """
+    fields = []
+    for column, dtype in chunk.dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype):
+            arrow_type = pa.dictionary(pa.int32(), pa.string())
+        elif pd.api.types.is_datetime64_any_dtype(dtype):
+            arrow_type = pa.timestamp('us')
+        elif pd.api.types.is_float_dtype(dtype):
+            arrow_type = pa.float64()
+        elif pd.api.types.is_integer_dtype(dtype):
+            arrow_type = pa.int64()
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(column, arrow_type))
+    return pa.schema(fields)
+
+
+def _write_parquet(tables, fileobj):
+    # Parquet pages are already compressed, so the archive only stores them
+    with zipfile.ZipFile(fileobj, 'w', zipfile.ZIP_STORED) as archive:
+        for name, _, chunks in tables:
+            with archive.open(f"{name}.parquet", 'w') as raw:
+                writer = None
+                for chunk in chunks:
+                    if writer is None:
+                        schema = _parquet_schema(chunk)
+                        writer = pq.ParquetWriter(raw, schema, compression='zstd')
+                    writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+                writer.close()
+
+
+_WRITERS = {'csv': _write_csv, 'xlsx': _write_xlsx, 'parquet': _write_parquet}
+
+
+def write_export(store, export_format, fileobj, columns=None, chunksize=EXPORT_CHUNKSIZE, include_text=False):
+    """
+    Write the store's invoices and line items to a binary file object in
+    the given format and return the number of bytes written. The raw
+    extracted text is added to the invoices only with include_text.
+    """
+    if export_format not in available_formats():
+        raise ValueError(f"Export format not available: {export_format}")
+    start = fileobj.tell()
+    _WRITERS[export_format](_tables(store, columns, chunksize, include_text), fileobj)
+    return fileobj.tell() - start
@@ -0,0 +1,845 @@
+"""
+Persistent invoice storage backed by SQLite.
+
+Invoices live in an `invoices` table with indexed date, vendor, category,
+amount and invoice number columns; their line items live in a separate
+`line_items` table. The raw OCR text of each invoice is kept apart, zlib
+compressed and keyed by its content hash, in `raw_texts`; invoices only
+reference it and it is read when a caller asks for it.
+
+Extracted vendor names are mapped to canonical vendors (see
+vendor_registry.py) as invoices are added; vendor rollups group by the
+canonical name, so OCR variants of one vendor count together.
+
+Invoices are checked for duplicates as they are added (see duplicates.py).
+A duplicate is stored and linked to its original through `duplicate_of`,
+but left out of the aggregates, so resubmitted invoices are not counted
+twice.
+
+Running totals, per-category, per-vendor and per-month rollups and a
+histogram sketch of invoice amounts are kept in small aggregate tables that
+triggers update whenever an invoice is added, changed or removed, so pages
+read them in time proportional to the number of groups, not invoices.
+"""
+import math
+import os
+import sqlite3
+import threading
+import zlib
+
+from duplicates import (MAX_CANDIDATES, MIN_SHINGLES, NEAR_DUPLICATE_SIMILARITY, exact_key, fields_agree,
+                        lsh_keys, minhash, shingles, similarity)
+from lazy_imports import lazy_import
+from ocr_cache import content_digest
+from vendor_registry import VendorRegistry, vendor_key
+
+# Only needed to build frames; loaded on first use
+pd = lazy_import('pandas')
+
+DEFAULT_STORE_PATH = os.environ.get('INVOICE_STORE_PATH', 'invoices.db')
+
+# Invoice fields stored as columns, in display order
+INVOICE_COLUMNS = [
+    'filename', 'invoice_number', 'date', 'vendor', 'canonical_vendor', 'category',
+    'total_amount', 'tax_amount', 'confidence', 'processed_date', 'duplicate_of'
+]
+# Column added to exported invoice tables when raw text is asked for
+TEXT_COLUMN = 'extracted_text'
+LINE_ITEM_COLUMNS = ['description', 'quantity', 'amount', 'unit_price']
+
+# Fixed dtypes of the in-memory invoice and line-item tables; vendors and
+# categories repeat heavily, so they are stored as categoricals
+INVOICE_DTYPES = {
+    'id': 'int64',
+    'total_amount': 'float64',
+    'tax_amount': 'float64',
+    'confidence': 'float64',
+    'duplicate_of': 'Int64',
+    'vendor': 'category',
+    'canonical_vendor': 'category',
+    'category': 'category',
+}
+LINE_ITEM_DTYPES = {
+    'invoice_id': 'int64',
+    'position': 'int64',
+    'quantity': 'float64',
+    'amount': 'float64',
+    'unit_price': 'float64',
+}
+# zlib level for raw texts (zlib's own default)
+TEXT_COMPRESSION_LEVEL = 6
+# Dates that fail to parse (e.g. 'Not found') become NaT
+DATETIME_FORMATS = {'date': '%Y-%m-%d', 'processed_date': '%Y-%m-%d %H:%M:%S'}
+
+# Amount quantiles are estimated from a log-bucketed histogram (as in
+# DDSketch): every estimate is within this relative error of a true amount
+SKETCH_RELATIVE_ACCURACY = 0.01
+_SKETCH_GAMMA = (1 + SKETCH_RELATIVE_ACCURACY) / (1 - SKETCH_RELATIVE_ACCURACY)
+# Bucket for zero and negative amounts
+_ZERO_BUCKET = -(2 ** 31)
+
+# Identical texts (the same file processed twice) are stored once
+_RAW_TEXT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS raw_texts (
+    digest TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    data BLOB NOT NULL
+);
+"""
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS invoices (
+    id INTEGER PRIMARY KEY,
+    filename TEXT,
+    invoice_number TEXT,
+    date TEXT,
+    vendor TEXT,
+    canonical_vendor TEXT,
+    category TEXT,
+    total_amount REAL NOT NULL DEFAULT 0,
+    tax_amount REAL NOT NULL DEFAULT 0,
+    confidence REAL,
+    processed_date TEXT,
+    text_digest TEXT,
+    amount_bucket INTEGER NOT NULL DEFAULT {_ZERO_BUCKET},
+    duplicate_key TEXT,
+    duplicate_of INTEGER REFERENCES invoices (id)
+);
+CREATE INDEX IF NOT EXISTS invoices_date ON invoices (date);
+CREATE INDEX IF NOT EXISTS invoices_vendor ON invoices (vendor);
+CREATE INDEX IF NOT EXISTS invoices_canonical_vendor ON invoices (canonical_vendor);
+CREATE INDEX IF NOT EXISTS invoices_category ON invoices (category);
+CREATE INDEX IF NOT EXISTS invoices_total_amount ON invoices (total_amount);
+CREATE INDEX IF NOT EXISTS invoices_invoice_number ON invoices (invoice_number);
+CREATE INDEX IF NOT EXISTS invoices_text_digest ON invoices (text_digest);
+CREATE INDEX IF NOT EXISTS invoices_duplicate_key ON invoices (duplicate_key);
+CREATE INDEX IF NOT EXISTS invoices_duplicate_of ON invoices (duplicate_of);
+
+-- MinHash band keys of each invoice's text, for near-duplicate lookups
+CREATE TABLE IF NOT EXISTS invoice_lsh (
+    key INTEGER NOT NULL,
+    invoice_id INTEGER NOT NULL REFERENCES invoices (id) ON DELETE CASCADE,
+    PRIMARY KEY (key, invoice_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS invoice_lsh_invoice_id ON invoice_lsh (invoice_id);
+
+CREATE TABLE IF NOT EXISTS line_items (
+    id INTEGER PRIMARY KEY,
+    invoice_id INTEGER NOT NULL REFERENCES invoices (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    description TEXT,
+    quantity REAL,
+    amount REAL,
+    unit_price REAL
+);
+CREATE INDEX IF NOT EXISTS line_items_invoice_id ON line_items (invoice_id);
+
+-- Canonical vendor names in registration order
+CREATE TABLE IF NOT EXISTS vendors (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+""" + _RAW_TEXT_SCHEMA + """
+-- A text is dropped with the last invoice that refers to it
+CREATE TRIGGER IF NOT EXISTS invoices_raw_text_delete AFTER DELETE ON invoices
+WHEN OLD.text_digest IS NOT NULL
+    AND NOT EXISTS (SELECT 1 FROM invoices WHERE text_digest = OLD.text_digest)
+BEGIN
+    DELETE FROM raw_texts WHERE digest = OLD.text_digest;
+END;
+"""
+
+# Aggregate table -> (key column, SQL expression for an invoice row's key)
+_AGGREGATES = {
+    'invoice_totals': ('scope', "''"),
+    'category_totals': ('category', "COALESCE({row}.category, '')"),
+    'vendor_totals': ('vendor', "COALESCE({row}.canonical_vendor, '')"),
+    # Dates are stored as YYYY-MM-DD when they could be parsed; anything
+    # else is grouped under ''
+    'monthly_totals': ('month', "CASE WHEN {row}.date GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-*' "
+                                "THEN substr({row}.date, 1, 7) ELSE '' END"),
+    'amount_histogram': ('bucket', "{row}.amount_bucket"),
+}
+_GROUPED_TOTALS = {'category': 'category_totals', 'vendor': 'vendor_totals', 'month': 'monthly_totals'}
+_AGGREGATED_COLUMNS = 'canonical_vendor, category, date, total_amount, tax_amount, amount_bucket, duplicate_of'
+# Bumped whenever the schema, the aggregate definitions or the vendor
+# matching rules change
+_SCHEMA_VERSION = 4
+
+
+def amount_bucket(amount):
+    """Histogram bucket of an invoice amount"""
+    if not amount or amount <= 0:
+        return _ZERO_BUCKET
+    return math.ceil(math.log(amount, _SKETCH_GAMMA))
+
+
+def compress_text(text):
+    """(digest, compressed bytes) of a raw OCR text"""
+    data = text.encode('utf-8')
+    return content_digest(data), zlib.compress(data, TEXT_COMPRESSION_LEVEL)
+
+
+def decompress_text(data):
+    return None if data is None else zlib.decompress(data).decode('utf-8')
+
+
+def _bucket_value(bucket):
+    """Representative amount of a bucket, within the sketch's relative accuracy"""
+    if bucket == _ZERO_BUCKET:
+        return 0.0
+    return 2 * _SKETCH_GAMMA ** bucket / (_SKETCH_GAMMA + 1)
+
+
+def sketch_quantiles(histogram, quantiles):
+    """
+    Estimate quantiles of the amounts in a histogram sketch, given as
+    (bucket, count) pairs in bucket order, to within
+    SKETCH_RELATIVE_ACCURACY; None for each when it is empty
+    """
+    total = sum(count for _, count in histogram)
+    if not total:
+        return {quantile: None for quantile in quantiles}
+    estimates = {}
+    for quantile in quantiles:
+        rank = quantile * (total - 1)
+        seen = 0
+        for bucket, count in histogram:
+            seen += count
+            if seen > rank:
+                estimates[quantile] = _bucket_value(bucket)
+                break
+    return estimates
+
+
+def high_value_threshold(histogram):
+    """
+    Amount above which an invoice is reported as high-value: the upper edge
+    of the 90th percentile's bucket in a non-empty histogram sketch
+    """
+    return sketch_quantiles(histogram, (0.9,))[0.9] * (1 + SKETCH_RELATIVE_ACCURACY)
+
+
+def _aggregate_schema():
+    """
+    Aggregate tables and the triggers that keep them in step with the
+    invoices that are not duplicates
+    """
+    add, remove = [], []
+    for table, (key, expression) in _AGGREGATES.items():
+        new_key, old_key = expression.format(row='NEW'), expression.format(row='OLD')
+        add.append(
+            f"INSERT INTO {table} ({key}, count, total, tax) "
+            f"SELECT {new_key}, 1, NEW.total_amount, NEW.tax_amount WHERE NEW.duplicate_of IS NULL "
+            f"ON CONFLICT ({key}) DO UPDATE SET count = count + 1, "
+            f"total = total + excluded.total, tax = tax + excluded.tax;"
+        )
+        remove.append(
+            f"UPDATE {table} SET count = count - 1, total = total - OLD.total_amount, "
+            f"tax = tax - OLD.tax_amount WHERE {key} = {old_key} AND OLD.duplicate_of IS NULL;"
+            f"DELETE FROM {table} WHERE {key} = {old_key} AND count <= 0;"
+        )
+    tables = ''.join(
+        f"CREATE TABLE IF NOT EXISTS {table} ({key} PRIMARY KEY, count INTEGER NOT NULL, "
+        f"total REAL NOT NULL, tax REAL NOT NULL);"
+        for table, (key, _) in _AGGREGATES.items()
+    )
+    return tables + f"""
+        CREATE TRIGGER IF NOT EXISTS invoices_aggregate_insert AFTER INSERT ON invoices
+        BEGIN {''.join(add)} END;
+        CREATE TRIGGER IF NOT EXISTS invoices_aggregate_delete AFTER DELETE ON invoices
+        BEGIN {''.join(remove)} END;
+        CREATE TRIGGER IF NOT EXISTS invoices_aggregate_update AFTER UPDATE OF {_AGGREGATED_COLUMNS} ON invoices
+        BEGIN {''.join(remove)}{''.join(add)} END;
+    """
+
+
+def _typed_frame(records, columns, dtypes):
+    frame = pd.DataFrame.from_records(records, columns=columns)
+    for column in frame.columns:
+        if column in dtypes:
+            frame[column] = frame[column].astype(dtypes[column])
+        elif column in DATETIME_FORMATS:
+            frame[column] = pd.to_datetime(frame[column], format=DATETIME_FORMATS[column], errors='coerce')
+    return frame
+
+
+def invoice_frame(records, columns=None):
+    """
+    Build the columnar invoice table from row tuples or invoice dicts.
+    Line items are not included; see InvoiceStore.query_line_items.
+    """
+    return _typed_frame(records, columns or INVOICE_COLUMNS, INVOICE_DTYPES)
+
+
+def line_item_frame(records):
+    """Build the columnar line-item table from (invoice_id, position, ...) rows"""
+    return _typed_frame(records, ['invoice_id', 'position'] + LINE_ITEM_COLUMNS, LINE_ITEM_DTYPES)
+
+
+class InvoiceStore:
+    """
+    SQLite store for processed invoices.
+
+    A single connection is shared between threads (Streamlit runs each
+    session in its own thread) and serialized with a lock.
+
+    Values derived from the aggregates (insights, quantiles) are memoized
+    until the next write from this or any other connection.
+    """
+
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = path
+        self._lock = threading.RLock()
+        self._memo = {}
+        self._memo_version = None
+        # Filled from the vendors table on first use
+        self._vendors = VendorRegistry()
+        self._vendors_seen = 0
+        # Vendors first seen in the open transaction; registered once it commits
+        self._new_vendors = VendorRegistry()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._migrate()
+
+    def _migrate(self):
+        with self._lock:
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(invoices)")}
+            if columns and 'amount_bucket' not in columns:
+                # Stores created before the aggregate tables existed
+                self._conn.execute("BEGIN IMMEDIATE")
+                self._conn.execute(
+                    f"ALTER TABLE invoices ADD COLUMN amount_bucket INTEGER NOT NULL DEFAULT {_ZERO_BUCKET}"
+                )
+                self._conn.executemany(
+                    "UPDATE invoices SET amount_bucket = ? WHERE id = ?",
+                    [(amount_bucket(amount), invoice_id) for invoice_id, amount in
+                     self._conn.execute("SELECT id, total_amount FROM invoices").fetchall()]
+                )
+                self._conn.execute("COMMIT")
+            if 'extracted_text' in columns:
+                self._move_texts()
+            if columns and 'canonical_vendor' not in columns:
+                # Stores created before vendor names were canonicalized
+                self._conn.execute("ALTER TABLE invoices ADD COLUMN canonical_vendor TEXT")
+            if columns and 'duplicate_of' not in columns:
+                # Stores created before duplicate detection
+                self._conn.execute("ALTER TABLE invoices ADD COLUMN duplicate_key TEXT")
+                self._conn.execute("ALTER TABLE invoices ADD COLUMN duplicate_of INTEGER REFERENCES invoices (id)")
+            version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+            outdated = version < _SCHEMA_VERSION
+            if outdated:
+                # Recreate the triggers and aggregate tables from the current definitions
+                self._conn.executescript(
+                    "DROP TRIGGER IF EXISTS invoices_aggregate_insert;"
+                    "DROP TRIGGER IF EXISTS invoices_aggregate_delete;"
+                    "DROP TRIGGER IF EXISTS invoices_aggregate_update;"
+                    + ''.join(f"DROP TABLE IF EXISTS {table};" for table in _AGGREGATES)
+                )
+            self._conn.executescript(_SCHEMA + _aggregate_schema())
+            if columns and version < 4:
+                # Version 3 matched vendors by trigrams alone and merged some distinct ones
+                self._canonicalize_vendors()
+                # Exact duplicates are keyed on the canonical vendor
+                self._find_existing_duplicates()
+            if outdated:
+                self.rebuild_aggregates()
+                self._conn.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+
+    def _move_texts(self):
+        # Stores created before raw texts were kept apart
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._conn.execute(_RAW_TEXT_SCHEMA)
+            self._conn.execute("ALTER TABLE invoices ADD COLUMN text_digest TEXT")
+            last_id = 0
+            while True:
+                rows = self._conn.execute(
+                    "SELECT id, extracted_text FROM invoices WHERE id > ? ORDER BY id LIMIT 1000", (last_id,)
+                ).fetchall()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                self._conn.executemany(
+                    "UPDATE invoices SET text_digest = ? WHERE id = ?",
+                    [(self._store_text(text), invoice_id) for invoice_id, text in rows if text]
+                )
+            self._conn.execute("ALTER TABLE invoices DROP COLUMN extracted_text")
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def _canonicalize_vendors(self):
+        # Spellings are registered oldest first, so the earliest becomes canonical
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._conn.execute("DELETE FROM vendors")
+            self._vendors = VendorRegistry()
+            self._vendors_seen = 0
+            spellings = [row[0] for row in self._conn.execute(
+                "SELECT vendor FROM invoices GROUP BY vendor ORDER BY MIN(id)"
+            ).fetchall()]
+            self._conn.executemany(
+                "UPDATE invoices SET canonical_vendor = ? WHERE vendor IS ?",
+                [(self._canonical_vendor(vendor), vendor) for vendor in spellings]
+            )
+            self._commit_vendors()
+        except Exception:
+            self._rollback_vendors()
+            raise
+
+    def _canonical_vendor(self, vendor):
+        """
+        Canonical name for an extracted vendor. A new vendor is only held for
+        the open transaction; see _commit_vendors.
+        """
+        if not vendor_key(vendor):
+            return vendor
+        canonical = self._vendors.match(vendor) or self._new_vendors.match(vendor)
+        if canonical is None:
+            # Another connection may have registered it since
+            self._load_vendors()
+            canonical = self._vendors.match(vendor)
+        if canonical is None:
+            canonical = self._new_vendors.add(vendor)
+        return canonical
+
+    def _commit_vendors(self):
+        """
+        Save the vendors first seen in the open transaction and commit it.
+        They join the in-memory registry only once the commit succeeded, so
+        a rolled back insert leaves no vendor behind that the table lacks.
+        """
+        names = self._new_vendors.names()
+        self._conn.executemany("INSERT OR IGNORE INTO vendors (name) VALUES (?)", [(name,) for name in names])
+        self._conn.execute("COMMIT")
+        self._new_vendors = VendorRegistry()
+        for name in names:
+            self._vendors.add(name)
+
+    def _rollback_vendors(self):
+        self._conn.execute("ROLLBACK")
+        self._new_vendors = VendorRegistry()
+
+    def _load_vendors(self):
+        for vendor_id, name in self._conn.execute(
+            "SELECT id, name FROM vendors WHERE id > ? ORDER BY id", (self._vendors_seen,)
+        ).fetchall():
+            self._vendors.add(name)
+            self._vendors_seen = vendor_id
+
+    def _find_existing_duplicates(self):
+        # Check every stored invoice against those before it, as if they
+        # were being added again in order
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._conn.execute("DELETE FROM invoice_lsh")
+            self._conn.execute("UPDATE invoices SET duplicate_key = NULL, duplicate_of = NULL")
+            last_id = 0
+            while True:
+                rows = self._conn.execute(
+                    "SELECT invoices.id, vendor, canonical_vendor, invoice_number, total_amount, date, text_digest, "
+                    "raw_texts.data "
+                    "FROM invoices LEFT JOIN raw_texts ON raw_texts.digest = invoices.text_digest "
+                    "WHERE invoices.id > ? ORDER BY invoices.id LIMIT 1000", (last_id,)
+                ).fetchall()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                for invoice_id, *fields, text_digest, data in rows:
+                    row = dict(zip(['vendor', 'canonical_vendor', 'invoice_number', 'total_amount', 'date'], fields))
+                    row['text_digest'] = text_digest
+                    keys = self._check_duplicate(row, decompress_text(data), before=invoice_id)
+                    self._conn.execute(
+                        "UPDATE invoices SET duplicate_key = ?, duplicate_of = ? WHERE id = ?",
+                        (row['duplicate_key'], row['duplicate_of'], invoice_id)
+                    )
+                    self._index_text(invoice_id, keys)
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def _check_duplicate(self, row, text, before=None):
+        """
+        Set row's duplicate_key and duplicate_of (the earliest invoice it
+        duplicates, or None) and return its text's LSH keys for indexing.
+        Only invoices with ids below `before` are considered.
+        """
+        row['duplicate_key'] = exact_key(row)
+        row['duplicate_of'] = None
+        bound, bound_params = (" AND id < ?", (before,)) if before is not None else ("", ())
+        text_shingles = shingles(text) if text else set()
+        keys = lsh_keys(minhash(text_shingles)) if len(text_shingles) >= MIN_SHINGLES else []
+
+        # The same OCR text, or the same vendor, number, total and date
+        for column in ('text_digest', 'duplicate_key'):
+            if row[column] is None:
+                continue
+            match = self._conn.execute(
+                f"SELECT COALESCE(duplicate_of, id) FROM invoices WHERE {column} = ?{bound} ORDER BY id LIMIT 1",
+                (row[column], *bound_params)
+            ).fetchone()
+            if match:
+                row['duplicate_of'] = match[0]
+                return keys
+
+        # Texts sharing a MinHash band, most shared bands first
+        if not keys:
+            return keys
+        candidates = self._conn.execute(
+            f"SELECT invoice_id FROM invoice_lsh WHERE key IN ({', '.join('?' * len(keys))}) "
+            f"GROUP BY invoice_id ORDER BY COUNT(*) DESC, invoice_id LIMIT ?",
+            (*keys, MAX_CANDIDATES)
+        ).fetchall()
+        for (candidate,) in candidates:
+            original, vendor, invoice_number, total_amount, date, data = self._conn.execute(
+                "SELECT COALESCE(duplicate_of, invoices.id), vendor, invoice_number, total_amount, date, "
+                "raw_texts.data FROM invoices JOIN raw_texts ON raw_texts.digest = invoices.text_digest "
+                "WHERE invoices.id = ?", (candidate,)
+            ).fetchone()
+            other = {'vendor': vendor, 'invoice_number': invoice_number, 'total_amount': total_amount,
+                     'date': date}
+            if (fields_agree(row, other)
+                    and similarity(text_shingles, shingles(decompress_text(data))) >= NEAR_DUPLICATE_SIMILARITY):
+                row['duplicate_of'] = original
+                break
+        return keys
+
+    def _index_text(self, invoice_id, keys):
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO invoice_lsh (key, invoice_id) VALUES (?, ?)",
+            [(key, invoice_id) for key in keys]
+        )
+
+    def _store_text(self, text):
+        digest, data = compress_text(text)
+        self._conn.execute(
+            "INSERT OR IGNORE INTO raw_texts (digest, size, data) VALUES (?, ?, ?)",
+            (digest, len(text), data)
+        )
+        return digest
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _memoized(self, name, compute):
+        """Return compute(), reusing the last result until the store changes"""
+        with self._lock:
+            # data_version moves on commits from other connections,
+            # total_changes on this connection's own writes
+            version = (self._conn.execute("PRAGMA data_version").fetchone()[0], self._conn.total_changes)
+            if version != self._memo_version:
+                self._memo = {}
+                self._memo_version = version
+            if name not in self._memo:
+                self._memo[name] = compute()
+            return self._memo[name]
+
+    # Writing
+
+    def add_invoice(self, invoice_data):
+        """Store one invoice dict (as produced by the analyzer) and return its id"""
+        return self.add_invoices([invoice_data])[0]
+
+    def add_invoices(self, invoices):
+        """Store several invoices in one transaction and return their ids"""
+        ids = []
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for invoice_data in invoices:
+                    ids.append(self._insert(invoice_data))
+                self._commit_vendors()
+            except Exception:
+                self._rollback_vendors()
+                raise
+        return ids
+
+    def _insert(self, invoice_data):
+        row = {column: invoice_data.get(column) for column in INVOICE_COLUMNS}
+        row['total_amount'] = row['total_amount'] or 0.0
+        row['tax_amount'] = row['tax_amount'] or 0.0
+        row['amount_bucket'] = amount_bucket(row['total_amount'])
+        row['canonical_vendor'] = self._canonical_vendor(row['vendor'])
+        text = invoice_data.get(TEXT_COLUMN)
+        row['text_digest'] = self._store_text(text) if text else None
+        keys = self._check_duplicate(row, text)
+        cursor = self._conn.execute(
+            f"INSERT INTO invoices ({', '.join(row)}) VALUES ({', '.join(':' + column for column in row)})",
+            row
+        )
+        invoice_id = cursor.lastrowid
+        self._index_text(invoice_id, keys)
+        self._conn.executemany(
+            "INSERT INTO line_items (invoice_id, position, description, quantity, amount, unit_price) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [(invoice_id, position, item.get('description'), item.get('quantity'),
+              item.get('amount'), item.get('unit_price'))
+             for position, item in enumerate(invoice_data.get('items') or [])]
+        )
+        return invoice_id
+
+    def delete_invoice(self, invoice_id):
+        """
+        Remove an invoice and its line items. If it has duplicates, the
+        oldest of them becomes the original of the others.
+        """
+        invoice_id = int(invoice_id)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                successor = self._conn.execute(
+                    "SELECT MIN(id) FROM invoices WHERE duplicate_of = ?", (invoice_id,)
+                ).fetchone()[0]
+                if successor is not None:
+                    self._conn.execute("UPDATE invoices SET duplicate_of = NULL WHERE id = ?", (successor,))
+                    self._conn.execute(
+                        "UPDATE invoices SET duplicate_of = ? WHERE duplicate_of = ?", (successor, invoice_id)
+                    )
+                self._conn.execute("DELETE FROM invoices WHERE id = ?", (invoice_id,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def clear(self):
+        """Remove all invoices"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM line_items")
+                self._conn.execute("DELETE FROM invoice_lsh")
+                self._conn.execute("DELETE FROM invoices")
+                self._conn.execute("DELETE FROM raw_texts")
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def rebuild_aggregates(self):
+        """Recompute every aggregate table from the invoices"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for table, (key, expression) in _AGGREGATES.items():
+                    self._conn.execute(f"DELETE FROM {table}")
+                    self._conn.execute(
+                        f"INSERT INTO {table} ({key}, count, total, tax) "
+                        f"SELECT {expression.format(row='invoices')}, COUNT(*), SUM(total_amount), "
+                        f"SUM(tax_amount) FROM invoices WHERE duplicate_of IS NULL GROUP BY 1"
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    # Aggregates
+
+    def count(self):
+        return self.summary()['count']
+
+    def summary(self):
+        """Invoice count, total/average amount and total tax"""
+        rows = self._execute("SELECT count, total, tax FROM invoice_totals")
+        count, total, tax = rows[0] if rows else (0, 0.0, 0.0)
+        return {'count': count, 'total_amount': total, 'average_amount': total / count if count else 0.0,
+                'total_tax': tax}
+
+    def duplicate_count(self):
+        """Number of stored invoices flagged as duplicates (not in count())"""
+        return self._execute("SELECT COUNT(*) FROM invoices WHERE duplicate_of IS NOT NULL")[0][0]
+
+    def totals_by(self, column):
+        """
+        Total amount and invoice count per category, vendor or month
+        (YYYY-MM, invoices without a parsed date are left out), largest
+        total first
+        """
+        if column not in _GROUPED_TOTALS:
+            raise ValueError(f"Cannot group invoices by {column!r}")
+        where = " WHERE month != ''" if column == 'month' else ""
+        rows = self._execute(
+            f"SELECT {column}, total, count FROM {_GROUPED_TOTALS[column]}{where} ORDER BY total DESC, {column}"
+        )
+        return pd.DataFrame(rows, columns=[column, 'total_amount', 'count'])
+
+    def most_frequent_vendor(self, min_count=1):
+        rows = self._execute(
+            "SELECT vendor FROM vendor_totals WHERE count >= ? ORDER BY count DESC, vendor LIMIT 1",
+            (min_count,)
+        )
+        return rows[0][0] if rows else None
+
+    def amount_quantiles(self, quantiles=(0.5, 0.9, 0.99)):
+        """
+        Estimate quantiles of the invoice amounts from the histogram sketch,
+        to within SKETCH_RELATIVE_ACCURACY
+        """
+        return sketch_quantiles(self._amount_histogram(), quantiles)
+
+    def _amount_histogram(self):
+        return self._execute("SELECT bucket, count FROM amount_histogram ORDER BY bucket")
+
+    def spending_insights(self):
+        """Spending overview derived from the aggregates"""
+        return self._memoized('spending_insights', self._spending_insights)
+
+    def _spending_insights(self):
+        summary = self.summary()
+        if not summary['count']:
+            return {}
+        categories = self.totals_by('category')
+        vendors = self.totals_by('vendor')
+        months = len(self.totals_by('month'))
+        return {
+            'total_spending': summary['total_amount'],
+            'average_invoice': summary['average_amount'],
+            'top_category': categories['category'].iloc[0],
+            'top_vendor': vendors['vendor'].iloc[0],
+            'highest_invoice': self._execute(
+                "SELECT MAX(total_amount) FROM invoices WHERE duplicate_of IS NULL"
+            )[0][0],
+            'monthly_average': summary['total_amount'] / max(1, months),
+            'category_distribution': dict(zip(categories['category'], categories['total_amount'])),
+            'vendor_distribution': dict(zip(vendors['vendor'], vendors['total_amount'])),
+            'amount_quantiles': self.amount_quantiles()
+        }
+
+    def cost_saving_suggestions(self):
+        """Cost-saving suggestions derived from the aggregates"""
+        return self._memoized('cost_saving_suggestions', self._cost_saving_suggestions)
+
+    def _cost_saving_suggestions(self):
+        if not self.count():
+            return []
+        suggestions = []
+
+        # High-spending categories
+        categories = self.totals_by('category')
+        top_category, top_amount = categories['category'].iloc[0], categories['total_amount'].iloc[0]
+        suggestions.append(f"Consider reviewing {top_category} expenses (${top_amount:,.2f} total)")
+
+        # Repeat vendors
+        vendor_name = self.most_frequent_vendor(min_count=2)
+        if vendor_name is not None:
+            suggestions.append(f"Consolidate purchases with {vendor_name} for potential bulk discounts")
+
+        # High individual invoices; the sketch locates the 90th percentile
+        # and the amount index finds the smallest invoice beyond its bucket
+        threshold = high_value_threshold(self._amount_histogram())
+        lowest_high = self._execute(
+            "SELECT MIN(total_amount) FROM invoices WHERE total_amount > ? AND duplicate_of IS NULL", (threshold,)
+        )[0][0]
+        if lowest_high is not None:
+            suggestions.append(f"Review high-value invoices (${lowest_high:.2f}+ range)")
+
+        return suggestions
+
+    # Reading
+
+    def query_invoices(self, columns=None, limit=None, offset=0):
+        """Return a page of invoices (newest first) as a typed invoice table"""
+        columns = columns or ['id'] + INVOICE_COLUMNS
+        unknown = set(columns) - {'id', *INVOICE_COLUMNS}
+        if unknown:
+            raise ValueError(f"Unknown invoice columns: {sorted(unknown)}")
+        sql = f"SELECT {', '.join(columns)} FROM invoices ORDER BY id DESC"
+        params = []
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params = [limit, offset]
+        return invoice_frame(self._execute(sql, params), columns)
+
+    def query_line_items(self, invoice_ids=None):
+        """Return the line items of the given invoices (all if None) as a table"""
+        columns = ['invoice_id', 'position'] + LINE_ITEM_COLUMNS
+        sql = f"SELECT {', '.join(columns)} FROM line_items"
+        params = []
+        if invoice_ids is not None:
+            params = [int(invoice_id) for invoice_id in invoice_ids]
+            sql += f" WHERE invoice_id IN ({', '.join('?' for _ in params)})"
+        return line_item_frame(self._execute(sql + " ORDER BY invoice_id, position", params))
+
+    def iter_invoices(self, columns=None, chunksize=5000, include_text=False):
+        """
+        Yield the whole invoice table in id order, as typed tables of at most
+        chunksize rows, so callers never hold every invoice at once. With
+        include_text, each table ends with the raw extracted text.
+        """
+        columns = columns or ['id'] + INVOICE_COLUMNS
+        unknown = set(columns) - {'id', *INVOICE_COLUMNS}
+        if unknown:
+            raise ValueError(f"Unknown invoice columns: {sorted(unknown)}")
+        selected = ', '.join(f"invoices.{column}" for column in ['id'] + columns)
+        # Page on the primary key rather than OFFSET, which rescans skipped rows
+        if include_text:
+            sql = (f"SELECT {selected}, raw_texts.data FROM invoices "
+                   f"LEFT JOIN raw_texts ON raw_texts.digest = invoices.text_digest "
+                   f"WHERE invoices.id > ? ORDER BY invoices.id LIMIT ?")
+        else:
+            sql = f"SELECT {selected} FROM invoices WHERE id > ? ORDER BY id LIMIT ?"
+        last_id = 0
+        while True:
+            rows = self._execute(sql, (last_id, chunksize))
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            if include_text:
+                yield invoice_frame([row[1:-1] + (decompress_text(row[-1]),) for row in rows],
+                                    columns + [TEXT_COLUMN])
+            else:
+                yield invoice_frame([row[1:] for row in rows], columns)
+
+    def iter_line_items(self, chunksize=20000):
+        """Yield every line item in insertion order, in typed chunks"""
+        columns = ['invoice_id', 'position'] + LINE_ITEM_COLUMNS
+        sql = f"SELECT id, {', '.join(columns)} FROM line_items WHERE id > ? ORDER BY id LIMIT ?"
+        last_id = 0
+        while True:
+            rows = self._execute(sql, (last_id, chunksize))
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield line_item_frame([row[1:] for row in rows])
+
+    def get_line_items(self, invoice_id):
+        rows = self._execute(
+            f"SELECT {', '.join(LINE_ITEM_COLUMNS)} FROM line_items WHERE invoice_id = ? ORDER BY position",
+            (invoice_id,)
+        )
+        return [dict(zip(LINE_ITEM_COLUMNS, row)) for row in rows]
+
+    def get_duplicate_of(self, invoice_id):
+        """Id of the invoice this one duplicates, or None"""
+        rows = self._execute("SELECT duplicate_of FROM invoices WHERE id = ?", (int(invoice_id),))
+        return rows[0][0] if rows else None
+
+    def get_extracted_text(self, invoice_id):
+        """The raw OCR text of an invoice, or None if none was stored"""
+        rows = self._execute(
+            "SELECT raw_texts.data FROM invoices JOIN raw_texts ON raw_texts.digest = invoices.text_digest "
+            "WHERE invoices.id = ?",
+            (int(invoice_id),)
+        )
+        return decompress_text(rows[0][0]) if rows else None
+
+
+_default_store = None
+_default_store_pid = None
+_default_store_lock = threading.Lock()
+
+
+def get_invoice_store():
+    """Return the process-wide store, opening it on first use"""
+    global _default_store, _default_store_pid
+    with _default_store_lock:
+        # SQLite connections must not be shared with forked children
+        if _default_store is None or _default_store_pid != os.getpid():
+            _default_store = InvoiceStore()
+            _default_store_pid = os.getpid()
+        return _default_store
@@ -0,0 +1,338 @@
+"""
+Background extraction jobs.
+
+Uploaded files are queued in a SQLite table and a dispatcher thread feeds
+them to a bounded pool of worker processes, which OCR and analyze them.
+Finished invoices are added to the invoice store by the dispatcher, so a
+job completes even if the session that submitted it has gone away.
+
+The queue is meant to be served by one process at a time: jobs that a
+stopped server left running are queued again when the queue is next
+opened.
+"""
+import json
+import logging
+import multiprocessing
+import os
+import sqlite3
+import threading
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+
+import perf
+from analyzer import InvoiceAnalyzer
+from invoice_store import get_invoice_store
+from ocr_utils import extract_text_from_file_bytes
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JOBS_PATH = os.environ.get('INVOICE_JOBS_PATH', 'invoice_jobs.db')
+# Worker processes per queue
+JOB_WORKERS = os.cpu_count() or 1
+# Seconds between checks for jobs queued through other connections
+POLL_INTERVAL = 1.0
+
+# Job states; a job ends in one of FINAL_STATES
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINAL_STATES = (DONE, FAILED, CANCELLED)
+
+# Columns returned by status() and jobs()
+JOB_COLUMNS = ['id', 'filename', 'file_type', 'header_only', 'status', 'invoice_id',
+               'result', 'error', 'submitted', 'started', 'finished']
+# Invoice fields kept with a finished job for display
+RESULT_FIELDS = ['invoice_number', 'date', 'vendor', 'total_amount', 'tax_amount', 'category']
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    filename TEXT NOT NULL,
+    file_type TEXT NOT NULL,
+    header_only INTEGER NOT NULL DEFAULT 0,
+    payload BLOB,
+    status TEXT NOT NULL,
+    invoice_id INTEGER,
+    result TEXT,
+    error TEXT,
+    submitted TEXT NOT NULL,
+    started TEXT,
+    finished TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, id);
+"""
+
+
+def _now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+# Worker-side functions, shared with the HTTP service's pool, the batch
+# CLI and InvoiceAnalyzer.analyze_many. The analyzer is held by each worker
+# process and set once by init_worker.
+_worker_analyzer = None
+
+
+def init_worker(analyzer=None):
+    """Pool initializer; analyzer is a configured analyzer to use instead of a default one"""
+    global _worker_analyzer
+    _worker_analyzer = analyzer if analyzer is not None else InvoiceAnalyzer()
+
+
+def extract_file(file_bytes, file_type, filename, header_only, timed):
+    """
+    Extract and analyze one file inside a worker process. Returns
+    (invoice data or None, perf breakdown or None).
+    """
+    # The parent's instrumentation switch is passed along with every job
+    if timed:
+        perf.enable()
+    else:
+        perf.disable()
+    with perf.document(filename) as breakdown:
+        options = {'analyzer': _worker_analyzer, 'include_items': False} if header_only else {}
+        with perf.stage('extract'):
+            extracted_text = extract_text_from_file_bytes(file_bytes, file_type, **options)
+        invoice_data = None
+        if extracted_text:
+            with perf.stage('analyze'):
+                invoice_data = _worker_analyzer.analyze_invoice_text(extracted_text)
+            invoice_data['extracted_text'] = extracted_text
+    return invoice_data, breakdown
+
+
+def analyze_texts(texts):
+    """Analyze a batch of extracted texts inside a worker process"""
+    return [_worker_analyzer.analyze_invoice_text(text) for text in texts]
+
+
+class JobQueue:
+    """
+    Persistent queue of extraction jobs with submit, status and cancel.
+
+    At most `workers` jobs run at once; the rest wait in the table. File
+    contents are kept in the table until the job finishes.
+    """
+
+    def __init__(self, path=DEFAULT_JOBS_PATH, store=None, workers=JOB_WORKERS):
+        self.path = path
+        self.store = store or get_invoice_store()
+        self.workers = workers
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        # Jobs interrupted by a stopped server start over
+        self._conn.execute("UPDATE jobs SET status = ?, started = NULL WHERE status = ?", (QUEUED, RUNNING))
+        self._pool = None
+        self._running = {}
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._dispatcher = threading.Thread(target=self._dispatch, name="invoice-jobs", daemon=True)
+        self._dispatcher.start()
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    # Client operations
+
+    def submit(self, file_bytes, filename, file_type, header_only=False):
+        """Queue one file for extraction and return the job id"""
+        with self._lock:
+            job_id = self._conn.execute(
+                "INSERT INTO jobs (filename, file_type, header_only, payload, status, submitted) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (filename, file_type, int(header_only), file_bytes, QUEUED, _now())
+            ).lastrowid
+        self._wakeup.set()
+        return job_id
+
+    def status(self, job_id):
+        """The job as a dict, or None if there is no such job"""
+        jobs = self.jobs([job_id])
+        return jobs[0] if jobs else None
+
+    def jobs(self, job_ids=None, limit=100):
+        """Jobs with the given ids (or the most recent ones) in submission order"""
+        columns = ', '.join(JOB_COLUMNS)
+        if job_ids is None:
+            rows = self._execute(f"SELECT {columns} FROM jobs ORDER BY id DESC LIMIT ?", (limit,))[::-1]
+        else:
+            job_ids = [int(job_id) for job_id in job_ids]
+            rows = self._execute(
+                f"SELECT {columns} FROM jobs WHERE id IN ({', '.join('?' * len(job_ids))}) ORDER BY id",
+                job_ids
+            )
+        jobs = []
+        for row in rows:
+            job = dict(zip(JOB_COLUMNS, row))
+            job['header_only'] = bool(job['header_only'])
+            job['result'] = json.loads(job['result']) if job['result'] else None
+            jobs.append(job)
+        return jobs
+
+    def active_count(self):
+        """Number of jobs queued or running"""
+        return self._execute("SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)", (QUEUED, RUNNING))[0][0]
+
+    def cancel(self, job_id):
+        """
+        Cancel a queued or running job; returns False if it had already
+        finished. A file already being OCR'd still runs to the end in its
+        worker, but its result is discarded.
+        """
+        with self._lock:
+            cancelled = self._conn.execute(
+                "UPDATE jobs SET status = ?, payload = NULL, finished = ? WHERE id = ? AND status IN (?, ?)",
+                (CANCELLED, _now(), int(job_id), QUEUED, RUNNING)
+            ).rowcount > 0
+            running = self._running.get(int(job_id))
+        if running is not None:
+            running[0].cancel()
+        return cancelled
+
+    def close(self):
+        """
+        Stop dispatching. Jobs still running are queued again the next time
+        the queue is opened.
+        """
+        self._closed = True
+        self._wakeup.set()
+        self._dispatcher.join()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+        self._conn.close()
+
+    # Dispatching
+
+    def _get_pool(self):
+        if self._pool is None:
+            # Spawn rather than fork: the submitting process is multi-threaded
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                initializer=init_worker
+            )
+        return self._pool
+
+    def _dispatch(self):
+        while True:
+            self._wakeup.wait(POLL_INTERVAL)
+            self._wakeup.clear()
+            if self._closed:
+                return
+            try:
+                for job_id, (future, pool) in list(self._running.items()):
+                    if future.done():
+                        self._finish(job_id, future, pool)
+                self._start_queued()
+            except Exception:
+                # Keep dispatching; failures of single jobs are recorded on the job itself
+                logger.exception("Job dispatch failed")
+
+    def _start_queued(self):
+        while len(self._running) < self.workers:
+            with self._lock:
+                rows = self._conn.execute(
+                    "UPDATE jobs SET status = ?, started = ? "
+                    "WHERE id = (SELECT id FROM jobs WHERE status = ? ORDER BY id LIMIT 1) "
+                    "RETURNING id, filename, file_type, header_only, payload",
+                    (RUNNING, _now(), QUEUED)
+                ).fetchall()
+            if not rows:
+                return
+            job_id, filename, file_type, header_only, payload = rows[0]
+            args = (extract_file, payload, file_type, filename, bool(header_only), perf.is_enabled())
+            try:
+                pool = self._get_pool()
+                try:
+                    future = pool.submit(*args)
+                except BrokenProcessPool:
+                    self._discard_pool(pool)
+                    pool = self._get_pool()
+                    future = pool.submit(*args)
+            except Exception as e:
+                # Already marked running, so it would otherwise never finish
+                logger.exception("Could not start job %s", job_id)
+                self._fail(job_id, f"Could not start OCR worker ({e})")
+                continue
+            future.add_done_callback(lambda _: self._wakeup.set())
+            with self._lock:
+                self._running[job_id] = (future, pool)
+
+    def _discard_pool(self, pool):
+        # A crashed worker leaves the pool unusable; the next job starts a fresh one
+        if self._pool is pool:
+            self._pool = None
+            pool.shutdown(wait=False)
+
+    def _fail(self, job_id, error):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, payload = NULL, finished = ? WHERE id = ? AND status = ?",
+                (FAILED, error, _now(), job_id, RUNNING)
+            )
+
+    def _finish(self, job_id, future, pool):
+        with self._lock:
+            del self._running[job_id]
+        invoice_data = None
+        error = None
+        try:
+            invoice_data, breakdown = future.result()
+            if breakdown is not None:
+                perf.add_document(breakdown)
+            if invoice_data is None:
+                error = "Failed to extract text from document"
+        except CancelledError:
+            return
+        except BrokenProcessPool as e:
+            self._discard_pool(pool)
+            error = f"OCR worker crashed ({e})"
+        except Exception as e:
+            error = str(e)
+
+        with self._lock:
+            rows = self._conn.execute("SELECT status, filename FROM jobs WHERE id = ?", (job_id,)).fetchall()
+            if not rows or rows[0][0] != RUNNING:
+                # Cancelled while its file was being processed
+                return
+            if error is not None:
+                self._fail(job_id, error)
+                return
+            invoice_data['filename'] = rows[0][1]
+            invoice_data['processed_date'] = _now()
+            try:
+                # Stored before the job is marked done, so a server stopped in
+                # between can at worst redo this one job
+                invoice_id = self.store.add_invoice(invoice_data)
+                result = {field: invoice_data.get(field) for field in RESULT_FIELDS}
+                result['duplicate_of'] = self.store.get_duplicate_of(invoice_id)
+            except Exception as e:
+                logger.exception("Could not store the invoice of job %s", job_id)
+                self._fail(job_id, f"Could not save invoice ({e})")
+                return
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, invoice_id = ?, result = ?, payload = NULL, finished = ? WHERE id = ?",
+                (DONE, invoice_id, json.dumps(result), _now(), job_id)
+            )
+
+
+_default_queue = None
+_default_queue_pid = None
+_default_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """Return the process-wide job queue, starting it on first use"""
+    global _default_queue, _default_queue_pid
+    with _default_queue_lock:
+        # Neither the connection nor the dispatcher thread survive a fork
+        if _default_queue is None or _default_queue_pid != os.getpid():
+            _default_queue = JobQueue()
+            _default_queue_pid = os.getpid()
+        return _default_queue
@@ -0,0 +1,158 @@
+"""
+Multi-pattern keyword matching for invoice categorization.
+
+KeywordAutomaton compiles a {category: keywords} dictionary into an
+Aho-Corasick automaton, so every category can be scored in one linear scan
+of the text no matter how many keywords there are.
+"""
+
+
+def _is_word_char(char):
+    return char.isalnum() or char == '_'
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton over category keywords.
+
+    Keywords are given per category either as plain strings (weight 1) or as
+    (keyword, weight) pairs. Matching is case-insensitive, except for keywords
+    that contain capitals (acronyms such as 'IT'), which must appear in the
+    original text with the same case.
+
+    With word_boundary=True a keyword only counts when it is a whole word or
+    phrase, optionally followed by a plural 's'/'es' ('service' matches
+    'services' but not 'serviceable').
+    """
+
+    def __init__(self, category_keywords, word_boundary=True):
+        self.word_boundary = word_boundary
+        self.categories = list(category_keywords)
+        self.keywords = []
+        self.spec = self.make_spec(category_keywords)
+
+        # Deduplicate keywords across categories: a keyword listed under
+        # several categories is matched once and credited to each of them
+        keyword_ids = {}
+        self._credits = []
+        for category_index, category in enumerate(self.categories):
+            for keyword, weight in self.spec[category_index][1]:
+                if keyword not in keyword_ids:
+                    keyword_ids[keyword] = len(self.keywords)
+                    self.keywords.append(keyword)
+                    self._credits.append([])
+                self._credits[keyword_ids[keyword]].append((category_index, weight))
+
+        self._build()
+
+    @staticmethod
+    def make_spec(category_keywords):
+        """Normalize a keyword dictionary into a hashable, comparable form"""
+        spec = []
+        for category, keywords in category_keywords.items():
+            entries = []
+            for entry in keywords:
+                if isinstance(entry, str):
+                    keyword, weight = entry, 1
+                else:
+                    keyword, weight = entry
+                if keyword:
+                    entries.append((keyword, weight))
+            spec.append((category, tuple(entries)))
+        return tuple(spec)
+
+    def _build(self):
+        """Build the goto/fail tables and flatten them into a DFA"""
+        goto = [{}]
+        outputs = [[]]
+        for keyword_id, keyword in enumerate(self.keywords):
+            state = 0
+            for char in keyword.lower():
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto[state][char] = next_state
+                    goto.append({})
+                    outputs.append([])
+                state = next_state
+            outputs[state].append(keyword_id)
+
+        # Breadth-first fail links; each state's transitions are completed
+        # with its fail state's so the scan never follows a fail link
+        fail = [0] * len(goto)
+        queue = list(goto[0].values())
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for char, next_state in goto[state].items():
+                queue.append(next_state)
+                fallback = fail[state]
+                while fallback and char not in goto[fallback]:
+                    fallback = fail[fallback]
+                target = goto[fallback].get(char, 0)
+                fail[next_state] = target if target != next_state else 0
+                outputs[next_state] = outputs[next_state] + outputs[fail[next_state]]
+
+        delta = [dict(transitions) for transitions in goto]
+        for state in queue:
+            for char, target in delta[fail[state]].items():
+                delta[state].setdefault(char, target)
+
+        self._delta = delta
+        self._outputs = [tuple(output) for output in outputs]
+        self._lengths = [len(keyword) for keyword in self.keywords]
+        self._case_sensitive = [keyword != keyword.lower() for keyword in self.keywords]
+
+    def find_keywords(self, text, text_lower=None):
+        """Return the set of keyword ids that occur in the text"""
+        if text_lower is None:
+            text_lower = text.lower()
+        # Case-sensitive checks slice the original text at the same offsets
+        same_offsets = len(text_lower) == len(text)
+
+        delta = self._delta
+        outputs = self._outputs
+        found = set()
+        state = 0
+        for end, char in enumerate(text_lower, 1):
+            state = delta[state].get(char, 0)
+            if not outputs[state]:
+                continue
+            for keyword_id in outputs[state]:
+                if keyword_id in found:
+                    continue
+                start = end - self._lengths[keyword_id]
+                if self._case_sensitive[keyword_id]:
+                    if not same_offsets or text[start:end] != self.keywords[keyword_id]:
+                        continue
+                if self.word_boundary and not self._on_word_boundary(text_lower, start, end):
+                    continue
+                found.add(keyword_id)
+        return found
+
+    @staticmethod
+    def _on_word_boundary(text, start, end):
+        if start > 0 and _is_word_char(text[start - 1]):
+            return False
+        for suffix in ('', 's', 'es'):
+            if suffix and not text.startswith(suffix, end):
+                continue
+            after = end + len(suffix)
+            if after >= len(text) or not _is_word_char(text[after]):
+                return True
+        return False
+
+    def score(self, text, text_lower=None):
+        """
+        Score every category in one scan of the text.
+
+        Each distinct keyword found adds its weight to the categories it is
+        listed under. Only categories with a positive score are returned, in
+        the order they were defined.
+        """
+        totals = [0] * len(self.categories)
+        for keyword_id in self.find_keywords(text, text_lower):
+            for category_index, weight in self._credits[keyword_id]:
+                totals[category_index] += weight
+        return {category: total for category, total in zip(self.categories, totals) if total > 0}
@@ -0,0 +1,42 @@
+"""
+Deferred imports of heavy dependencies.
+
+lazy_import('cv2') returns a stand-in for the module that imports it the
+first time one of its attributes is used, so importing the analyzer, the
+store or the OCR helpers does not load OpenCV, NumPy, pandas or PyPDF2
+until a code path needs them. On first use the stand-in copies the
+module's attributes, after which lookups cost the same as on the module.
+"""
+import importlib
+import importlib.util
+
+
+class LazyModule:
+    """Stand-in for a module that is imported on first attribute access"""
+
+    def __init__(self, name):
+        self.__dict__['_lazy_name'] = name
+        self.__dict__['_lazy_module'] = None
+
+    def __getattr__(self, attr):
+        # Only reached for attributes not copied over yet
+        module = self._lazy_module
+        if module is None:
+            module = importlib.import_module(self._lazy_name)
+            self.__dict__.update(module.__dict__)
+            self.__dict__['_lazy_module'] = module
+        return getattr(module, attr)
+
+    def __repr__(self):
+        state = "imported" if self._lazy_module is not None else "not imported yet"
+        return f"<lazy module {self._lazy_name!r} ({state})>"
+
+
+def lazy_import(name, optional=False):
+    """
+    Return a LazyModule for `name`. With optional=True, return None instead
+    when the package is not installed, like a guarded import would.
+    """
+    if optional and importlib.util.find_spec(name.partition('.')[0]) is None:
+        return None
+    return LazyModule(name)
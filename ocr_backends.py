@@ -0,0 +1,213 @@
+"""
+Pluggable OCR engines.
+
+Every backend exposes image_to_data(image, config), returning word-level
+results in the same dict layout as pytesseract.image_to_data with
+Output.DICT, so ocr_document does not care which engine produced them.
+
+- PytesseractBackend runs the tesseract CLI once per call. It writes a
+  temporary image, spawns a process and reloads the language model each
+  time, but needs nothing beyond the tesseract binary.
+- TesserocrBackend keeps already-initialized engines from the Tesseract C
+  API (through the optional tesserocr package) in a pool and reuses them,
+  so a call costs only the recognition itself.
+
+INVOICE_OCR_BACKEND selects the backend: 'auto' (default, tesserocr when it
+is installed), 'tesserocr' or 'pytesseract'.
+"""
+import os
+import queue
+import shlex
+import threading
+
+from lazy_imports import lazy_import
+
+# None when the fast-ocr extra is not installed; its native libraries are
+# only loaded once a TesserocrBackend is created
+tesserocr = lazy_import('tesserocr', optional=True)
+
+OCR_BACKEND = os.environ.get('INVOICE_OCR_BACKEND', 'auto')
+OCR_LANGUAGE = os.environ.get('INVOICE_OCR_LANGUAGE', 'eng')
+
+
+def parse_tesseract_config(config):
+    """
+    Split a tesseract command-line config string into
+    (oem, psm, {variable: value}), the same way pytesseract passes it on.
+    """
+    oem, psm, variables = None, None, {}
+    args = shlex.split(config)
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg == '--oem' and i + 1 < len(args):
+            oem = int(args[i + 1])
+            i += 1
+        elif arg == '--psm' and i + 1 < len(args):
+            psm = int(args[i + 1])
+            i += 1
+        elif arg == '-c' and i + 1 < len(args):
+            name, _, value = args[i + 1].partition('=')
+            variables[name] = value
+            i += 1
+        i += 1
+    return oem, psm, variables
+
+
+class PytesseractBackend:
+    """One tesseract subprocess per call"""
+
+    name = 'pytesseract'
+
+    def __init__(self):
+        # Imported with the first backend rather than the module: pytesseract
+        # loads pandas at import time when it is installed
+        import pytesseract
+        self._pytesseract = pytesseract
+        self._version = None
+
+    def version(self):
+        if self._version is None:
+            try:
+                self._version = str(self._pytesseract.get_tesseract_version())
+            except Exception:
+                self._version = "unknown"
+        return self._version
+
+    def image_to_data(self, image, config=''):
+        return self._pytesseract.image_to_data(image, lang=OCR_LANGUAGE, config=config,
+                                               output_type=self._pytesseract.Output.DICT)
+
+
+class TesserocrBackend:
+    """
+    Pool of warm Tesseract engines, reused across calls.
+
+    Engines are keyed by config (engine mode and -c variables are applied
+    once, when an engine is created) and created on demand up to pool_size
+    per config; the default of one is all a single-threaded worker process
+    needs. Each engine serves one caller at a time, so the backend is safe
+    to share between threads.
+    """
+
+    name = 'tesserocr'
+
+    def __init__(self, pool_size=1, lang=OCR_LANGUAGE):
+        if tesserocr is None:
+            raise RuntimeError("tesserocr is not installed")
+        self.pool_size = pool_size
+        self.lang = lang
+        self._idle = {}
+        self._created = {}
+        self._lock = threading.Lock()
+
+    def version(self):
+        return tesserocr.tesseract_version().split()[1]
+
+    def _acquire(self, config):
+        with self._lock:
+            idle = self._idle.setdefault(config, queue.Queue())
+            create = idle.empty() and self._created.get(config, 0) < self.pool_size
+            if create:
+                self._created[config] = self._created.get(config, 0) + 1
+        if not create:
+            return idle.get()
+        
+        oem, _, variables = parse_tesseract_config(config)
+        try:
+            api = tesserocr.PyTessBaseAPI(lang=self.lang, oem=oem if oem is not None else tesserocr.OEM.DEFAULT)
+            for name, value in variables.items():
+                api.SetVariable(name, value)
+        except Exception:
+            # The slot was never filled, so later callers must not wait for it
+            with self._lock:
+                self._created[config] -= 1
+            raise
+        return api
+
+    def image_to_data(self, image, config=''):
+        # tesserocr itself depends on Pillow, so this costs nothing extra
+        from PIL import Image
+        _, psm, _ = parse_tesseract_config(config)
+        api = self._acquire(config)
+        try:
+            api.SetPageSegMode(psm if psm is not None else tesserocr.PSM.AUTO)
+            if not isinstance(image, Image.Image):
+                image = Image.fromarray(image)
+            api.SetImage(image)
+            api.Recognize()
+            return self._collect_words(api)
+        finally:
+            api.Clear()
+            self._idle[config].put(api)
+
+    @staticmethod
+    def _collect_words(api):
+        """Walk the result iterator into pytesseract's word-level dict layout"""
+        RIL = tesserocr.RIL
+        data = {key: [] for key in ('level', 'page_num', 'block_num', 'par_num', 'line_num',
+                                    'word_num', 'left', 'top', 'width', 'height', 'conf', 'text')}
+        iterator = api.GetIterator()
+        if iterator is None:
+            return data
+        block = par = line = word = 0
+        for result in tesserocr.iterate_level(iterator, RIL.WORD):
+            if result.IsAtBeginningOf(RIL.BLOCK):
+                block, par, line, word = block + 1, 0, 0, 0
+            if result.IsAtBeginningOf(RIL.PARA):
+                par, line, word = par + 1, 0, 0
+            if result.IsAtBeginningOf(RIL.TEXTLINE):
+                line, word = line + 1, 0
+            word += 1
+            bbox = result.BoundingBox(RIL.WORD)
+            if bbox is None:
+                continue
+            left, top, right, bottom = bbox
+            data['level'].append(5)
+            data['page_num'].append(1)
+            data['block_num'].append(block)
+            data['par_num'].append(par)
+            data['line_num'].append(line)
+            data['word_num'].append(word)
+            data['left'].append(left)
+            data['top'].append(top)
+            data['width'].append(right - left)
+            data['height'].append(bottom - top)
+            data['conf'].append(result.Confidence(RIL.WORD))
+            data['text'].append(result.GetUTF8Text(RIL.WORD) or '')
+        return data
+
+
+def available_backends():
+    """Names of the backends that can run in this environment"""
+    names = ['pytesseract']
+    if tesserocr is not None:
+        names.insert(0, 'tesserocr')
+    return names
+
+
+def create_backend(name):
+    if name == 'tesserocr':
+        return TesserocrBackend()
+    if name == 'pytesseract':
+        return PytesseractBackend()
+    raise ValueError(f"Unknown OCR backend: {name}")
+
+
+_backend = None
+_backend_pid = None
+_backend_lock = threading.Lock()
+
+
+def get_ocr_backend():
+    """Return this process's OCR backend, creating it on first use"""
+    global _backend, _backend_pid
+    with _backend_lock:
+        # Engines are not shared with forked children; each process warms its own
+        if _backend is None or _backend_pid != os.getpid():
+            name = OCR_BACKEND
+            if name == 'auto':
+                name = available_backends()[0]
+            _backend = create_backend(name)
+            _backend_pid = os.getpid()
+        return _backend
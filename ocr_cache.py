@@ -0,0 +1,182 @@
+"""
+Persistent, content-addressed cache for OCR results.
+
+Entries are keyed on a hash of the document content together with the
+preprocessing and Tesseract configuration that produced them, so a file
+that is uploaded again is answered from disk instead of re-running OCR.
+The cache lives in a SQLite file, is shared by all processes on the
+machine, and evicts the least recently used entries once it grows past
+its size limit.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    'INVOICE_OCR_CACHE_DIR',
+    os.path.join(os.path.expanduser('~'), '.cache', 'invoice-extraction')
+)
+# A limit of 0 disables the cache
+DEFAULT_MAX_BYTES = int(float(os.environ.get('INVOICE_OCR_CACHE_MAX_MB', '512')) * 1024 * 1024)
+
+
+def content_digest(data):
+    """Hash raw document bytes (or anything exposing the buffer protocol)"""
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+
+class OCRCache:
+    """
+    Disk-backed LRU cache of JSON-serializable OCR results.
+
+    Hit and miss counters are stored alongside the entries, so they cover
+    every process using the same cache file, including pool workers.
+    """
+
+    def __init__(self, path=None, max_bytes=DEFAULT_MAX_BYTES):
+        if path is None:
+            os.makedirs(DEFAULT_CACHE_DIR, exist_ok=True)
+            path = os.path.join(DEFAULT_CACHE_DIR, 'ocr_cache.sqlite3')
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used);
+            CREATE TABLE IF NOT EXISTS counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO counters VALUES ('hits', 0), ('misses', 0), ('evictions', 0);
+            -- Running total of entry sizes; summed once for caches created without it
+            INSERT OR IGNORE INTO counters SELECT 'bytes', COALESCE(SUM(size), 0) FROM entries;
+        """)
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    @staticmethod
+    def make_key(kind, digest, config):
+        """Combine the result kind, content digest and configuration into a key"""
+        return content_digest(f"{kind}\0{digest}\0{config}".encode('utf-8'))
+
+    def get(self, key):
+        """Return the cached value for key, or None on a miss"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._conn.execute("UPDATE counters SET value = value + 1 WHERE name = 'misses'")
+                return None
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+                self._conn.execute("UPDATE counters SET value = value + 1 WHERE name = 'hits'")
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        """Store value under key, evicting least recently used entries if needed"""
+        if not self.enabled:
+            return
+        blob = json.dumps(value).encode('utf-8')
+        if len(blob) > self.max_bytes:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                replaced = self._conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO entries (key, value, size, last_used) VALUES (?, ?, ?, ?)",
+                    (key, blob, len(blob), time.time())
+                )
+                total = self._conn.execute(
+                    "UPDATE counters SET value = value + ? WHERE name = 'bytes' RETURNING value",
+                    (len(blob) - (replaced[0] if replaced else 0),)
+                ).fetchone()[0]
+                if total > self.max_bytes:
+                    self._evict(total)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _evict(self, total):
+        # Oldest entries first, a page at a time, until the cache fits again
+        evicted = 0
+        while total > self.max_bytes:
+            rows = self._conn.execute("SELECT key, size FROM entries ORDER BY last_used LIMIT 64").fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                evicted += 1
+                total -= size
+                if total <= self.max_bytes:
+                    break
+        self._conn.execute("UPDATE counters SET value = ? WHERE name = 'bytes'", (total,))
+        self._conn.execute("UPDATE counters SET value = value + ? WHERE name = 'evictions'", (evicted,))
+
+    def stats(self):
+        """Return hit/miss counters and the current size of the cache"""
+        with self._lock:
+            counters = dict(self._conn.execute("SELECT name, value FROM counters").fetchall())
+            entries = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        lookups = counters['hits'] + counters['misses']
+        return {
+            'hits': counters['hits'],
+            'misses': counters['misses'],
+            'evictions': counters['evictions'],
+            'hit_rate': counters['hits'] / lookups if lookups else 0.0,
+            'entries': entries,
+            'size_bytes': counters['bytes'],
+            'max_bytes': self.max_bytes
+        }
+
+    def clear(self):
+        """Drop all entries and reset the counters"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM entries")
+                self._conn.execute("UPDATE counters SET value = 0")
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+
+_default_cache = None
+_default_cache_pid = None
+_default_cache_lock = threading.Lock()
+
+
+def get_ocr_cache():
+    """Return the process-wide cache, opening it on first use"""
+    global _default_cache, _default_cache_pid
+    with _default_cache_lock:
+        # SQLite connections must not be shared with forked children
+        if _default_cache is None or _default_cache_pid != os.getpid():
+            _default_cache_pid = os.getpid()
+            try:
+                _default_cache = OCRCache()
+            except (OSError, sqlite3.Error):
+                # Unwritable cache directory: keep a private in-memory cache
+                _default_cache = OCRCache(path=':memory:')
+        return _default_cache
@@ -1,47 +1,304 @@
-import cv2
-import numpy as np
-import pytesseract
-from PIL import Image
 import io
-import PyPDF2
-import streamlit as st
+import logging
 import re
+import os
+from ocr_cache import get_ocr_cache, content_digest
+from ocr_backends import get_ocr_backend
+from lazy_imports import lazy_import
+import perf
 
-def preprocess_image(image):
+# Loaded on first use, so importing this module stays cheap
+cv2 = lazy_import('cv2')
+np = lazy_import('numpy')
+Image = lazy_import('PIL.Image')
+PyPDF2 = lazy_import('PyPDF2')
+
+logger = logging.getLogger(__name__)
+
+# Content types extract_text_from_file_bytes accepts, by file extension
+FILE_TYPES = {
+    '.pdf': 'application/pdf',
+    '.png': 'image/png',
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+}
+
+# Tesseract configuration used for text extraction
+OCR_CONFIG = r'--oem 3 --psm 6 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz.,$%#@-/:() '
+
+# Bump whenever preprocess_image changes so cached OCR results are not reused
+PREPROCESS_VERSION = 5
+
+# Pages whose text is taller than this (median character height, in pixels)
+# are downscaled so it matches before any other preprocessing step
+OCR_TARGET_TEXT_HEIGHT = int(os.environ.get('INVOICE_OCR_TARGET_TEXT_HEIGHT', '28'))
+# Long-side cap used when the text height cannot be estimated
+OCR_MAX_LONG_SIDE = 3500
+# Text height is measured on a thumbnail with at most this long side
+TEXT_HEIGHT_THUMBNAIL_SIZE = 1600
+# Uploads are decoded at 1/2, 1/4 or 1/8 scale (JPEG DCT scaling) as long as
+# the decoded long side stays at least this large
+DECODE_MIN_LONG_SIDE = OCR_MAX_LONG_SIDE
+
+# cv2.imdecode flags by reduction factor
+_REDUCED_GRAYSCALE_FLAGS = {
+    1: 'IMREAD_GRAYSCALE',
+    2: 'IMREAD_REDUCED_GRAYSCALE_2',
+    4: 'IMREAD_REDUCED_GRAYSCALE_4',
+    8: 'IMREAD_REDUCED_GRAYSCALE_8',
+}
+# Modes OpenCV can decode straight to grayscale; anything with alpha or more
+# than 8 bits per sample goes through PIL instead
+_DIRECT_DECODE_MODES = ('1', 'L', 'P', 'RGB', 'CMYK', 'YCbCr')
+
+# Targeted OCR reads these bands first (fractions of the page height) and
+# widens them to cover header/footer regions found by detect_document_regions
+HEADER_BAND = 0.25
+FOOTER_BAND = 0.25
+# ...but never beyond these limits, so the body is still skipped
+MAX_HEADER_BAND = 0.4
+MAX_FOOTER_BAND = 0.4
+# Fields that must be found in the header and footer to skip the body
+HEADER_FOOTER_FIELDS = ('invoice_number', 'date', 'vendor', 'total_amount')
+
+# Skew is estimated on a thumbnail whose long side is at most this many pixels
+SKEW_THUMBNAIL_SIZE = 1000
+# Largest skew (in degrees, either direction) that is searched for
+SKEW_MAX_ANGLE = 15
+# Upper bound on ink pixels sampled from the thumbnail
+SKEW_MAX_SAMPLES = 50000
+
+def _ocr_cache_config(tesseract_config):
+    """Everything besides the image that determines an OCR result"""
+    backend = get_ocr_backend()
+    return (f"preprocess={PREPROCESS_VERSION}|text_height={OCR_TARGET_TEXT_HEIGHT}"
+            f"|{backend.name}={backend.version()}|{tesseract_config}")
+
+def image_digest(image):
+    """Content hash of raw file bytes, or of a PIL image's or array's pixels"""
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return content_digest(image)
+    if isinstance(image, np.ndarray):
+        array = np.ascontiguousarray(image)
+        return content_digest(f"{array.dtype}{array.shape}".encode('utf-8') + array.tobytes())
+    return content_digest(f"{image.mode}{image.size}".encode('utf-8') + image.tobytes())
+
+def _has_alpha(image):
+    return image.mode in ('RGBA', 'RGBa', 'LA', 'La', 'PA') or 'transparency' in image.info
+
+def _pil_to_grayscale(image):
+    """Convert any PIL image to a uint8 grayscale array"""
+    if _has_alpha(image):
+        # Transparent areas become white paper, not black
+        background = Image.new('RGBA', image.size, (255, 255, 255, 255))
+        image = Image.alpha_composite(background, image.convert('RGBA'))
+    
+    if image.mode.startswith('I') or image.mode == 'F':
+        # 16/32-bit samples: rescale instead of clipping at 255
+        return _to_uint8(np.asarray(image))
+    
+    if image.mode != 'L':
+        image = image.convert('L')
+    return np.asarray(image)
+
+def _to_uint8(array):
+    """
+    Rescale a wider array to uint8 by the range its samples actually use:
+    8-bit values stored in a wider integer type are kept as they are,
+    16-bit ones are divided by 257 and anything larger is scaled by the
+    type's range. Floats are taken as 0-1 when none exceeds 1, else 0-255.
+    """
+    if array.dtype == np.bool_:
+        return array.astype(np.uint8) * 255
+    peak = array.max() if array.size else 0
+    if np.issubdtype(array.dtype, np.floating):
+        scale = 255.0 if peak <= 1.0 else 1.0
+    elif peak <= 255:
+        scale = 1.0
+    elif peak <= 65535:
+        scale = 1 / 257.0
+    else:
+        scale = 255.0 / np.iinfo(array.dtype).max
+    return np.clip(array.astype(np.float32) * scale, 0, 255).astype(np.uint8)
+
+def decode_grayscale(file_bytes):
+    """
+    Decode an uploaded image file straight to a uint8 grayscale array.
+
+    Plain 8-bit images are decoded by OpenCV directly from the upload buffer
+    to a single channel, at reduced resolution when the image is far larger
+    than OCR needs. Images with transparency or 16-bit samples are decoded
+    through PIL so they can be composited on white and rescaled correctly.
+    """
+    with Image.open(io.BytesIO(file_bytes)) as header:
+        mode, size, image_format = header.mode, header.size, header.format
+        transparent = _has_alpha(header)
+    
+    reduction = 1
+    while reduction < 8 and max(size) // (reduction * 2) >= DECODE_MIN_LONG_SIDE:
+        reduction *= 2
+    
+    if image_format in ('JPEG', 'PNG') and mode in _DIRECT_DECODE_MODES and not transparent:
+        buffer = np.frombuffer(file_bytes, dtype=np.uint8)
+        gray = cv2.imdecode(buffer, getattr(cv2, _REDUCED_GRAYSCALE_FLAGS[reduction]))
+        if gray is not None:
+            return gray
+    
+    image = Image.open(io.BytesIO(file_bytes))
+    if reduction > 1 and image_format == 'JPEG':
+        image.draft('L', (size[0] // reduction, size[1] // reduction))
+    return _pil_to_grayscale(image)
+
+def load_grayscale(image):
+    """
+    Return a uint8 grayscale array for a PIL image, an array or raw file
+    bytes. Grayscale arrays are returned as they are, so a page decoded once
+    can be shared by preprocessing, region detection and OCR.
     """
-    Preprocess image for better OCR accuracy using OpenCV
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return decode_grayscale(bytes(image))
+    
+    if isinstance(image, np.ndarray):
+        if image.ndim == 2 and image.dtype == np.uint8:
+            return image
+        if image.dtype != np.uint8:
+            image = _to_uint8(image)
+        if image.ndim == 2:
+            return image
+        if image.shape[2] == 4:
+            return _pil_to_grayscale(Image.fromarray(image, 'RGBA'))
+        return cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    
+    return _pil_to_grayscale(image)
+
+def estimate_text_height(gray):
+    """
+    Estimate the median character height of a grayscale page, in pixels.
+
+    Measured on a thumbnail from the connected components that are shaped
+    like characters. Returns None when too few are found to be reliable.
+    """
+    height, width = gray.shape[:2]
+    scale = min(1.0, TEXT_HEIGHT_THUMBNAIL_SIZE / max(height, width))
+    if scale < 1.0:
+        thumbnail = cv2.resize(gray, (max(1, int(width * scale)), max(1, int(height * scale))),
+                               interpolation=cv2.INTER_AREA)
+    else:
+        thumbnail = gray
+    
+    ink = cv2.adaptiveThreshold(
+        thumbnail, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 31, 15
+    )
+    count, _, stats, _ = cv2.connectedComponentsWithStats(ink, connectivity=8)
+    
+    heights = stats[1:, cv2.CC_STAT_HEIGHT]
+    widths = stats[1:, cv2.CC_STAT_WIDTH]
+    areas = stats[1:, cv2.CC_STAT_AREA]
+    # Characters: a few pixels tall at least, not page-sized, not long rules
+    # or merged words, and not hairlines
+    plausible = (heights >= 4) & (heights <= thumbnail.shape[0] // 10) & (widths <= heights * 3) & (areas >= 8)
+    if np.count_nonzero(plausible) < 20:
+        return None
+    
+    return float(np.median(heights[plausible])) / scale
+
+def normalize_resolution(gray, target_text_height=None):
+    """
+    Downscale oversized pages (e.g. phone photos) so that their text is about
+    target_text_height pixels tall, which is all Tesseract needs. Pages whose
+    text height cannot be estimated are capped at OCR_MAX_LONG_SIDE.
+    Smaller pages are returned unchanged.
     """
-    # Convert PIL image to OpenCV format
-    opencv_image = np.array(image)
+    if target_text_height is None:
+        target_text_height = OCR_TARGET_TEXT_HEIGHT
     
-    # Convert to grayscale if needed
-    if len(opencv_image.shape) == 3:
-        gray = cv2.cvtColor(opencv_image, cv2.COLOR_RGB2GRAY)
+    height, width = gray.shape[:2]
+    text_height = estimate_text_height(gray)
+    if text_height is not None:
+        scale = target_text_height / text_height
     else:
-        gray = opencv_image
+        scale = OCR_MAX_LONG_SIDE / max(height, width)
+    
+    # Leave pages that are at most 25% above target alone
+    if scale >= 0.8:
+        return gray
+    
+    return cv2.resize(gray, (max(1, int(width * scale)), max(1, int(height * scale))),
+                      interpolation=cv2.INTER_AREA)
+
+def estimate_skew_angle(binary):
+    """
+    Estimate the skew of dark text on a light background, in degrees.
+
+    The page is shrunk to a thumbnail first, so time and memory are bounded
+    no matter how large the scan is. The angle whose horizontal projection
+    profile of the ink pixels is sharpest (text lines collapse into narrow
+    peaks) is searched coarsely and then refined. The result can be passed
+    straight to cv2.getRotationMatrix2D to deskew the full-size image.
+    """
+    height, width = binary.shape[:2]
+    scale = min(1.0, SKEW_THUMBNAIL_SIZE / max(height, width))
+    if scale < 1.0:
+        thumbnail = cv2.resize(binary, (max(1, int(width * scale)), max(1, int(height * scale))),
+                               interpolation=cv2.INTER_AREA)
+    else:
+        thumbnail = binary
+    
+    # Ink pixel coordinates, relative to the thumbnail centre
+    ys, xs = np.nonzero(thumbnail < 128)
+    if len(ys) < 50:
+        return 0.0
+    # Dense pages do not need every ink pixel to find the angle
+    step = max(1, len(ys) // SKEW_MAX_SAMPLES)
+    ys, xs = ys[::step], xs[::step]
+    ys = ys.astype(np.float32) - thumbnail.shape[0] / 2
+    xs = xs.astype(np.float32) - thumbnail.shape[1] / 2
+    
+    def profile_sharpness(angle):
+        theta = np.deg2rad(angle)
+        rows = ys * np.cos(theta) - xs * np.sin(theta)
+        histogram = np.bincount((rows - rows.min()).astype(np.int32))
+        return float(np.dot(histogram, histogram))
+    
+    best_angle = max(np.arange(-SKEW_MAX_ANGLE, SKEW_MAX_ANGLE + 0.5, 1.0), key=profile_sharpness)
+    best_angle = max(np.arange(best_angle - 1.0, best_angle + 1.05, 0.1), key=profile_sharpness)
+    
+    return round(float(best_angle), 2)
+
+def preprocess_image(image, target_text_height=None, normalized=False):
+    """
+    Preprocess image for better OCR accuracy using OpenCV. With
+    normalized=True the image has already been through normalize_resolution.
+    """
+    # Grayscale view of the page (no copy if it already is one)
+    with perf.stage('decode'):
+        gray = load_grayscale(image)
     
     # Apply image preprocessing techniques
+    # 0. Resample oversized pages to the target OCR resolution
+    if not normalized:
+        with perf.stage('preprocess.normalize'):
+            gray = normalize_resolution(gray, target_text_height)
+    
     # 1. Noise reduction
-    denoised = cv2.medianBlur(gray, 5)
+    with perf.stage('preprocess.denoise'):
+        denoised = cv2.medianBlur(gray, 5)
     
     # 2. Thresholding for better contrast
     # Use adaptive thresholding for better results with varying lighting
-    thresh = cv2.adaptiveThreshold(
-        denoised, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2
-    )
+    with perf.stage('preprocess.threshold'):
+        thresh = cv2.adaptiveThreshold(
+            denoised, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2
+        )
     
     # 3. Morphological operations to clean up the image
-    kernel = np.ones((1, 1), np.uint8)
-    cleaned = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
-    
-    # 4. Find and correct skew (basic implementation)
-    coords = np.column_stack(np.where(cleaned > 0))
-    if len(coords) > 0:
-        angle = cv2.minAreaRect(coords)[-1]
-        if angle < -45:
-            angle = -(90 + angle)
-        else:
-            angle = -angle
+    with perf.stage('preprocess.morphology'):
+        kernel = np.ones((1, 1), np.uint8)
+        cleaned = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
+    
+    # 4. Find and correct skew, estimated on a thumbnail
+    with perf.stage('preprocess.deskew'):
+        angle = estimate_skew_angle(cleaned)
         
         # Only correct if skew is significant
         if abs(angle) > 0.5:
@@ -51,38 +308,100 @@ def preprocess_image(image):
             cleaned = cv2.warpAffine(cleaned, M, (w, h), flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE)
     
     # 5. Resize image if too small (OCR works better with larger images)
-    height, width = cleaned.shape
-    if height < 300 or width < 300:
-        scale_factor = max(300 / height, 300 / width)
-        new_width = int(width * scale_factor)
-        new_height = int(height * scale_factor)
-        cleaned = cv2.resize(cleaned, (new_width, new_height), interpolation=cv2.INTER_CUBIC)
+    with perf.stage('preprocess.upscale'):
+        height, width = cleaned.shape
+        if height < 300 or width < 300:
+            scale_factor = max(300 / height, 300 / width)
+            new_width = int(width * scale_factor)
+            new_height = int(height * scale_factor)
+            cleaned = cv2.resize(cleaned, (new_width, new_height), interpolation=cv2.INTER_CUBIC)
     
     return cleaned
 
-def process_image(image):
+def ocr_document(image, digest=None, normalized=False):
     """
-    Process image and extract text using OCR
+    Run preprocessing and Tesseract once and return everything OCR knows
+    about the page:
+
+    - 'text': the recognized text, one line per Tesseract line and a blank
+      line between blocks
+    - 'words': one dict per word with its 'text', 'confidence' and 'bbox'
+      ([left, top, width, height] in preprocessed-image pixels)
+    - 'confidence': the average confidence of the recognized words
+
+    image may be raw file bytes, a PIL image or an array. Results are cached
+    on disk by content; raw bytes are hashed as they are and only decoded on
+    a cache miss. normalized is passed on to preprocess_image. Errors are
+    raised to the caller.
     """
-    try:
-        # Preprocess the image
-        processed_image = preprocess_image(image)
+    cache = get_ocr_cache()
+    cache_key = cache.make_key('document', digest or image_digest(image), _ocr_cache_config(OCR_CONFIG))
+    cached_document = cache.get(cache_key)
+    if cached_document is not None:
+        return cached_document
+    
+    # Preprocess the image
+    processed_image = preprocess_image(image, normalized=normalized)
+    
+    # A single Tesseract run gives text, confidences and word boxes
+    with perf.stage('ocr.tesseract'):
+        data = get_ocr_backend().image_to_data(processed_image, OCR_CONFIG)
+    document = document_from_ocr_data(data)
+    
+    cache.put(cache_key, document)
+    return document
+
+def document_from_ocr_data(data):
+    """Assemble the ocr_document result from word-level image_to_data output"""
+    words = []
+    lines = []
+    current_line = None
+    current_block = None
+    for i, word_text in enumerate(data['text']):
+        word_text = str(word_text).strip()
+        # Only word-level rows carry text; the others describe the layout
+        if int(data['level'][i]) != 5 or not word_text:
+            continue
         
-        # Configure Tesseract for better accuracy
-        custom_config = r'--oem 3 --psm 6 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz.,$%#@-/:() '
+        block = (data['page_num'][i], data['block_num'][i])
+        line = block + (data['par_num'][i], data['line_num'][i])
+        if line != current_line:
+            if current_block is not None and block != current_block:
+                lines.append("")
+            lines.append(word_text)
+            current_line = line
+            current_block = block
+        else:
+            lines[-1] += " " + word_text
         
-        # Extract text using Tesseract
-        extracted_text = pytesseract.image_to_string(processed_image, config=custom_config)
+        words.append({
+            'text': word_text,
+            'confidence': float(data['conf'][i]),
+            'bbox': [int(data['left'][i]), int(data['top'][i]), int(data['width'][i]), int(data['height'][i])]
+        })
+    
+    confidences = [word['confidence'] for word in words if word['confidence'] > 0]
+    return {
+        'text': "\n".join(lines),
+        'words': words,
+        'confidence': sum(confidences) / len(confidences) if confidences else 0
+    }
+
+def process_image(image, digest=None):
+    """
+    Process image and extract text using OCR
+    """
+    try:
+        document = ocr_document(image, digest)
         
         # Clean up the extracted text
-        cleaned_text = clean_extracted_text(extracted_text)
-        
-        return cleaned_text
+        return clean_extracted_text(document['text'])
         
     except Exception as e:
-        st.error(f"Error in OCR processing: {str(e)}")
+        logger.exception("Error in OCR processing: %s", e)
         return ""
 
+@perf.timed('clean')
 def clean_extracted_text(text):
     """
     Clean and normalize extracted text
@@ -109,42 +428,61 @@ def extract_text_from_pdf(pdf_file):
         # Reset file pointer
         pdf_file.seek(0)
         
-        # Read PDF
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
+        cache = get_ocr_cache()
+        cache_key = cache.make_key('pdf-text', content_digest(pdf_file.read()), f"pypdf2={PyPDF2.__version__}")
+        cached_text = cache.get(cache_key)
+        if cached_text is not None:
+            return cached_text
+        pdf_file.seek(0)
         
-        extracted_text = ""
-        for page_num in range(len(pdf_reader.pages)):
-            page = pdf_reader.pages[page_num]
-            text = page.extract_text()
-            if text:
-                extracted_text += text + "\n"
+        with perf.stage('pdf.text'):
+            raw_text = read_pdf_text(pdf_file)
+        cleaned_text = clean_extracted_text(raw_text)
         
-        # Clean up the extracted text
-        cleaned_text = clean_extracted_text(extracted_text)
+        if cleaned_text:
+            cache.put(cache_key, cleaned_text)
         
         return cleaned_text
         
     except Exception as e:
-        st.error(f"Error extracting text from PDF: {str(e)}")
+        logger.exception("Error extracting text from PDF: %s", e)
         return ""
 
-def get_text_confidence(image):
+def read_pdf_text(pdf_file):
+    """Raw text layer of every page of a PDF file object, uncached"""
+    pdf_reader = PyPDF2.PdfReader(pdf_file)
+    
+    extracted_text = ""
+    for page in pdf_reader.pages:
+        text = page.extract_text()
+        if text:
+            extracted_text += text + "\n"
+    
+    return extracted_text
+
+def extract_text_from_file_bytes(file_bytes, file_type, analyzer=None, include_items=True):
+    """
+    Extract text from the raw bytes of an uploaded file.
+
+    Takes plain bytes rather than an upload object so it can be sent to a
+    worker process. Passing an analyzer switches images to targeted OCR
+    (see extract_text_targeted).
+    """
+    if file_type == "application/pdf":
+        return extract_text_from_pdf(io.BytesIO(file_bytes))
+    
+    if analyzer is not None:
+        return extract_text_targeted(file_bytes, analyzer, include_items=include_items)
+    
+    # Decoded only on a cache miss, straight to grayscale
+    return process_image(file_bytes)
+
+def get_text_confidence(image, digest=None):
     """
     Get OCR confidence score
     """
     try:
-        processed_image = preprocess_image(image)
-        
-        # Get confidence data
-        data = pytesseract.image_to_data(processed_image, output_type=pytesseract.Output.DICT)
-        confidences = [int(conf) for conf in data['conf'] if int(conf) > 0]
-        
-        if confidences:
-            avg_confidence = sum(confidences) / len(confidences)
-            return avg_confidence
-        else:
-            return 0
-            
+        return ocr_document(image, digest)['confidence']
     except Exception as e:
         return 0
 
@@ -153,9 +491,7 @@ def detect_document_regions(image):
     Detect different regions in the document (header, body, footer)
     """
     try:
-        # Convert PIL image to OpenCV format
-        opencv_image = np.array(image)
-        gray = cv2.cvtColor(opencv_image, cv2.COLOR_RGB2GRAY)
+        gray = load_grayscale(image)
         
         # Find contours
         edges = cv2.Canny(gray, 50, 150, apertureSize=3)
@@ -188,3 +524,65 @@ def detect_document_regions(image):
         
     except Exception as e:
         return []
+
+def _page_bands(gray):
+    """Split a page into (top, bottom) row ranges for header, body and footer"""
+    height = gray.shape[0]
+    header_end = int(height * HEADER_BAND)
+    footer_start = int(height * (1 - FOOTER_BAND))
+    
+    for region in detect_document_regions(gray):
+        x, y, w, h = region['bbox']
+        if region['type'] == 'header':
+            header_end = max(header_end, min(y + h, int(height * MAX_HEADER_BAND)))
+        elif region['type'] == 'footer':
+            footer_start = min(footer_start, max(y, int(height * (1 - MAX_FOOTER_BAND))))
+    
+    return (0, header_end), (header_end, footer_start), (footer_start, height)
+
+def _missing_fields(invoice_data):
+    return [field for field in HEADER_FOOTER_FIELDS if invoice_data.get(field) in ('Not found', 0.0, None)]
+
+def extract_text_targeted(image, analyzer, include_items=False):
+    """
+    Region-targeted OCR for pages where only the header fields and totals
+    are needed.
+
+    The header and footer bands, where invoice number, vendor, date and
+    totals usually sit, are OCR'd first and analyzed on their own. The body
+    is only OCR'd when some of HEADER_FOOTER_FIELDS are still missing or
+    include_items is set. That analysis does not count towards the
+    analyzer's learned vendor date orders, as the caller analyzes the
+    returned text again. Returns the cleaned text of the bands that were
+    read, in page order.
+
+    Band results are cached under the page digest plus the row range, so
+    only a repeated targeted read of the page hits them; a full-page read
+    through process_image is cached under the page digest alone.
+    """
+    try:
+        digest = image_digest(image)
+        gray = normalize_resolution(load_grayscale(image))
+        header, body, footer = _page_bands(gray)
+        
+        def read_band(band):
+            top, bottom = band
+            if bottom - top < 10:
+                return ""
+            # Each band is cached on its own, keyed by page and row range;
+            # the page was normalized as a whole, so bands are not again
+            return ocr_document(gray[top:bottom], f"{digest}@{top}:{bottom}", normalized=True)['text']
+        
+        header_text = read_band(header)
+        footer_text = read_band(footer)
+        extracted_text = clean_extracted_text(header_text + "\n" + footer_text)
+        
+        if include_items or _missing_fields(analyzer.analyze_invoice_text(extracted_text, learn=False)):
+            body_text = read_band(body)
+            extracted_text = clean_extracted_text("\n".join([header_text, body_text, footer_text]))
+        
+        return extracted_text
+        
+    except Exception as e:
+        logger.exception("Error in OCR processing: %s", e)
+        return ""
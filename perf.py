@@ -0,0 +1,198 @@
+"""
+Lightweight per-stage timing instrumentation.
+
+Code marks its stages with the stage() context manager or the timed()
+decorator. While instrumentation is enabled every stage's duration is
+recorded in a rolling window per stage (for p50/p95/p99) and, inside a
+document() block, added to that document's breakdown. While disabled both
+reduce to a flag check, so they can stay in hot paths.
+
+Timings are kept per process: work done in pool workers is recorded in
+the workers, not in the process that submitted it, unless the worker hands
+its document() breakdown back to be merged with add_document().
+
+INVOICE_PERF=1 enables instrumentation at startup; enable() and disable()
+switch it at runtime.
+"""
+import contextlib
+import contextvars
+import functools
+import io
+import os
+import threading
+import time
+from collections import deque
+
+# Samples kept per stage for the rolling percentiles
+HISTOGRAM_WINDOW = 1000
+# Per-document breakdowns kept for inspection
+RECENT_DOCUMENTS = 100
+
+_enabled = os.environ.get('INVOICE_PERF', '0') == '1'
+_lock = threading.Lock()
+_samples = {}
+_totals = {}
+_documents = deque(maxlen=RECENT_DOCUMENTS)
+_current_document = contextvars.ContextVar('perf_document', default=None)
+_NULL_STAGE = contextlib.nullcontext()
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def _add_sample(name, seconds):
+    window = _samples.get(name)
+    if window is None:
+        window = _samples[name] = deque(maxlen=HISTOGRAM_WINDOW)
+        _totals[name] = [0, 0.0]
+    window.append(seconds)
+    _totals[name][0] += 1
+    _totals[name][1] += seconds
+
+
+def record(name, seconds):
+    """Add one duration for a stage"""
+    with _lock:
+        _add_sample(name, seconds)
+    document = _current_document.get()
+    if document is not None:
+        document['stages'][name] = document['stages'].get(name, 0.0) + seconds
+
+
+class _Stage:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def stage(name):
+    """Context manager timing the enclosed block as stage `name`"""
+    if not _enabled:
+        return _NULL_STAGE
+    return _Stage(name)
+
+
+def timed(name):
+    """Decorator timing every call of a function as stage `name`"""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(name, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+@contextlib.contextmanager
+def document(name):
+    """
+    Collect the stages run inside the block into a per-document breakdown,
+    which is also the value of the with statement. Nested document() blocks
+    are folded into the outermost one and, like disabled ones, give None.
+    """
+    if not _enabled or _current_document.get() is not None:
+        yield None
+        return
+    entry = {'document': name, 'started': time.strftime("%Y-%m-%d %H:%M:%S"), 'stages': {}}
+    token = _current_document.set(entry)
+    start = time.perf_counter()
+    try:
+        yield entry
+    finally:
+        entry['total'] = time.perf_counter() - start
+        _current_document.reset(token)
+        with _lock:
+            _documents.append(entry)
+
+
+def add_document(entry):
+    """
+    Merge a breakdown recorded by document() in another process, adding
+    its stages to this process's rolling windows
+    """
+    with _lock:
+        for name, seconds in entry['stages'].items():
+            _add_sample(name, seconds)
+        _documents.append(entry)
+
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def stage_summary():
+    """
+    {stage: {count, total_s, mean_ms, p50_ms, p95_ms, p99_ms}}, with the
+    percentiles taken over the last HISTOGRAM_WINDOW samples
+    """
+    with _lock:
+        snapshot = {name: (sorted(window), tuple(_totals[name])) for name, window in _samples.items()}
+    summary = {}
+    for name, (ordered, (count, total)) in sorted(snapshot.items()):
+        summary[name] = {
+            'count': count,
+            'total_s': total,
+            'mean_ms': total / count * 1000,
+            'p50_ms': _percentile(ordered, 0.50) * 1000,
+            'p95_ms': _percentile(ordered, 0.95) * 1000,
+            'p99_ms': _percentile(ordered, 0.99) * 1000,
+        }
+    return summary
+
+
+def recent_documents():
+    """Per-document breakdowns, newest first"""
+    with _lock:
+        return list(reversed(_documents))
+
+
+def reset():
+    with _lock:
+        _samples.clear()
+        _totals.clear()
+        _documents.clear()
+
+
+def profile(func, *args, **kwargs):
+    """
+    Run func once under cProfile. Returns (result, stats dump, text report);
+    the dump is the bytes pstats.Stats can load from a file.
+    """
+    # Imported here: pstats alone takes longer to import than the rest of this module
+    import cProfile
+    import marshal
+    import pstats
+
+    profiler = cProfile.Profile()
+    result = profiler.runcall(func, *args, **kwargs)
+    profiler.create_stats()
+    # Dumped first: pstats.Stats takes the stats over and empties the profiler
+    dump = marshal.dumps(profiler.stats)
+    report = io.StringIO()
+    pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(30)
+    return result, dump, report.getvalue()
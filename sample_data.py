@@ -1,5 +1,18 @@
 from datetime import datetime, timedelta
 import random
+from lazy_imports import lazy_import
+
+# Only needed to render pages; loaded on first use
+cv2 = lazy_import('cv2')
+np = lazy_import('numpy')
+Image = lazy_import('PIL.Image')
+ImageDraw = lazy_import('PIL.ImageDraw')
+ImageFont = lazy_import('PIL.ImageFont')
+
+# Rendered pages are A4 with a 0.75 inch margin and 12 pt text
+PAGE_SIZE_INCHES = (8.27, 11.69)
+PAGE_MARGIN_INCHES = 0.75
+FONT_SIZE_POINTS = 12
 
 def get_sample_data():
     """
@@ -152,3 +165,88 @@ def generate_random_invoice():
         'processed_date': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
         'extracted_text': f'{vendor}\nInvoice: {invoice_number}\nDate: {invoice_date}\n{category} Services: ${base_amount:.2f}\nTax: ${tax_amount:.2f}\nTotal: ${total_amount:.2f}'
     }
+
+def _split_pages(lines, pages):
+    """Spread an invoice's lines over the requested number of pages"""
+    pages = max(1, pages)
+    per_page = -(-len(lines) // pages)
+    chunks = [lines[i * per_page:(i + 1) * per_page] for i in range(pages)]
+    if pages == 1:
+        return chunks
+    return [[f"Page {number} of {pages}"] + chunk for number, chunk in enumerate(chunks, 1)]
+
+def render_invoice_pages(invoice, dpi=150, pages=1, skew=0.0, noise=0.0, blur=0.0, seed=None):
+    """
+    Render an invoice's text as scanned-looking grayscale pages.
+
+    Returns one uint8 array per page (A4 at the given dpi, black text on
+    white). skew rotates each page by that many degrees, noise adds Gaussian
+    noise with that standard deviation in gray levels, and blur applies a
+    Gaussian blur with that sigma in pixels.
+    """
+    rng = np.random.default_rng(seed)
+    width, height = int(PAGE_SIZE_INCHES[0] * dpi), int(PAGE_SIZE_INCHES[1] * dpi)
+    margin = int(PAGE_MARGIN_INCHES * dpi)
+    font_size = max(8, round(FONT_SIZE_POINTS / 72 * dpi))
+    try:
+        font = ImageFont.load_default(size=font_size)
+    except TypeError:
+        # Pillow < 10.1 only has the fixed-size bitmap font
+        font = ImageFont.load_default()
+    
+    rendered = []
+    for page_lines in _split_pages(invoice['extracted_text'].split('\n'), pages):
+        page = Image.new('L', (width, height), 255)
+        draw = ImageDraw.Draw(page)
+        for number, line in enumerate(page_lines):
+            draw.text((margin, margin + number * font_size * 1.5), line, fill=0, font=font)
+        page = np.asarray(page)
+        
+        if skew:
+            matrix = cv2.getRotationMatrix2D((width / 2, height / 2), skew, 1.0)
+            page = cv2.warpAffine(page, matrix, (width, height), flags=cv2.INTER_LINEAR, borderValue=255)
+        if blur:
+            page = cv2.GaussianBlur(page, (0, 0), blur)
+        if noise:
+            noisy = page.astype(np.float32) + rng.normal(0, noise, page.shape)
+            page = np.clip(noisy, 0, 255).astype(np.uint8)
+        rendered.append(page)
+    
+    return rendered
+
+def _pdf_string(text):
+    return "(" + text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ")"
+
+def render_invoice_pdf(invoice, pages=1):
+    """
+    Render an invoice as a PDF with a text layer (Helvetica, A4), spread
+    over the requested number of pages. Returns the PDF bytes.
+    """
+    page_lines = _split_pages(invoice['extracted_text'].split('\n'), pages)
+    width, height = int(PAGE_SIZE_INCHES[0] * 72), int(PAGE_SIZE_INCHES[1] * 72)
+    margin = int(PAGE_MARGIN_INCHES * 72)
+    
+    # Objects: catalog, page tree, font, then a page and its content per page
+    page_ids = [4 + 2 * index for index in range(len(page_lines))]
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{' '.join(f'{page_id} 0 R' for page_id in page_ids)}] /Count {len(page_ids)} >>",
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for page_id, lines in zip(page_ids, page_lines):
+        content = (f"BT /F1 {FONT_SIZE_POINTS} Tf {FONT_SIZE_POINTS * 1.5} TL {margin} {height - margin} Td "
+                   + " ".join(f"{_pdf_string(line)} Tj T*" for line in lines) + " ET")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width} {height}] "
+                       f"/Contents {page_id + 1} 0 R /Resources << /Font << /F1 3 0 R >> >> >>")
+        objects.append(f"<< /Length {len(content)} >>\nstream\n{content}\nendstream")
+    
+    pdf = "%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(pdf))
+        pdf += f"{number} 0 obj\n{body}\nendobj\n"
+    xref = len(pdf)
+    pdf += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n"
+    pdf += "".join(f"{offset:010d} 00000 n \n" for offset in offsets)
+    pdf += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n"
+    return pdf.encode('latin-1')
@@ -0,0 +1,439 @@
+"""
+Local HTTP extraction service.
+
+    python service.py --port 8080 --workers 4
+
+Endpoints (all responses are JSON):
+
+    POST   /extract          Raw file body with Content-Type image/png,
+                             image/jpeg or application/pdf; optional
+                             ?filename=...&header_only=1. Answers with the
+                             extracted invoice; nothing is stored.
+    POST   /extract?async=1  Queues the file as a background job whose result
+                             goes into the invoice store; answers 202 with
+                             the job id.
+    GET    /jobs/<id>        Status and result of a background job
+    DELETE /jobs/<id>        Cancel a background job
+    POST   /analyze          {"text": "..."} or {"texts": [...]}: analysis of
+                             already extracted text
+    GET    /healthz          Liveness
+    GET    /metrics          Queue depths, latency percentiles, batching and
+                             OCR cache statistics
+
+Files are extracted in a pool of worker processes started with the
+service. At most workers + queue_size extractions are accepted at once and
+concurrent /analyze requests wait in a queue of queue_size requests; beyond
+that the service answers 503 with Retry-After. /analyze requests arriving
+within BATCH_WINDOW of each other are analyzed together in one worker
+call. Analysis batches share the workers with file extraction.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError, ProcessPoolExecutor, TimeoutError, wait
+from concurrent.futures.process import BrokenProcessPool
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import perf
+from jobs import DEFAULT_JOBS_PATH, JobQueue, analyze_texts, extract_file, init_worker
+from ocr_cache import get_ocr_cache
+from ocr_utils import FILE_TYPES
+
+logger = logging.getLogger(__name__)
+
+# Requests accepted beyond the ones the workers are running, per endpoint
+DEFAULT_QUEUE_SIZE = 32
+# Seconds an /analyze request waits for others to join its batch
+BATCH_WINDOW = 0.005
+# Most texts analyzed in one worker call
+BATCH_MAX_TEXTS = 256
+# Largest accepted request body
+MAX_BODY_BYTES = 50 * 1024 * 1024
+# Seconds clients are told to wait after a 503
+RETRY_AFTER_SECONDS = 1
+# Seconds an /analyze request waits for its batch before answering 504
+ANALYZE_TIMEOUT = 30
+
+
+class ServiceError(Exception):
+    """An error answered with its HTTP status and message"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _settle(future, result=None, exception=None):
+    # Requests that timed out have cancelled their future already
+    try:
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+    except InvalidStateError:
+        pass
+
+
+def _flag(query, name):
+    return query.get(name, ['0'])[0].lower() in ('1', 'true', 'yes')
+
+
+class ExtractionService:
+    """
+    Worker pool, admission limits and the /analyze batcher behind the HTTP
+    handler. Request latencies are recorded with perf.record under
+    "http.<endpoint>".
+    """
+
+    def __init__(self, workers=None, queue_size=DEFAULT_QUEUE_SIZE, jobs_path=DEFAULT_JOBS_PATH):
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self.jobs_path = jobs_path
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._pool = None
+        self._jobs = None
+        self._extract_slots = threading.BoundedSemaphore(self.workers + queue_size)
+        self._extracting = 0
+        self._rejected = 0
+        self._batches = 0
+        self._batched_texts = 0
+        # Pending /analyze requests as (texts, future) pairs
+        self._analyze_queue = queue.Queue(maxsize=queue_size)
+        # Batches handed to the pool but not finished yet
+        self._batch_slots = threading.BoundedSemaphore(self.workers)
+        self._get_pool(warm=True)
+        threading.Thread(target=self._batch_loop, name="analyze-batcher", daemon=True).start()
+
+    # Worker pool
+
+    def _get_pool(self, warm=False):
+        with self._lock:
+            if self._pool is None:
+                # Spawn rather than fork: the server process is multi-threaded
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                    initializer=init_worker
+                )
+                if warm:
+                    # One task per worker starts every process (and its
+                    # imports and analyzer) before the first request
+                    wait([self._pool.submit(analyze_texts, [""]) for _ in range(self.workers)])
+            return self._pool
+
+    def _submit(self, func, *args):
+        """Submit to the pool; returns (future, the pool it runs in)"""
+        pool = self._get_pool()
+        try:
+            return pool.submit(func, *args), pool
+        except BrokenProcessPool:
+            self._discard_pool(pool)
+            pool = self._get_pool()
+            return pool.submit(func, *args), pool
+
+    def _discard_pool(self, pool):
+        # A crashed worker leaves the pool unusable; the next task starts a fresh one
+        with self._lock:
+            if self._pool is not pool:
+                return
+            self._pool = None
+        pool.shutdown(wait=False)
+
+    def _get_jobs(self):
+        with self._lock:
+            if self._jobs is None:
+                self._jobs = JobQueue(self.jobs_path, workers=self.workers)
+            return self._jobs
+
+    def close(self):
+        with self._lock:
+            if self._jobs is not None:
+                self._jobs.close()
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+
+    # Endpoints
+
+    def _reject(self, what):
+        with self._lock:
+            self._rejected += 1
+        raise ServiceError(HTTPStatus.SERVICE_UNAVAILABLE, f"{what} queue is full, retry later")
+
+    def extract(self, body, content_type, query):
+        if content_type not in FILE_TYPES.values():
+            raise ServiceError(HTTPStatus.UNSUPPORTED_MEDIA_TYPE,
+                               f"Content-Type must be one of {', '.join(sorted(set(FILE_TYPES.values())))}")
+        if not body:
+            raise ServiceError(HTTPStatus.BAD_REQUEST, "Empty request body")
+        filename = query.get('filename', ['upload'])[0]
+        header_only = _flag(query, 'header_only')
+
+        if _flag(query, 'async'):
+            jobs = self._get_jobs()
+            if jobs.active_count() >= self.workers + self.queue_size:
+                self._reject("Job")
+            job_id = jobs.submit(body, filename, content_type, header_only)
+            return HTTPStatus.ACCEPTED, {'job_id': job_id, 'status': jobs.status(job_id)['status']}
+
+        if not self._extract_slots.acquire(blocking=False):
+            self._reject("Extraction")
+        with self._lock:
+            self._extracting += 1
+        try:
+            future, pool = self._submit(extract_file, body, content_type, filename, header_only, perf.is_enabled())
+            try:
+                invoice_data, breakdown = future.result()
+            except BrokenProcessPool:
+                self._discard_pool(pool)
+                raise ServiceError(HTTPStatus.SERVICE_UNAVAILABLE, "OCR worker crashed, retry later")
+        finally:
+            with self._lock:
+                self._extracting -= 1
+            self._extract_slots.release()
+        if breakdown is not None:
+            perf.add_document(breakdown)
+        if invoice_data is None:
+            raise ServiceError(HTTPStatus.UNPROCESSABLE_ENTITY, "Failed to extract text from document")
+        invoice_data['filename'] = filename
+        return HTTPStatus.OK, invoice_data
+
+    def job(self, job_id, cancel=False):
+        jobs = self._get_jobs()
+        if cancel:
+            jobs.cancel(job_id)
+        status = jobs.status(job_id)
+        if status is None:
+            raise ServiceError(HTTPStatus.NOT_FOUND, f"No job {job_id}")
+        return HTTPStatus.OK, status
+
+    def analyze(self, body):
+        try:
+            request = json.loads(body or b'null')
+        except ValueError:
+            raise ServiceError(HTTPStatus.BAD_REQUEST, "Body must be JSON")
+        single = isinstance(request, dict) and isinstance(request.get('text'), str)
+        texts = [request['text']] if single else request.get('texts') if isinstance(request, dict) else None
+        if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+            raise ServiceError(HTTPStatus.BAD_REQUEST, 'Expected {"text": "..."} or {"texts": ["...", ...]}')
+
+        future = Future()
+        try:
+            self._analyze_queue.put_nowait((texts, future))
+        except queue.Full:
+            self._reject("Analysis")
+        try:
+            results = future.result(timeout=ANALYZE_TIMEOUT)
+        except TimeoutError:
+            # The batch still finishes in its worker; its result is dropped
+            future.cancel()
+            raise ServiceError(HTTPStatus.GATEWAY_TIMEOUT, "Analysis timed out")
+        except BrokenProcessPool:
+            raise ServiceError(HTTPStatus.SERVICE_UNAVAILABLE, "Analysis worker crashed, retry later")
+        return HTTPStatus.OK, results[0] if single else {'results': results}
+
+    def _batch_loop(self):
+        """Collect queued /analyze requests into batches and run them in the pool"""
+        while True:
+            batch = [self._analyze_queue.get()]
+            size = len(batch[0][0])
+            deadline = time.perf_counter() + BATCH_WINDOW
+            while size < BATCH_MAX_TEXTS:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self._analyze_queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(request)
+                size += len(request[0])
+
+            # Waits while every worker is busy with a batch, so requests
+            # back up in the bounded queue rather than in the pool
+            self._batch_slots.acquire()
+            try:
+                batch_future, pool = self._submit(analyze_texts, [text for texts, _ in batch for text in texts])
+            except Exception as e:
+                self._batch_slots.release()
+                for _, future in batch:
+                    _settle(future, exception=e)
+                continue
+            with self._lock:
+                self._batches += 1
+                self._batched_texts += size
+            batch_future.add_done_callback(lambda done, batch=batch, pool=pool: self._finish_batch(batch, done, pool))
+
+    def _finish_batch(self, batch, batch_future, pool):
+        self._batch_slots.release()
+        try:
+            results = batch_future.result()
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                self._discard_pool(pool)
+            for _, future in batch:
+                _settle(future, exception=e)
+            return
+        start = 0
+        for texts, future in batch:
+            _settle(future, result=results[start:start + len(texts)])
+            start += len(texts)
+
+    def health(self):
+        with self._lock:
+            pool_ready = self._pool is not None
+        return HTTPStatus.OK, {'status': 'ok', 'workers': self.workers, 'pool_ready': pool_ready,
+                               'uptime_s': round(time.time() - self.started, 1)}
+
+    def metrics(self):
+        with self._lock:
+            counters = {'extracting': self._extracting, 'rejected': self._rejected,
+                        'batches': self._batches, 'batched_texts': self._batched_texts}
+            jobs = self._jobs
+        latency = {name[len('http.'):]: summary for name, summary in perf.stage_summary().items()
+                   if name.startswith('http.')}
+        return HTTPStatus.OK, {
+            'queue': {
+                'extract_in_flight': counters['extracting'],
+                'extract_capacity': self.workers + self.queue_size,
+                'analyze_waiting': self._analyze_queue.qsize(),
+                'analyze_capacity': self.queue_size,
+                'jobs_active': jobs.active_count() if jobs is not None else 0,
+            },
+            'rejected': counters['rejected'],
+            'latency_ms': latency,
+            'batching': {
+                'batches': counters['batches'],
+                'texts': counters['batched_texts'],
+                'mean_batch_size': counters['batched_texts'] / counters['batches'] if counters['batches'] else 0.0,
+            },
+            'ocr_cache': get_ocr_cache().stats(),
+            'uptime_s': round(time.time() - self.started, 1),
+        }
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """Routes requests to the server's ExtractionService"""
+
+    server_version = "InvoiceExtraction/1.0"
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; without TCP_NODELAY the
+    # second waits for the client's delayed ACK on kept-alive connections
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+    def _handle(self, method):
+        start = time.perf_counter()
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        service = self.server.service
+        endpoint = url.path.strip('/').split('/')[0] or 'root'
+        headers = {}
+        try:
+            body = self._read_body()
+            if method == 'POST' and url.path == '/extract':
+                status, payload = service.extract(body, self.headers.get('Content-Type', '').split(';')[0], query)
+            elif method == 'POST' and url.path == '/analyze':
+                status, payload = service.analyze(body)
+            elif method in ('GET', 'DELETE') and endpoint == 'jobs' and url.path.count('/') == 2:
+                job_id = url.path.rsplit('/', 1)[1]
+                if not job_id.isdigit():
+                    raise ServiceError(HTTPStatus.NOT_FOUND, f"No job {job_id}")
+                status, payload = service.job(int(job_id), cancel=method == 'DELETE')
+            elif method == 'GET' and url.path == '/healthz':
+                status, payload = service.health()
+            elif method == 'GET' and url.path == '/metrics':
+                status, payload = service.metrics()
+            else:
+                endpoint = 'unknown'
+                raise ServiceError(HTTPStatus.NOT_FOUND, f"No endpoint {method} {url.path}")
+        except ServiceError as e:
+            status, payload = e.status, {'error': e.message}
+            if e.status == HTTPStatus.SERVICE_UNAVAILABLE:
+                headers['Retry-After'] = str(RETRY_AFTER_SECONDS)
+        except Exception as e:
+            logger.exception("Error handling %s %s", method, self.path)
+            status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': str(e)}
+
+        self._send(status, payload, headers)
+        perf.record(f"http.{endpoint}", time.perf_counter() - start)
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MAX_BODY_BYTES:
+            # The body is not read, so the connection cannot be reused
+            self.close_connection = True
+            raise ServiceError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"Body larger than {MAX_BODY_BYTES} bytes")
+        return self.rfile.read(length) if length else b''
+
+    def _send(self, status, payload, headers):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+def create_server(host='127.0.0.1', port=8080, workers=None, queue_size=DEFAULT_QUEUE_SIZE,
+                  jobs_path=DEFAULT_JOBS_PATH):
+    """
+    Start the worker pool and bind the HTTP server (port 0 picks a free
+    port). Call serve_forever() on the result, then server_close() and
+    server.service.close() when done.
+    """
+    server = ThreadingHTTPServer((host, port), ServiceHandler)
+    server.daemon_threads = True
+    server.service = ExtractionService(workers, queue_size, jobs_path)
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='invoice-service', description="Local invoice extraction HTTP service")
+    parser.add_argument('--host', default='127.0.0.1', help="Address to listen on")
+    parser.add_argument('--port', type=int, default=8080, help="Port to listen on (0 picks a free one)")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE,
+                        help="Requests accepted beyond the running ones before answering 503")
+    parser.add_argument('--jobs-db', default=DEFAULT_JOBS_PATH, help="Job queue for asynchronous extraction")
+    parser.add_argument('--verbose', '-v', action='store_true', help="Log every request")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING,
+                        format="%(levelname)s %(name)s: %(message)s")
+    server = create_server(args.host, args.port, args.workers, args.queue_size, args.jobs_db)
+    host, port = server.server_address[:2]
+    print(f"Serving on http://{host}:{port} with {server.service.workers} workers", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
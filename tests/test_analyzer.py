@@ -0,0 +1,94 @@
+import pytest
+
+from analyzer import InvoiceAnalyzer, _required_literal
+
+
+def test_required_literal_skips_optional_keywords():
+    assert _required_literal(r'total\s*:?\s*\$?([0-9,]+\.?\d{0,2})') == 'total'
+    assert _required_literal(r'#\s*([A-Z0-9\-]+)') == '#'
+    assert _required_literal(r'totals?\s*:\s*([0-9.]+)') is None
+    assert _required_literal(r'amount|total\s*:\s*([0-9.]+)') is None
+    assert _required_literal(r'(?:amount|total)\s*:\s*([0-9.]+)') is None
+    assert _required_literal(r'total[|]\s*([0-9.]+)') == 'total'
+
+
+def test_custom_patterns_are_not_prefiltered_away():
+    analyzer = InvoiceAnalyzer()
+    analyzer.patterns['total_amount'] = [r'totals?\s*:?\s*\$?([0-9,]+\.?\d{0,2})',
+                                         r'balance|amount\s*due\s*:?\s*\$?([0-9,]+\.?\d{0,2})']
+    analyzer.refresh_patterns()
+    assert analyzer._extract_total_amount("Total: $5.00") == 5.0
+
+
+def test_list_insights_match_the_store():
+    import random
+
+    from invoice_store import InvoiceStore
+    from sample_data import generate_random_invoice, get_sample_data
+
+    random.seed(3)
+    invoices = get_sample_data() + [generate_random_invoice() for _ in range(200)]
+    store = InvoiceStore(':memory:')
+    store.add_invoices(invoices)
+    assert store.duplicate_count() == 0
+    analyzer = InvoiceAnalyzer()
+    assert analyzer.suggest_cost_savings(invoices) == store.cost_saving_suggestions()
+    list_insights, store_insights = analyzer.get_spending_insights(invoices), store.spending_insights()
+    assert list_insights['amount_quantiles'] == store_insights['amount_quantiles']
+    assert list_insights['top_vendor'] == store_insights['top_vendor']
+    assert list_insights['total_spending'] == pytest.approx(store_insights['total_spending'])
+
+
+def _batch_texts(count):
+    import random
+
+    from sample_data import generate_random_invoice, get_sample_data
+
+    random.seed(5)
+    texts = [invoice['extracted_text'] for invoice in get_sample_data()]
+    texts += [generate_random_invoice()['extracted_text'] for _ in range(count - len(texts))]
+    # Text with no fields, and no text at all
+    return texts + ['Nothing to see here', '']
+
+
+@pytest.fixture(scope='module')
+def batch():
+    from analyzer import SERIAL_BATCH_THRESHOLD
+
+    texts = _batch_texts(SERIAL_BATCH_THRESHOLD + 100)
+    analyzer = InvoiceAnalyzer()
+    return texts, [analyzer.analyze_invoice_text(text) for text in texts]
+
+
+def test_analyze_many_matches_sequential_analysis(batch):
+    texts, expected = batch
+    assert list(InvoiceAnalyzer().analyze_many(texts, workers=2, chunksize=16)) == expected
+
+
+def test_analyze_many_unordered_yields_every_index_once(batch):
+    texts, expected = batch
+    results = list(InvoiceAnalyzer().analyze_many(iter(texts), workers=2, chunksize=16, ordered=False))
+    assert sorted(index for index, _ in results) == list(range(len(texts)))
+    assert [invoice_data for _, invoice_data in sorted(results, key=lambda result: result[0])] == expected
+
+
+def test_analyze_many_small_batches_run_in_process(batch, monkeypatch):
+    import concurrent.futures
+
+    def no_pool(*args, **kwargs):
+        raise AssertionError("started a pool")
+
+    monkeypatch.setattr(concurrent.futures, 'ProcessPoolExecutor', no_pool)
+    texts, expected = batch
+    assert list(InvoiceAnalyzer().analyze_many(texts[:10], workers=4)) == expected[:10]
+    assert list(InvoiceAnalyzer().analyze_many(texts, workers=1)) == expected
+
+
+def test_analyze_many_workers_use_the_configured_analyzer(batch):
+    texts, _ = batch
+    analyzer = InvoiceAnalyzer()
+    analyzer.add_category_keyword('Custom', 'invoice', weight=100)
+    expected = [analyzer.analyze_invoice_text(text) for text in texts]
+    results = list(analyzer.analyze_many(texts, workers=2))
+    assert results == expected
+    assert sum(invoice_data['category'] == 'Custom' for invoice_data in results) > len(texts) // 2
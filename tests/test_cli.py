@@ -0,0 +1,36 @@
+import json
+
+import cli
+from invoice_store import InvoiceStore
+from sample_data import get_sample_data, render_invoice_pdf
+
+
+class RejectingStore(InvoiceStore):
+    """Store that refuses the invoice read from one file"""
+
+    def add_invoice(self, invoice_data):
+        if invoice_data['filename'] == '0.pdf':
+            raise ValueError("constraint failed")
+        return super().add_invoice(invoice_data)
+
+
+def test_a_rejected_invoice_fails_only_its_file(tmp_path, monkeypatch, capfd):
+    monkeypatch.setenv('INVOICE_OCR_CACHE_DIR', str(tmp_path / 'cache'))
+    inputs = tmp_path / 'inputs'
+    inputs.mkdir()
+    for index, invoice in enumerate(get_sample_data()[:3]):
+        (inputs / f"{index}.pdf").write_bytes(render_invoice_pdf(invoice))
+    monkeypatch.setattr(cli, 'InvoiceStore', RejectingStore)
+    out = str(tmp_path / 'invoices.db')
+
+    assert cli.main(['run', str(inputs), '--out', out, '--workers', '1']) == 1
+
+    assert InvoiceStore(out).count() == 2
+    with open(f"{out}.manifest.jsonl", encoding='utf-8') as manifest:
+        entries = {json.loads(line)['path'].rsplit('/', 1)[-1]: json.loads(line) for line in manifest}
+    assert entries['0.pdf']['status'] == 'failed'
+    assert 'constraint failed' in entries['0.pdf']['error']
+    assert entries['1.pdf']['status'] == entries['2.pdf']['status'] == 'ok'
+    report = capfd.readouterr().out
+    assert "Processed 3 files (2 ok, 1 failed" in report
+    assert "extract" in report and "analyze" in report
@@ -0,0 +1,61 @@
+import random
+
+import pytest
+
+from analyzer import InvoiceAnalyzer
+from date_normalizer import DEFAULT_ORDER, DateNormalizer
+
+VENDORS = ['Acme Supplies Ltd', 'Northwind Traders', 'Globex Corporation']
+# Unambiguous dates in every supported layout, day first and month first
+DATES = ['25/03/2024', '03/25/2024', '2024-03-25', '31.12.2023', '12/31/23', 'March 5, 2024', '5th of May 2024',
+         '07/07/2024']
+# Ambiguous ones, read by the vendor's learned order
+AMBIGUOUS = ['03/04/2024', '11/02/2023']
+
+
+def _invoice(vendor, date_str):
+    return f"{vendor}\nInvoice Number: INV-1001\nDate: {date_str}\nTotal: $120.00"
+
+
+def test_unambiguous_dates_do_not_depend_on_order():
+    invoices = [(vendor, date_str) for vendor in VENDORS for date_str in DATES + AMBIGUOUS]
+    expected = {(vendor, date_str): InvoiceAnalyzer().analyze_invoice_text(_invoice(vendor, date_str))['date']
+                for vendor, date_str in invoices if date_str in DATES}
+    for seed in range(5):
+        random.Random(seed).shuffle(invoices)
+        analyzer = InvoiceAnalyzer()
+        dates = {invoice: analyzer.analyze_invoice_text(_invoice(*invoice))['date'] for invoice in invoices}
+        assert {invoice: dates[invoice] for invoice in expected} == expected
+
+
+@pytest.mark.parametrize('date_str, iso', [
+    ('25/03/2024', '2024-03-25'),
+    ('03/25/2024', '2024-03-25'),
+    ('2024-03-25', '2024-03-25'),
+    ('March 5, 2024', '2024-03-05'),
+    ('5th of May 2024', '2024-05-05'),
+])
+def test_unambiguous_dates_ignore_learned_orders(date_str, iso):
+    for learned in ('25/12/2023', '12/25/2023'):
+        normalizer = DateNormalizer()
+        for _ in range(3):
+            normalizer.normalize(learned, 'Acme Supplies Ltd')
+        assert normalizer.normalize(date_str, 'Acme Supplies Ltd') == iso
+
+
+def test_ambiguous_dates_follow_the_vendor_history():
+    normalizer = DateNormalizer()
+    assert normalizer.vendor_order('Acme Supplies Ltd') == DEFAULT_ORDER
+    assert normalizer.normalize('03/04/2024', 'Acme Supplies Ltd') == '2024-03-04'
+    for _ in range(2):
+        normalizer.normalize('25/12/2023', 'Acme Supplies Ltd')
+    assert normalizer.normalize('03/04/2024', 'Acme Supplies Ltd') == '2024-04-03'
+    # Other vendors keep the default
+    assert normalizer.normalize('03/04/2024', 'Globex Corporation') == '2024-03-04'
+
+
+def test_provisional_reads_learn_nothing():
+    normalizer = DateNormalizer()
+    for _ in range(3):
+        normalizer.normalize('25/12/2023', 'Acme Supplies Ltd', learn=False)
+    assert normalizer.vendor_order('Acme Supplies Ltd') == DEFAULT_ORDER
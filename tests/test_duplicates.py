@@ -0,0 +1,38 @@
+import zlib
+
+import numpy as np
+
+import duplicates
+
+
+def test_chunked_minhash_matches_a_single_pass(monkeypatch):
+    shingle_set = {f"s{index:05d}" for index in range(10_000)}
+    monkeypatch.setattr(duplicates, 'MINHASH_CHUNK', 1000)
+    a, b = duplicates._hash_family()
+    hashes = np.array([zlib.crc32(shingle.encode('utf-8')) for shingle in shingle_set], dtype=np.uint64)
+    expected = ((a * hashes + b) >> np.uint64(32)).min(axis=1)
+    assert np.array_equal(duplicates.minhash(shingle_set), expected)
+
+
+def test_rescans_share_a_band_and_different_texts_do_not():
+    text = "Office Depot Inc. Invoice OS-2024-001 Date 01/15/2024 Printer paper 89.95 Stapler 45.98 Total 245.67 " * 3
+    rescan = text.replace('Printer', 'Prlnter').replace('Stapler', 'Stap1er')
+    other = "City Electric Company Account 123456789 Electricity usage 2,456 kWh Total 487.23 thank you " * 3
+    keys = set(duplicates.lsh_keys(duplicates.minhash(duplicates.shingles(text))))
+    assert keys & set(duplicates.lsh_keys(duplicates.minhash(duplicates.shingles(rescan))))
+    assert not keys & set(duplicates.lsh_keys(duplicates.minhash(duplicates.shingles(other))))
+    assert duplicates.similarity(duplicates.shingles(text), duplicates.shingles(rescan)) >= \
+        duplicates.NEAR_DUPLICATE_SIMILARITY
+
+
+
+def test_exact_key_needs_an_invoice_number():
+    invoice = {'vendor': 'Acme', 'invoice_number': 'INV-1', 'total_amount': 10, 'date': '2024-01-01'}
+    assert duplicates.exact_key(invoice) == duplicates.exact_key({**invoice, 'vendor': 'ACME', 'total_amount': 10.0})
+    assert duplicates.exact_key({**invoice, 'invoice_number': 'Not found'}) is None
+
+
+def test_missing_invoice_numbers_do_not_agree():
+    invoice = {'invoice_number': 'Not found', 'total_amount': 10.0}
+    assert not duplicates.fields_agree(invoice, {'invoice_number': 'Not found', 'total_amount': 12.0})
+    assert duplicates.fields_agree(invoice, {'invoice_number': 'INV-2', 'total_amount': 10.0})
@@ -0,0 +1,276 @@
+import sqlite3
+
+import pytest
+
+from invoice_store import _AGGREGATES, _SCHEMA_VERSION, TEXT_COLUMN, InvoiceStore, compress_text, decompress_text
+
+# The invoices table as the first SQLite store created it: no aggregates,
+# raw text inline, no canonical vendors or duplicate links
+_FIRST_SCHEMA = """
+CREATE TABLE invoices (
+    id INTEGER PRIMARY KEY,
+    filename TEXT,
+    invoice_number TEXT,
+    date TEXT,
+    vendor TEXT,
+    category TEXT,
+    total_amount REAL NOT NULL DEFAULT 0,
+    tax_amount REAL NOT NULL DEFAULT 0,
+    confidence REAL,
+    processed_date TEXT,
+    extracted_text TEXT
+);
+CREATE TABLE line_items (
+    id INTEGER PRIMARY KEY,
+    invoice_id INTEGER NOT NULL REFERENCES invoices (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    description TEXT,
+    quantity REAL,
+    amount REAL,
+    unit_price REAL
+);
+"""
+
+
+def _invoice(number, vendor='Office Depot Inc.', total=100.0, date='2024-03-05', category='Office Supplies',
+             text=None, **fields):
+    return {
+        'filename': f'{number}.pdf', 'invoice_number': number, 'date': date, 'vendor': vendor,
+        'category': category, 'total_amount': total, 'tax_amount': round(total * 0.08, 2), 'confidence': 90.0,
+        'processed_date': '2024-03-06 10:00:00',
+        'items': [{'description': 'Paper', 'quantity': 2, 'amount': total, 'unit_price': total / 2}],
+        'extracted_text': text if text is not None else f"{vendor}\nInvoice: {number}\nTotal: ${total:.2f}",
+        **fields,
+    }
+
+
+def _first_store(path, invoices):
+    conn = sqlite3.connect(path)
+    conn.executescript(_FIRST_SCHEMA)
+    for invoice in invoices:
+        invoice_id = conn.execute(
+            "INSERT INTO invoices (filename, invoice_number, date, vendor, category, total_amount, tax_amount, "
+            "confidence, processed_date, extracted_text) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [invoice[column] for column in ('filename', 'invoice_number', 'date', 'vendor', 'category',
+                                            'total_amount', 'tax_amount', 'confidence', 'processed_date',
+                                            'extracted_text')]
+        ).lastrowid
+        for position, item in enumerate(invoice['items']):
+            conn.execute(
+                "INSERT INTO line_items (invoice_id, position, description, quantity, amount, unit_price) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (invoice_id, position, item['description'], item['quantity'], item['amount'], item['unit_price'])
+            )
+    conn.commit()
+    conn.close()
+
+
+def _user_version(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_round_trip(tmp_path):
+    store = InvoiceStore(str(tmp_path / 'invoices.db'))
+    invoice_id = store.add_invoice(_invoice('INV-1'))
+    frame = store.query_invoices()
+    assert frame['invoice_number'].tolist() == ['INV-1']
+    assert frame['vendor'].tolist() == ['Office Depot Inc.']
+    assert frame['total_amount'].tolist() == [100.0]
+    assert store.get_line_items(invoice_id) == [
+        {'description': 'Paper', 'quantity': 2.0, 'amount': 100.0, 'unit_price': 50.0}]
+    assert _user_version(store.path) == _SCHEMA_VERSION
+
+
+def test_migrates_the_first_store_layout(tmp_path):
+    path = str(tmp_path / 'invoices.db')
+    invoices = [
+        _invoice('INV-1', total=100.0),
+        _invoice('INV-2', vendor='Office Dep0t Inc', total=250.0, date='2024-04-01'),
+        _invoice('INV-3', vendor='Grand Plaza Hotel', total=480.0, category='Travel'),
+        # The same file processed twice
+        _invoice('INV-1', total=100.0),
+    ]
+    _first_store(path, invoices)
+
+    store = InvoiceStore(path)
+    assert _user_version(path) == _SCHEMA_VERSION
+    columns = {row[1] for row in store._conn.execute("PRAGMA table_info(invoices)")}
+    assert 'extracted_text' not in columns
+    assert {'amount_bucket', 'canonical_vendor', 'text_digest', 'duplicate_of'} <= columns
+
+    frame = store.query_invoices(['id', 'canonical_vendor', 'duplicate_of'])
+    assert frame.sort_values('id')['canonical_vendor'].tolist() == [
+        'Office Depot Inc.', 'Office Depot Inc.', 'Grand Plaza Hotel', 'Office Depot Inc.']
+    assert store.duplicate_count() == 1
+    assert store.get_duplicate_of(4) == 1
+    assert store.summary()['count'] == 3
+    assert store.summary()['total_amount'] == 830.0
+    totals = store.totals_by('vendor')
+    assert dict(zip(totals['vendor'], totals['count'])) == {'Office Depot Inc.': 2, 'Grand Plaza Hotel': 1}
+    assert [store.get_extracted_text(invoice_id) for invoice_id in (1, 2, 3, 4)] == [
+        invoice['extracted_text'] for invoice in invoices]
+    assert store.get_line_items(3)[0]['amount'] == 480.0
+
+
+def test_migrated_store_reopens_unchanged(tmp_path):
+    path = str(tmp_path / 'invoices.db')
+    _first_store(path, [_invoice('INV-1'), _invoice('INV-2', vendor='Grand Plaza Hotel', total=50.0)])
+    InvoiceStore(path)
+    store = InvoiceStore(path)
+    assert store.summary()['count'] == 2
+    assert store.totals_by('vendor')['vendor'].tolist() == ['Office Depot Inc.', 'Grand Plaza Hotel']
+    assert _user_version(path) == _SCHEMA_VERSION
+
+
+@pytest.mark.parametrize('version', range(1, _SCHEMA_VERSION))
+def test_outdated_aggregates_are_rebuilt(tmp_path, version):
+    path = str(tmp_path / 'invoices.db')
+    store = InvoiceStore(path)
+    store.add_invoices([_invoice('INV-1'), _invoice('INV-2', total=50.0)])
+    # An older version's aggregates, possibly defined differently
+    store._conn.execute("DELETE FROM invoice_totals")
+    store._conn.execute(f"PRAGMA user_version = {version}")
+
+    reopened = InvoiceStore(path)
+    assert reopened.summary()['count'] == 2
+    assert reopened.summary()['total_amount'] == 150.0
+    assert _user_version(path) == _SCHEMA_VERSION
+
+
+def _aggregates(store):
+    return {table: {key: (count, round(total, 6), round(tax, 6)) for key, count, total, tax in
+                    store._execute(f"SELECT * FROM {table}")}
+            for table in _AGGREGATES}
+
+
+def _assert_aggregates_match_a_rebuild(store):
+    incremental = _aggregates(store)
+    store.rebuild_aggregates()
+    assert incremental == _aggregates(store)
+
+
+def test_aggregates_follow_every_write(tmp_path):
+    store = InvoiceStore(str(tmp_path / 'invoices.db'))
+    ids = store.add_invoices([
+        _invoice('INV-1', total=100.0),
+        _invoice('INV-2', vendor='Grand Plaza Hotel', total=480.0, category='Travel', date='2024-04-02'),
+        _invoice('INV-3', vendor='Office Dep0t Inc', total=35.5, date='Not found'),
+        _invoice('INV-4', vendor='City Electric Company', total=0.0, category='Utilities'),
+    ])
+    _assert_aggregates_match_a_rebuild(store)
+    assert store.summary() == {'count': 4, 'total_amount': 615.5, 'average_amount': 615.5 / 4,
+                               'total_tax': pytest.approx(49.24)}
+    months = store.totals_by('month')
+    assert dict(zip(months['month'], months['total_amount'])) == {'2024-03': 100.0, '2024-04': 480.0}
+
+    store._conn.execute("UPDATE invoices SET category = 'Equipment', total_amount = 120.0 WHERE id = ?", (ids[0],))
+    _assert_aggregates_match_a_rebuild(store)
+    store.delete_invoice(ids[1])
+    _assert_aggregates_match_a_rebuild(store)
+    categories = store.totals_by('category')
+    assert 'Travel' not in categories['category'].tolist()
+    assert store.summary()['count'] == 3
+
+
+def test_duplicates_stay_out_of_the_aggregates(tmp_path):
+    store = InvoiceStore(str(tmp_path / 'invoices.db'))
+    original = store.add_invoice(_invoice('INV-1', total=100.0))
+    duplicate = store.add_invoice(_invoice('INV-1', total=100.0))
+    later = store.add_invoice(_invoice('INV-1', total=100.0))
+    assert store.get_duplicate_of(duplicate) == original
+    assert store.summary()['count'] == 1
+    _assert_aggregates_match_a_rebuild(store)
+
+    # The oldest duplicate takes over as the original, and is counted instead
+    store.delete_invoice(original)
+    assert store.get_duplicate_of(duplicate) is None
+    assert store.get_duplicate_of(later) == duplicate
+    assert store.summary()['count'] == 1
+    _assert_aggregates_match_a_rebuild(store)
+
+
+def test_aggregates_are_shared_between_connections(tmp_path):
+    path = str(tmp_path / 'invoices.db')
+    store, other = InvoiceStore(path), InvoiceStore(path)
+    store.add_invoice(_invoice('INV-1', total=100.0))
+    assert other.spending_insights()['total_spending'] == 100.0
+    store.add_invoice(_invoice('INV-2', vendor='Grand Plaza Hotel', total=300.0, category='Travel'))
+    # Memoized insights are dropped once another connection writes
+    assert other.spending_insights()['total_spending'] == 400.0
+    assert other.spending_insights()['top_category'] == 'Travel'
+
+
+def test_clear_empties_the_aggregates(tmp_path):
+    store = InvoiceStore(str(tmp_path / 'invoices.db'))
+    store.add_invoices([_invoice('INV-1'), _invoice('INV-2', vendor='Grand Plaza Hotel')])
+    store.clear()
+    assert all(not rows for rows in _aggregates(store).values())
+    assert store.summary()['count'] == 0
+    assert store.spending_insights() == {}
+    assert store.cost_saving_suggestions() == []
+
+
+@pytest.mark.parametrize('text', [
+    "Office Depot Inc.\nInvoice: INV-1\nTotal: $100.00",
+    "Café Müller GmbH\nRechnung № 42\nSumme: 12,50 €\n日本語のテキスト",
+    "",
+    "line\n" * 20000,
+])
+def test_compress_text_round_trip(text):
+    digest, data = compress_text(text)
+    assert decompress_text(data) == text
+    assert digest == compress_text(text)[0]
+    assert decompress_text(None) is None
+
+
+def test_raw_texts_are_compressed_and_loaded_on_request(tmp_path):
+    store = InvoiceStore(str(tmp_path / 'invoices.db'))
+    text = "Office Depot Inc.\nInvoice: INV-1\n" + "Paper 2 x $50.00\n" * 500 + "Total: $100.00"
+    invoice_id = store.add_invoice(_invoice('INV-1', text=text))
+    without_text = store.add_invoice(_invoice('INV-2', text=''))
+
+    size, stored = store._execute("SELECT size, length(data) FROM raw_texts")[0]
+    assert size == len(text)
+    assert stored < len(text) / 10
+    assert TEXT_COLUMN not in store.query_invoices().columns
+    assert store.get_extracted_text(invoice_id) == text
+    assert store.get_extracted_text(without_text) is None
+
+    frame = next(store.iter_invoices(['invoice_number'], include_text=True))
+    assert frame[TEXT_COLUMN].iloc[0] == text
+    assert frame[TEXT_COLUMN].isna().iloc[1]
+
+
+def test_identical_texts_are_stored_once(tmp_path):
+    store = InvoiceStore(str(tmp_path / 'invoices.db'))
+    text = "Office Depot Inc.\nInvoice: INV-1\nTotal: $100.00"
+    first = store.add_invoice(_invoice('INV-1', text=text))
+    second = store.add_invoice(_invoice('INV-1', text=text))
+    assert store._execute("SELECT COUNT(*) FROM raw_texts")[0][0] == 1
+
+    # The text goes with the last invoice that refers to it
+    store.delete_invoice(first)
+    assert store.get_extracted_text(second) == text
+    store.delete_invoice(second)
+    assert store._execute("SELECT COUNT(*) FROM raw_texts")[0][0] == 0
+
+
+def test_vendors_of_a_rolled_back_batch_are_not_registered(tmp_path):
+    store = InvoiceStore(str(tmp_path / 'invoices.db'))
+    store.add_invoice(_invoice('INV-1'))
+    unreadable = dict(_invoice('INV-3'), total_amount='n/a')
+    with pytest.raises(TypeError):
+        store.add_invoices([_invoice('INV-2', vendor='Acme Widgets Ltd'), unreadable])
+    assert store._vendors.names() == ['Office Depot Inc.']
+    assert store._execute("SELECT name FROM vendors") == [('Office Depot Inc.',)]
+
+    # Variants within one batch still share the vendor that batch introduces
+    store.add_invoices([_invoice('INV-4', vendor='Acme Widgets Ltd'), _invoice('INV-5', vendor='Acme Widgts Ltd')])
+    assert store._vendors.names() == ['Office Depot Inc.', 'Acme Widgets Ltd']
+    assert store._execute("SELECT name FROM vendors ORDER BY id") == [('Office Depot Inc.',), ('Acme Widgets Ltd',)]
+    assert store.query_invoices(['canonical_vendor'])['canonical_vendor'].tolist() == [
+        'Acme Widgets Ltd', 'Acme Widgets Ltd', 'Office Depot Inc.']
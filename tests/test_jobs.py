@@ -0,0 +1,47 @@
+import time
+
+import jobs
+from invoice_store import InvoiceStore
+from sample_data import get_sample_data, render_invoice_pdf
+
+
+class FailingStore(InvoiceStore):
+    def add_invoice(self, invoice_data):
+        raise RuntimeError("disk full")
+
+
+def _wait_for(queue, job_id, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.status(job_id)
+        if job['status'] in jobs.FINAL_STATES:
+            return job
+        time.sleep(0.1)
+    raise AssertionError(f"job {job_id} still {job['status']}")
+
+
+def test_failed_store_write_fails_the_job(tmp_path, monkeypatch):
+    monkeypatch.setenv('INVOICE_OCR_CACHE_DIR', str(tmp_path / 'cache'))
+    queue = jobs.JobQueue(path=str(tmp_path / 'jobs.db'), store=FailingStore(str(tmp_path / 'invoices.db')), workers=1)
+    try:
+        job_id = queue.submit(render_invoice_pdf(get_sample_data()[0]), 'invoice.pdf', 'application/pdf')
+        job = _wait_for(queue, job_id)
+    finally:
+        queue.close()
+    assert job['status'] == jobs.FAILED
+    assert 'disk full' in job['error']
+
+
+def test_failed_submit_fails_the_job(tmp_path, monkeypatch):
+    def broken_pool():
+        raise OSError("cannot start worker")
+
+    queue = jobs.JobQueue(path=str(tmp_path / 'jobs.db'), store=InvoiceStore(str(tmp_path / 'invoices.db')), workers=1)
+    monkeypatch.setattr(queue, '_get_pool', broken_pool)
+    try:
+        job_id = queue.submit(b'%PDF', 'invoice.pdf', 'application/pdf')
+        job = _wait_for(queue, job_id)
+    finally:
+        queue.close()
+    assert job['status'] == jobs.FAILED
+    assert 'cannot start worker' in job['error']
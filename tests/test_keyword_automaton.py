@@ -0,0 +1,70 @@
+import pytest
+
+from analyzer import InvoiceAnalyzer
+from keyword_automaton import KeywordAutomaton
+
+KEYWORDS = {
+    'Services': ['service', 'consulting', ('maintenance', 2)],
+    'Technology': ['software', 'IT', 'cloud hosting'],
+    'Office Supplies': ['paper', 'toner', 'service'],
+}
+
+
+@pytest.fixture(scope='module')
+def automaton():
+    return KeywordAutomaton(KEYWORDS)
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('Monthly service fee', {'Services': 1, 'Office Supplies': 1}),
+    # Plural endings are part of the word
+    ('Cleaning services', {'Services': 1, 'Office Supplies': 1}),
+    ('Glasses and boxes of paper', {'Office Supplies': 1}),
+    # A keyword inside a longer word does not count
+    ('Serviceable parts', {}),
+    ('Newspaper subscription', {}),
+    ('Papers, papered walls', {'Office Supplies': 1}),
+    # Phrases must match whole, across their space
+    ('Cloud hosting, annual', {'Technology': 1}),
+    ('Cloud storage hosting', {}),
+    # Punctuation and line ends are boundaries
+    ('Toner.', {'Office Supplies': 1}),
+    ('paper\ntoner', {'Office Supplies': 2}),
+])
+def test_word_boundaries(automaton, text, expected):
+    assert automaton.score(text) == expected
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('CONSULTING AND MAINTENANCE', {'Services': 3}),
+    ('Consulting and Maintenance', {'Services': 3}),
+    # Keywords with capitals keep their case
+    ('IT support', {'Technology': 1}),
+    ('it support', {}),
+    ('It support', {}),
+    ('Software for IT', {'Technology': 2}),
+])
+def test_case_handling(automaton, text, expected):
+    assert automaton.score(text) == expected
+
+
+def test_repeated_keywords_count_once(automaton):
+    assert automaton.score('service service service') == {'Services': 1, 'Office Supplies': 1}
+
+
+def test_overlapping_keywords():
+    automaton = KeywordAutomaton({'A': ['office supplies'], 'B': ['supplies', 'office'], 'C': ['ice']})
+    assert automaton.score('Office supplies') == {'A': 1, 'B': 2}
+
+
+def test_substring_matching_without_word_boundaries():
+    automaton = KeywordAutomaton(KEYWORDS, word_boundary=False)
+    assert automaton.score('Newspaper') == {'Office Supplies': 1}
+
+
+def test_analyzer_category():
+    analyzer = InvoiceAnalyzer()
+    assert analyzer._categorize_invoice('Hotel accommodation, 2 nights') == 'Travel'
+    assert analyzer._categorize_invoice('Nothing to see here') == 'Uncategorized'
+    analyzer.add_category_keyword('Pets', 'dog food', weight=10)
+    assert analyzer._categorize_invoice('Dog food and hotel') == 'Pets'
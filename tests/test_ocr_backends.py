@@ -0,0 +1,42 @@
+import threading
+import types
+
+import pytest
+
+import ocr_backends
+
+
+class FakeEngine:
+    def __init__(self, lang, oem):
+        self.variables = {}
+
+    def SetVariable(self, name, value):
+        self.variables[name] = value
+
+
+def fake_tesserocr(engine):
+    return types.SimpleNamespace(PyTessBaseAPI=engine, OEM=types.SimpleNamespace(DEFAULT=3))
+
+
+def test_failed_engine_init_frees_its_pool_slot(monkeypatch):
+    def missing_language(lang, oem):
+        raise RuntimeError("Failed to init API, possibly an invalid tessdata path")
+
+    monkeypatch.setattr(ocr_backends, 'tesserocr', fake_tesserocr(missing_language))
+    backend = ocr_backends.TesserocrBackend(pool_size=1)
+    with pytest.raises(RuntimeError):
+        backend._acquire('--oem 1')
+
+    monkeypatch.setattr(ocr_backends, 'tesserocr', fake_tesserocr(FakeEngine))
+    acquired = []
+    # With the slot still counted as taken this would wait forever
+    retry = threading.Thread(target=lambda: acquired.append(backend._acquire('--oem 1')), daemon=True)
+    retry.start()
+    retry.join(timeout=5)
+    assert not retry.is_alive()
+    assert isinstance(acquired[-1], FakeEngine)
+
+
+def test_parse_tesseract_config():
+    assert ocr_backends.parse_tesseract_config("--oem 1 --psm 6 -c preserve_interword_spaces=1") == (
+        1, 6, {'preserve_interword_spaces': '1'})
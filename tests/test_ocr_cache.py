@@ -0,0 +1,138 @@
+import json
+import sqlite3
+
+import pytest
+
+from ocr_cache import OCRCache, content_digest
+
+# Each value below is stored as 100 bytes of JSON
+ENTRY_BYTES = 100
+
+
+def _value(index):
+    return {'text': f"{index:0{ENTRY_BYTES - 12}d}"}
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return OCRCache(path=str(tmp_path / 'cache.sqlite3'), max_bytes=5 * ENTRY_BYTES)
+
+
+def test_value_size():
+    assert len(json.dumps(_value(0)).encode('utf-8')) == ENTRY_BYTES
+
+
+def test_hits_and_misses(cache):
+    key = OCRCache.make_key('page', content_digest(b'scan'), '--psm 6')
+    assert cache.get(key) is None
+    cache.put(key, {'text': 'Invoice #1', 'pages': [1, 2]})
+    assert cache.get(key) == {'text': 'Invoice #1', 'pages': [1, 2]}
+    assert cache.get(key) == {'text': 'Invoice #1', 'pages': [1, 2]}
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (2, 1, 1)
+    assert stats['hit_rate'] == pytest.approx(2 / 3)
+
+
+def test_keys_depend_on_kind_content_and_config():
+    digest = content_digest(b'scan')
+    keys = {OCRCache.make_key('page', digest, '--psm 6'), OCRCache.make_key('text', digest, '--psm 6'),
+            OCRCache.make_key('page', content_digest(b'other'), '--psm 6'),
+            OCRCache.make_key('page', digest, '--psm 4')}
+    assert len(keys) == 4
+
+
+def test_entries_are_shared_between_connections(cache):
+    cache.put('key', _value(1))
+    other = OCRCache(path=cache.path, max_bytes=cache.max_bytes)
+    assert other.get('key') == _value(1)
+    assert cache.stats()['hits'] == 1
+
+
+def test_least_recently_used_entries_are_evicted(cache, monkeypatch):
+    now = iter(range(1000))
+    monkeypatch.setattr('ocr_cache.time.time', lambda: next(now))
+    for index in range(5):
+        cache.put(f'key{index}', _value(index))
+    # Reading key0 makes key1 the least recently used
+    assert cache.get('key0') == _value(0)
+    cache.put('key5', _value(5))
+    assert cache.get('key1') is None
+    assert all(cache.get(f'key{index}') == _value(index) for index in (0, 2, 3, 4, 5))
+    assert cache.stats()['evictions'] == 1
+
+
+def test_size_cap(cache):
+    for index in range(20):
+        cache.put(f'key{index}', _value(index))
+        assert cache.stats()['size_bytes'] <= cache.max_bytes
+    stats = cache.stats()
+    assert (stats['entries'], stats['size_bytes'], stats['evictions']) == (5, 5 * ENTRY_BYTES, 15)
+
+
+def test_replacing_an_entry_does_not_evict(cache):
+    for index in range(5):
+        cache.put(f'key{index}', _value(index))
+    cache.put('key0', _value(9))
+    stats = cache.stats()
+    assert (stats['entries'], stats['evictions']) == (5, 0)
+    assert cache.get('key0') == _value(9)
+
+
+def test_values_larger_than_the_cache_are_not_stored(cache):
+    cache.put('big', {'text': 'x' * cache.max_bytes})
+    assert cache.get('big') is None
+    assert cache.stats()['entries'] == 0
+
+
+def test_disabled_cache(tmp_path):
+    cache = OCRCache(path=str(tmp_path / 'cache.sqlite3'), max_bytes=0)
+    cache.put('key', _value(1))
+    assert cache.get('key') is None
+    assert cache.stats()['entries'] == 0
+
+
+def test_clear(cache):
+    cache.put('key', _value(1))
+    cache.get('key')
+    cache.clear()
+    stats = cache.stats()
+    assert (stats['entries'], stats['hits'], stats['misses']) == (0, 0, 0)
+
+
+def _summed_size(cache):
+    return cache._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+
+def test_running_size_matches_the_entries(cache):
+    for index in range(12):
+        cache.put(f'key{index % 7}', {'text': 'x' * (index * 17)})
+        assert cache.stats()['size_bytes'] == _summed_size(cache)
+    cache.clear()
+    assert cache.stats()['size_bytes'] == 0
+
+
+def test_running_size_is_shared_between_connections(cache):
+    other = OCRCache(path=cache.path, max_bytes=cache.max_bytes)
+    for index in range(4):
+        cache.put(f'key{index}', _value(index))
+        other.put(f'other{index}', _value(index))
+    assert cache.stats()['size_bytes'] == other.stats()['size_bytes'] == _summed_size(cache) == 5 * ENTRY_BYTES
+
+
+def test_caches_without_a_running_size_are_summed_once(cache):
+    for index in range(3):
+        cache.put(f'key{index}', _value(index))
+    cache._conn.execute("DELETE FROM counters WHERE name = 'bytes'")
+    reopened = OCRCache(path=cache.path, max_bytes=cache.max_bytes)
+    assert reopened.stats()['size_bytes'] == 3 * ENTRY_BYTES
+
+
+def test_failed_hit_update_is_rolled_back(cache):
+    cache.put('key', _value(1))
+    cache._conn.execute("CREATE TRIGGER fail_hits BEFORE UPDATE ON counters "
+                        "BEGIN SELECT RAISE(ABORT, 'counters are read-only'); END")
+    with pytest.raises(sqlite3.DatabaseError):
+        cache.get('key')
+    assert not cache._conn.in_transaction
+    cache._conn.execute("DROP TRIGGER fail_hits")
+    assert cache.get('key') == _value(1)
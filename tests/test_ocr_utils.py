@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+import ocr_utils
+from analyzer import InvoiceAnalyzer
+from ocr_cache import OCRCache
+
+
+@pytest.mark.parametrize('dtype', [np.int16, np.int32, np.int64, np.uint16, np.uint32, np.float32, np.float64])
+def test_8bit_values_in_wider_types_keep_their_levels(dtype):
+    gray = np.array([[0, 64, 128, 255]], dtype=dtype)
+    assert ocr_utils.load_grayscale(gray).tolist() == [[0, 64, 128, 255]]
+
+
+def test_16bit_values_are_rescaled():
+    gray = np.array([[0, 257 * 64, 257 * 128, 65535]], dtype=np.uint16)
+    assert ocr_utils.load_grayscale(gray).tolist() == [[0, 64, 128, 255]]
+    assert ocr_utils.load_grayscale(gray.astype(np.int64)).tolist() == [[0, 64, 128, 255]]
+
+
+def test_unit_floats_and_booleans_are_rescaled():
+    assert ocr_utils.load_grayscale(np.array([[0.0, 0.5, 1.0]])).tolist() == [[0, 127, 255]]
+    assert ocr_utils.load_grayscale(np.array([[False, True]])).tolist() == [[0, 255]]
+
+
+def test_wide_color_arrays():
+    rgb = np.full((2, 2, 3), 200, dtype=np.int64)
+    assert ocr_utils.load_grayscale(rgb).tolist() == [[200, 200], [200, 200]]
+
+
+def test_32bit_pil_images():
+    image = Image.fromarray(np.array([[0, 100, 255]], dtype=np.int32), 'I')
+    assert ocr_utils.load_grayscale(image).tolist() == [[0, 100, 255]]
+
+
+def test_uint8_arrays_are_not_copied():
+    gray = np.zeros((4, 4), dtype=np.uint8)
+    assert ocr_utils.load_grayscale(gray) is gray
+
+
+class _BlankBackend:
+    def image_to_data(self, image, config=''):
+        return {key: [] for key in ('level', 'page_num', 'block_num', 'par_num', 'line_num', 'word_num',
+                                    'left', 'top', 'width', 'height', 'conf', 'text')}
+
+
+def test_targeted_ocr_normalizes_the_page_once(tmp_path, monkeypatch):
+    cache = OCRCache(path=str(tmp_path / 'cache.sqlite3'))
+    monkeypatch.setattr(ocr_utils, 'get_ocr_cache', lambda: cache)
+    monkeypatch.setattr(ocr_utils, 'get_ocr_backend', _BlankBackend)
+    calls = []
+    normalize_resolution = ocr_utils.normalize_resolution
+
+    def counting(gray, *args, **kwargs):
+        calls.append(gray.shape)
+        return normalize_resolution(gray, *args, **kwargs)
+
+    monkeypatch.setattr(ocr_utils, 'normalize_resolution', counting)
+    page = np.full((1200, 900), 255, dtype=np.uint8)
+    page[100:110, 100:400] = 0
+    # No fields are found, so the body is read too
+    ocr_utils.extract_text_targeted(page, InvoiceAnalyzer())
+    assert calls == [(1200, 900)]
@@ -0,0 +1,46 @@
+import json
+import os
+import time
+from http import HTTPStatus
+
+import pytest
+
+import service
+
+
+def _crash(*args):
+    os._exit(1)
+
+
+def _slow(texts):
+    time.sleep(2)
+    return [{} for _ in texts]
+
+
+@pytest.fixture
+def extraction_service(tmp_path):
+    extraction = service.ExtractionService(workers=1, queue_size=2, jobs_path=str(tmp_path / 'jobs.db'))
+    yield extraction
+    extraction.close()
+
+
+def test_crashed_worker_answers_503_and_replaces_the_pool(extraction_service, monkeypatch):
+    crashed_pool = extraction_service._get_pool()
+    monkeypatch.setattr(service, 'extract_file', _crash)
+    with pytest.raises(service.ServiceError) as error:
+        extraction_service.extract(b'%PDF-1.4', 'application/pdf', {})
+    assert error.value.status == HTTPStatus.SERVICE_UNAVAILABLE
+
+    monkeypatch.undo()
+    assert extraction_service._get_pool() is not crashed_pool
+    status, result = extraction_service.analyze(json.dumps({'text': 'Invoice #1 Total: $10.00'}).encode())
+    assert status == HTTPStatus.OK
+    assert result['total_amount'] == 10.0
+
+
+def test_slow_analysis_answers_504(extraction_service, monkeypatch):
+    monkeypatch.setattr(service, 'analyze_texts', _slow)
+    monkeypatch.setattr(service, 'ANALYZE_TIMEOUT', 0.2)
+    with pytest.raises(service.ServiceError) as error:
+        extraction_service.analyze(json.dumps({'texts': ['Total: $1.00']}).encode())
+    assert error.value.status == HTTPStatus.GATEWAY_TIMEOUT
@@ -0,0 +1,19 @@
+import pytest
+
+from benchmarks import ANALYZER_INIT_BUDGET_MS, STARTUP_BUDGETS_MS, _import_time_ms
+
+# Best of a few fresh interpreters, so one slow start does not fail the suite
+RUNS = 3
+
+
+@pytest.mark.parametrize('module', sorted(STARTUP_BUDGETS_MS))
+def test_import_stays_within_budget_without_heavy_modules(module):
+    samples = [_import_time_ms(module) for _ in range(RUNS)]
+    assert min(import_ms for import_ms, _ in samples) <= STARTUP_BUDGETS_MS[module]
+    for _, probe in samples:
+        assert probe['heavy'] == []
+
+
+def test_first_analyzer_stays_within_budget():
+    init_ms = min(_import_time_ms('analyzer', 'analyzer.InvoiceAnalyzer()')[1]['init_ms'] for _ in range(RUNS))
+    assert init_ms <= ANALYZER_INIT_BUDGET_MS
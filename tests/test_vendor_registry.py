@@ -0,0 +1,65 @@
+import sqlite3
+
+import pytest
+
+from invoice_store import InvoiceStore
+from vendor_registry import VendorRegistry, vendor_key
+
+KNOWN = ['Office Depot Inc.', 'Studio 54 LLC', 'City Electric Company', 'TechSoft Solutions LLC']
+
+
+@pytest.fixture
+def registry():
+    return VendorRegistry(KNOWN)
+
+
+@pytest.mark.parametrize('spelling, canonical', [
+    ('OFFICE DEPOT, INC.', 'Office Depot Inc.'),
+    ('Office Dep0t Inc', 'Office Depot Inc.'),
+    ('Office Dcpot', 'Office Depot Inc.'),
+    ('The Office Depot', 'Office Depot Inc.'),
+    ('Office Depot Lnc', 'Office Depot Inc.'),
+    ('Studio 54', 'Studio 54 LLC'),
+    ('City Electrc Co', 'City Electric Company'),
+    ('Tech Soft Solutions', 'TechSoft Solutions LLC'),
+])
+def test_spellings_of_one_vendor_merge(registry, spelling, canonical):
+    assert registry.match(spelling) == canonical
+
+
+@pytest.mark.parametrize('vendor', [
+    'Office Depot Europe',
+    'Studio 55 LLC',
+    'Studio55 LLC',
+    'City Electric Co-op',
+    'Office Supplies Inc.',
+])
+def test_distinct_vendors_stay_apart(registry, vendor):
+    assert registry.match(vendor) is None
+    assert registry.add(vendor) == vendor
+    assert len(registry) == len(KNOWN) + 1
+
+
+def test_numbers_are_not_folded_into_letters():
+    assert vendor_key('Studio 54 LLC') == 'studio 54'
+    assert vendor_key('0ffice Dep0t') == 'office depot'
+
+
+def test_upgrade_splits_vendors_merged_by_older_rules(tmp_path):
+    path = str(tmp_path / 'invoices.db')
+    store = InvoiceStore(path)
+    store.add_invoices([
+        {'vendor': 'Studio 54 LLC', 'invoice_number': 'A-1', 'total_amount': 10.0, 'date': '2024-01-01'},
+        {'vendor': 'Studio 55 LLC', 'invoice_number': 'B-1', 'total_amount': 20.0, 'date': '2024-01-02'},
+    ])
+    # What a version 3 store with the old matching rules held
+    conn = sqlite3.connect(path)
+    conn.execute("UPDATE invoices SET canonical_vendor = 'Studio 54 LLC'")
+    conn.execute("DELETE FROM vendors WHERE name = 'Studio 55 LLC'")
+    conn.execute("PRAGMA user_version = 3")
+    conn.commit()
+    conn.close()
+
+    store = InvoiceStore(path)
+    vendors = store.totals_by('vendor').set_index('vendor')['total_amount'].to_dict()
+    assert vendors == {'Studio 54 LLC': 10.0, 'Studio 55 LLC': 20.0}
@@ -0,0 +1,210 @@
+"""
+Canonical vendor names.
+
+OCR gives the same vendor under many spellings ('Office Depot Inc.',
+'OFFICE DEPOT INC', 'Office Dep0t Inc'). The registry maps each extracted
+name to the first-registered spelling of the same vendor:
+
+- names are first reduced to a key (case, punctuation, commonly misread
+  characters and trailing legal suffixes folded), and equal keys match;
+- otherwise the vendor whose key's trigram set is most similar (Jaccard
+  similarity at least VENDOR_SIMILARITY) matches, provided the two keys
+  also agree word by word: the same words in the same order, each at most
+  a misread character or two apart, and numbers exactly equal. Trigrams
+  alone would merge 'Studio 55' into 'Studio 54' or 'Office Depot Europe'
+  into 'Office Depot'.
+
+Digits are only folded into the letters they are misread for inside words
+that also contain letters ('Dep0t'); standalone numbers are kept as they
+are.
+
+Trigrams are looked up in an inverted index. Only the posting lists of the
+query's rarest trigrams are read (prefix filtering: a vendor sharing none
+of them cannot reach the threshold), so a lookup touches a small part of
+the registry however many vendors it holds. Results are cached per
+extracted spelling; spellings that matched nothing are remembered until
+the next vendor is added.
+"""
+import math
+import re
+from collections import defaultdict
+
+# Minimum trigram Jaccard similarity between the keys of two spellings of
+# one vendor. Single misread, dropped or doubled characters in names of a
+# dozen characters stay above it
+VENDOR_SIMILARITY = 0.6
+# Edits allowed between corresponding words of two spellings: one, plus one
+# more for every this many characters of the longer word
+VENDOR_WORD_EDIT_CHARS = 8
+# Extracted spellings whose canonical vendor is remembered; the cache is
+# emptied when it fills up
+VENDOR_CACHE_SIZE = 10000
+
+# Values the analyzer uses when it found no vendor; never registered
+_MISSING = {'not found', 'unknown'}
+# Dropped from the end of a name, so 'Acme Co.' and 'ACME Company' agree
+_LEGAL_SUFFIXES = {
+    'co', 'company', 'corp', 'corporation', 'inc', 'incorporated', 'llc', 'llp', 'lp', 'ltd', 'limited',
+    'plc', 'gmbh', 'ag', 'sa', 'pty', 'pvt',
+}
+_SYMBOL_CONFUSABLES = str.maketrans({'|': 'l', '$': 's', '@': 'a'})
+_DIGIT_CONFUSABLES = str.maketrans({'0': 'o', '1': 'l', '5': 's', '8': 'b'})
+_NON_ALNUM = re.compile(r'[^0-9a-z]+')
+_NUMBER = re.compile(r'\d+')
+
+
+def vendor_key(name):
+    """Normalized form of a vendor name; '' for a missing one"""
+    folded = str(name or '').lower()
+    if folded.strip() in _MISSING:
+        return ''
+    words = [word if word.isdigit() else word.translate(_DIGIT_CONFUSABLES)
+             for word in _NON_ALNUM.sub(' ', folded.translate(_SYMBOL_CONFUSABLES)).split()]
+    if words and words[0] == 'the':
+        words = words[1:]
+    while len(words) > 1 and words[-1] in _LEGAL_SUFFIXES:
+        words.pop()
+    return ' '.join(words)
+
+
+def _edit_distance(a, b, limit):
+    # Levenshtein distance, or limit + 1 once it is known to exceed limit
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def same_words(key, other):
+    """
+    Whether two vendor keys agree word by word, allowing a few misread
+    characters within words but none in numbers. A misread legal suffix
+    left at the end of one key, and words split or joined by a misread
+    space, are tolerated.
+    """
+    words, other_words = key.split(), other.split()
+    if len(words) != len(other_words):
+        longer = words if len(words) > len(other_words) else other_words
+        if len(longer) - 1 == min(len(words), len(other_words)) and _misread_suffix(longer[-1]):
+            longer.pop()
+    if len(words) != len(other_words):
+        joined, other_joined = ''.join(words), ''.join(other_words)
+        return _NUMBER.findall(joined) == _NUMBER.findall(other_joined) and _close(joined, other_joined)
+    for word, other_word in zip(words, other_words):
+        if word == other_word:
+            continue
+        if word.isdigit() or other_word.isdigit() or not _close(word, other_word):
+            return False
+    return True
+
+
+def _close(word, other):
+    limit = 1 + max(len(word), len(other)) // VENDOR_WORD_EDIT_CHARS
+    return _edit_distance(word, other, limit) <= limit
+
+
+def _misread_suffix(word):
+    return not word.isdigit() and any(_edit_distance(word, suffix, 1) <= 1 for suffix in _LEGAL_SUFFIXES)
+
+
+def trigrams(key):
+    """Trigrams of a key, padded so word boundaries count"""
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class VendorRegistry:
+    """
+    In-memory registry of canonical vendors with a trigram index.
+
+    Not thread-safe; the invoice store serializes access with its lock.
+    """
+
+    def __init__(self, names=()):
+        self._names = []
+        self._keys = []
+        self._trigrams = []
+        self._by_key = {}
+        self._postings = defaultdict(list)
+        self._cache = {}
+        self._unmatched = set()
+        for name in names:
+            self.add(name)
+
+    def __len__(self):
+        return len(self._names)
+
+    def names(self):
+        """Canonical names in registration order"""
+        return list(self._names)
+
+    def match(self, name):
+        """The canonical vendor for an extracted name, or None if it is new or missing"""
+        canonical = self._cache.get(name)
+        if canonical is not None or name in self._unmatched:
+            return canonical
+        key = vendor_key(name)
+        index = self._by_key.get(key)
+        if index is None and key:
+            index = self._closest(key)
+        if len(self._cache) + len(self._unmatched) >= VENDOR_CACHE_SIZE:
+            self._cache.clear()
+            self._unmatched.clear()
+        if index is None:
+            self._unmatched.add(name)
+            return None
+        canonical = self._cache[name] = self._names[index]
+        return canonical
+
+    def add(self, name):
+        """
+        Register a vendor under this spelling unless it matches a known one.
+        Returns its canonical name, or None for a missing name.
+        """
+        canonical = self.match(name)
+        if canonical is not None:
+            return canonical
+        key = vendor_key(name)
+        if not key:
+            return None
+        canonical = ' '.join(str(name).split())
+        # The new vendor may be the match for names that had none
+        self._unmatched.clear()
+        index = len(self._names)
+        self._names.append(canonical)
+        self._keys.append(key)
+        self._by_key[key] = index
+        grams = trigrams(key)
+        self._trigrams.append(grams)
+        for gram in grams:
+            self._postings[gram].append(index)
+        return canonical
+
+    def _closest(self, key):
+        grams = trigrams(key)
+        # Any vendor with Jaccard >= VENDOR_SIMILARITY shares at least
+        # ceil(VENDOR_SIMILARITY * len(grams)) trigrams with the query, so
+        # it must share one of the len(grams) - that + 1 rarest ones
+        needed = math.ceil(VENDOR_SIMILARITY * len(grams))
+        rarest = sorted(grams, key=lambda gram: len(self._postings.get(gram, ())))[:len(grams) - needed + 1]
+        candidates = {index for gram in rarest for index in self._postings.get(gram, ())}
+        # ...and has between VENDOR_SIMILARITY and 1 / VENDOR_SIMILARITY times as many
+        low, high = VENDOR_SIMILARITY * len(grams), len(grams) / VENDOR_SIMILARITY
+        best, best_similarity = None, 0.0
+        for index in sorted(candidates):
+            other = self._trigrams[index]
+            if not low <= len(other) <= high:
+                continue
+            shared = len(grams & other)
+            similarity = shared / (len(grams) + len(other) - shared)
+            # Ties go to the earliest registered vendor
+            if similarity >= VENDOR_SIMILARITY and similarity > best_similarity and same_words(key, self._keys[index]):
+                best, best_similarity = index, similarity
+        return best